@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+
+import config
+from metrics import concurrency_metrics
+
+
+class Overloaded(Exception):
+    """
+    Raised when a call is shed because the backend is at capacity.
+    """
+
+
+class _Ticket:
+    def __init__(self):
+        self.granted = threading.Event()
+        self.granted_at = 0.0
+
+
+class AdmissionController:
+    """
+    Per-process concurrency limiter with a fair FIFO queue.
+
+    At most max_in_flight calls run at once. Further callers, from any
+    session, wait in arrival order; a caller is shed with Overloaded when
+    the queue is already max_queue long or when it has waited max_wait
+    seconds. While waiting, callers are told their queue position and an
+    estimated wait based on the recent average call duration.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = config.ADMISSION_MAX_IN_FLIGHT,
+        max_queue: int = config.ADMISSION_MAX_QUEUE,
+        max_wait: float = config.ADMISSION_MAX_WAIT_SECONDS,
+    ):
+        """
+        Initialize the AdmissionController.
+
+        Args:
+            max_in_flight (int): Maximum concurrent calls.
+            max_queue (int): Maximum waiting callers.
+            max_wait (float): Maximum seconds a caller waits for a slot.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._queue: Deque[_Ticket] = deque()
+        self._in_flight = 0
+        self._avg_seconds = 0.0
+        self._metrics = {
+            "admitted": 0,
+            "queued": 0,
+            "shed_queue_full": 0,
+            "shed_timeout": 0,
+            "cancelled": 0,
+            "queue_seconds_total": 0.0,
+        }
+
+    def acquire(
+        self,
+        cancel_event: Optional[threading.Event] = None,
+        on_wait: Optional[Callable[[int, float], None]] = None,
+    ) -> _Ticket:
+        """
+        Wait for a call slot.
+
+        Args:
+            cancel_event (Optional[threading.Event]): Abandons the wait when set.
+            on_wait (Optional[Callable[[int, float], None]]): Called every
+                config.INVOKE_POLL_SECONDS while queued, with the 1-based
+                queue position and the estimated seconds left.
+
+        Returns:
+            _Ticket: The granted slot, to be passed to release.
+
+        Raises:
+            Overloaded: If the queue is full or the wait exceeds max_wait.
+            CancelledError: If the cancel event is set while queued.
+        """
+        ticket = _Ticket()
+        start = time.monotonic()
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._queue:
+                self._grant(ticket)
+                concurrency_metrics.observe("queue_wait_ms", 0.0)
+                return ticket
+            if len(self._queue) >= self.max_queue:
+                self._metrics["shed_queue_full"] += 1
+                raise Overloaded(f"{len(self._queue)} calls already queued")
+            self._queue.append(ticket)
+            self._metrics["queued"] += 1
+
+        try:
+            while not ticket.granted.wait(config.INVOKE_POLL_SECONDS):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError()
+                if time.monotonic() - start >= self.max_wait:
+                    raise Overloaded(f"No call slot within {self.max_wait}s")
+                if on_wait is not None:
+                    on_wait(*self._position(ticket))
+        except BaseException as e:
+            with self._lock:
+                if isinstance(e, Overloaded):
+                    self._metrics["shed_timeout"] += 1
+                else:
+                    self._metrics["cancelled"] += 1
+                if ticket.granted.is_set():
+                    # Granted while giving up: hand the slot on
+                    self._release_locked(ticket)
+                else:
+                    self._queue.remove(ticket)
+            raise
+        waited = time.monotonic() - start
+        with self._lock:
+            self._metrics["queue_seconds_total"] += waited
+        concurrency_metrics.observe("queue_wait_ms", waited * 1000)
+        return ticket
+
+    def release(self, ticket: _Ticket) -> None:
+        """
+        Free a slot and grant it to the next caller in the queue.
+
+        Args:
+            ticket (_Ticket): Ticket returned by acquire.
+        """
+        with self._lock:
+            self._release_locked(ticket)
+
+    @contextmanager
+    def slot(
+        self,
+        cancel_event: Optional[threading.Event] = None,
+        on_wait: Optional[Callable[[int, float], None]] = None,
+    ) -> Iterator[None]:
+        """
+        Hold a call slot for the duration of a with block (see acquire).
+        """
+        ticket = self.acquire(cancel_event, on_wait)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Return admission counters, queue depth and the average call duration.
+
+        Returns:
+            Dict[str, float]: The admission metrics.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["in_flight"] = self._in_flight
+            metrics["queue_depth"] = len(self._queue)
+            metrics["call_seconds_avg"] = self._avg_seconds
+        return metrics
+
+    def _grant(self, ticket: _Ticket) -> None:
+        self._in_flight += 1
+        self._metrics["admitted"] += 1
+        ticket.granted_at = time.monotonic()
+        ticket.granted.set()
+
+    def _release_locked(self, ticket: _Ticket) -> None:
+        elapsed = time.monotonic() - ticket.granted_at
+        # Exponentially weighted, so the estimate follows the backend's pace
+        self._avg_seconds = (
+            0.8 * self._avg_seconds + 0.2 * elapsed if self._avg_seconds else elapsed
+        )
+        self._in_flight -= 1
+        while self._queue and self._in_flight < self.max_in_flight:
+            self._grant(self._queue.popleft())
+
+    def _position(self, ticket: _Ticket) -> Tuple[int, float]:
+        with self._lock:
+            try:
+                position = self._queue.index(ticket) + 1
+            except ValueError:
+                return 0, 0.0
+            return position, position * self._avg_seconds / self.max_in_flight
@@ -1,19 +1,38 @@
 from datetime import datetime
+from functools import partial
+from itertools import chain
 import time
 import logging
+import threading
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import random
 import json
-from typing import Dict, Any
+from concurrent.futures import CancelledError
+from typing import Callable, Dict, Any, Iterator, Optional
 
+from admission import Overloaded
 from connections import (
     get_lambda_client_bedrock,
-    get_lambda_client_feedback,
     get_dynamodb_client,
+    get_concurrency_metrics,
+    get_event_spool,
+    get_metrics_server,
 )
 import config
 import styles
-from utils import get_base64
+from cache import AnswerCache, answer_cache, is_cacheable, normalize_query
+from history import (
+    ChatHistory,
+    StoredConversation,
+    is_session_id,
+    new_session_id,
+    prune_archives,
+)
+from metrics import concurrency_metrics, stage_metrics
+from resilience import CircuitOpen
+from similarity import near_duplicates
+from utils import get_img_attrs, render_block
 
 # Configure logging
 logger = logging.getLogger()
@@ -21,8 +40,10 @@ logger.setLevel(logging.INFO)
 
 # Initialize Lambda clients
 lambda_client_bedrock = get_lambda_client_bedrock("getAgentResponse")
-lambda_client_feedback = get_lambda_client_feedback("SendFeedbackFunction")
+feedback_spool = get_event_spool("SendFeedbackFunction")
 dynamodb_client = get_dynamodb_client("conversationHistory")
+get_metrics_server()
+get_concurrency_metrics()
 
 
 def response_generator() -> str:
@@ -35,97 +56,444 @@ def response_generator() -> str:
     return random.choice(config.GREETINGS)
 
 
-def get_response(user_input: str, session_id: str) -> Dict[str, Any]:
+def get_cached_answer(user_input: str) -> Optional[Dict[str, Any]]:
+    """
+    Look up a previous answer in the session cache, then the process cache,
+    then the near-duplicate index.
+
+    Args:
+        user_input (str): The user's query.
+
+    Returns:
+        Optional[Dict[str, Any]]: The answer and where it came from, or None.
+    """
+    if not is_cacheable(user_input):
+        return None
+    key = normalize_query(user_input)
+    answer = st.session_state.cache.get(key)
+    if answer is not None:
+        return {"answer": answer, "source": "session_cache"}
+
+    answer = answer_cache.get(key)
+    if answer is not None:
+        logger.info(f"Answer cache hit: {answer_cache.stats()}")
+        st.session_state.cache.put(key, answer)
+        return {"answer": answer, "source": "answer_cache"}
+
+    match = near_duplicates.lookup(user_input)
+    if match is not None:
+        logger.info(
+            f"Near-duplicate of '{match.query}' ({match.similarity:.2f}): "
+            f"{near_duplicates.stats()}"
+        )
+        answer = match.answer
+        if normalize_query(match.query) != key:
+            answer = (
+                config.NEAR_DUP_ANSWER_NOTICE.format(matched_query=match.query)
+                + answer
+            )
+        st.session_state.cache.put(key, answer)
+        return {
+            "answer": answer,
+            "source": "near_duplicate",
+            "matched_query": match.query,
+            "similarity": match.similarity,
+            "answered_at": datetime.fromtimestamp(match.created).isoformat(),
+        }
+    return None
+
+
+def get_stale_answer(user_input: str) -> Optional[Dict[str, Any]]:
+    """
+    Look up a near-duplicate answer past its TTL, for when the backend is
+    unavailable.
+
+    The similarity threshold is the usual one, so the answer is about the
+    same question. It starts with config.STALE_ANSWER_NOTICE, telling the
+    user when it was given and to which question.
+
+    Args:
+        user_input (str): The user's query.
+
+    Returns:
+        Optional[Dict[str, Any]]: The answer and where it came from, or None.
+    """
+    if not is_cacheable(user_input):
+        return None
+    match = near_duplicates.lookup(user_input, include_expired=True)
+    if match is None:
+        return None
+    notice = config.STALE_ANSWER_NOTICE.format(
+        answered_at=datetime.fromtimestamp(match.created).strftime("%d/%m/%Y %H:%M"),
+        matched_query=match.query,
+    )
+    return {
+        "answer": notice + match.answer,
+        "source": "stale_near_duplicate",
+        "matched_query": match.query,
+        "similarity": match.similarity,
+        "answered_at": datetime.fromtimestamp(match.created).isoformat(),
+    }
+
+
+def persist_turn(
+    session_id: str, user_input: str, answer: str, start_time: float
+) -> None:
+    """
+    Write an exchange to conversationHistory, with the fields
+    StoredConversation reads back when the session is resumed.
+
+    Args:
+        session_id (str): The current session ID.
+        user_input (str): The user's query.
+        answer (str): The answer shown, without config.ANSWER_PREFIX.
+        start_time (float): When the question was received.
+    """
+    dynamodb_client.write_row(
+        {
+            "sessionId": session_id,
+            "creationDate": datetime.fromtimestamp(start_time).isoformat(),
+            "userMessage": user_input,
+            "response": answer,
+            "finalizationDate": datetime.fromtimestamp(time.time()).isoformat(),
+        }
+    )
+
+
+def agent_writes_history() -> bool:
+    """
+    Check whether answers of the agent backend are already written to
+    conversationHistory by getAgentResponse.
+
+    Returns:
+        bool: True if the app must not write them again.
+    """
+    return config.AGENT_BACKEND == "lambda" and config.AGENT_WRITES_HISTORY
+
+
+def cache_answer(user_input: str, answer: str) -> None:
+    """
+    Store an answer in the session and process caches.
+
+    Args:
+        user_input (str): The user's query.
+        answer (str): The agent's answer.
+    """
+    if not is_cacheable(user_input):
+        return
+    key = normalize_query(user_input)
+    st.session_state.cache.put(key, answer)
+    answer_cache.put(key, answer)
+    near_duplicates.add(user_input, answer)
+
+
+def get_response(
+    user_input: str,
+    session_id: str,
+    on_tick: Optional[Callable[[float], None]] = None,
+    on_queue: Optional[Callable[[int, float], None]] = None,
+) -> Dict[str, Any]:
     """
     Get response from GenAI Lambda.
 
+    The invocation runs on the shared executor; the script thread only waits
+    for it, up to config.INVOKE_TIMEOUT_SECONDS, and gives up as soon as the
+    session's cancel event is set. Cacheable questions identical to one
+    already in flight wait for that call instead of issuing their own, and
+    with a shared cache backend, for the call of another process. New
+    calls wait their turn for admission and get config.BUSY_MESSAGE when shed.
+    While the circuit breaker is open, an expired answer to the same question
+    is served if there is one, marked as such.
+    Every exchange ends up in conversationHistory, so the session can be
+    resumed: written by getAgentResponse for the answers it gives (see
+    agent_writes_history), by persist_turn for all others.
+
     Args:
         user_input (str): The user's query.
         session_id (str): The current session ID.
+        on_tick (Optional[Callable[[float], None]]): Called periodically while
+            waiting, with the elapsed seconds.
+        on_queue (Optional[Callable[[int, float], None]]): Called periodically
+            while queued for admission, with the queue position and the
+            estimated wait in seconds.
 
     Returns:
-        Dict[str, Any]: The response containing the answer.
+        Dict[str, Any]: The response containing the answer, plus its
+            "timings" per stage and the Lambda "request_id" when invoked.
     """
     logger.info(f"session id: {session_id}")
-    response = lambda_client_bedrock.invoke_sync(
-        payload={"body": {"query": user_input, "session_id": session_id}},
-    )
     start_time = time.time()
+    timings: Dict[str, float] = {}
+    with stage_metrics.timer("cache_lookup", timings):
+        cached = get_cached_answer(user_input)
+    if cached is not None:
+        persist_turn(session_id, user_input, cached["answer"], start_time)
+        return {**cached, "timings": timings}
+
+    key = normalize_query(user_input)
+    claimed = False
+    if (
+        is_cacheable(user_input)
+        and answer_cache.backend.shared
+        and not lambda_client_bedrock.single_flight.in_flight(key)
+    ):
+        claimed = answer_cache.claim(key)
+        if not claimed:
+            # Another process is asking the same question: wait for its answer
+            with stage_metrics.timer("shared_flight", timings):
+                answer = answer_cache.wait(
+                    key, cancel_event=st.session_state.cancel_event
+                )
+            logger.info(f"Answer cache: {answer_cache.stats()}")
+            if answer is not None:
+                st.session_state.cache.put(key, answer)
+                persist_turn(session_id, user_input, answer, start_time)
+                return {"answer": answer, "source": "shared_flight", "timings": timings}
+    try:
+        return ask_agent(user_input, session_id, start_time, timings, on_tick, on_queue)
+    finally:
+        if claimed:
+            answer_cache.release(key)
+
+
+def ask_agent(
+    user_input: str,
+    session_id: str,
+    start_time: float,
+    timings: Dict[str, float],
+    on_tick: Optional[Callable[[float], None]] = None,
+    on_queue: Optional[Callable[[int, float], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Invoke the agent for get_response and parse its answer.
+
+    Args:
+        user_input (str): The user's query.
+        session_id (str): The current session ID.
+        start_time (float): When the question was received.
+        timings (Dict[str, float]): Stage timings, updated in place.
+        on_tick (Optional[Callable[[float], None]]): See get_response.
+        on_queue (Optional[Callable[[int, float], None]]): See get_response.
+
+    Returns:
+        Dict[str, Any]: The response, as returned by get_response.
+    """
+    cancel_event = st.session_state.cancel_event
+    payload = {"body": {"query": user_input, "session_id": session_id}}
+    # Whether the agent received this session's own payload; a coalesced
+    # caller may get the answer to another session's identical question
+    issued = [True]
+    backend_start = time.perf_counter()
+    try:
+        if config.SINGLE_FLIGHT_ENABLED and is_cacheable(user_input):
+            issued = []
+            response = lambda_client_bedrock.invoke_coalesced(
+                normalize_query(user_input),
+                payload,
+                cancel_event=cancel_event,
+                on_tick=on_tick,
+                on_queue=on_queue,
+                on_start=lambda: issued.append(True),
+            )
+            logger.info(
+                f"Single-flight: {lambda_client_bedrock.single_flight.metrics()}"
+            )
+        else:
+            response = lambda_client_bedrock.invoke_admitted(
+                payload, cancel_event=cancel_event, on_tick=on_tick, on_queue=on_queue
+            )
+    except CircuitOpen as e:
+        logger.warning(f"Invocation rejected: {e}")
+        logger.info(f"Breaker: {lambda_client_bedrock.breaker.metrics()}")
+        stale = get_stale_answer(user_input)
+        if stale is not None:
+            persist_turn(session_id, user_input, stale["answer"], start_time)
+            return {**stale, "timings": timings}
+        response = {"statusCode": 503, "body": json.dumps({"error": str(e)})}
+    except Overloaded as e:
+        logger.warning(f"Invocation shed: {e}")
+        logger.info(f"Admission: {lambda_client_bedrock.admission.metrics()}")
+        response = {"statusCode": 503, "body": json.dumps({"error": str(e)})}
+    except TimeoutError as e:
+        logger.warning(f"Invocation timed out: {e}")
+        response = {"statusCode": 504, "body": json.dumps({"error": str(e)})}
+    except CancelledError:
+        logger.info(f"Invocation cancelled for session {session_id}")
+        response = {"statusCode": 499, "body": json.dumps({"error": "cancelled"})}
+    # Admission wait, hedging and the invocation itself, as seen by the user
+    timings["backend"] = time.perf_counter() - backend_start
+    stage_metrics.observe("backend", timings["backend"])
+    metadata = response.get("_metadata", {})
+    # Coalesced callers share the response, so the timings are copied
+    timings.update(metadata.get("timings", {}))
     logger.info(response)
+    if config.HEDGE_ENABLED:
+        logger.info(f"Hedging: {lambda_client_bedrock.hedge_metrics()}")
     try:
-        response_output = {"answer": json.loads(response["body"])["answer"]}
+        with stage_metrics.timer("decode", timings):
+            body = response["body"]
+            # The codec already decoded Lambda bodies; error bodies built
+            # here are still JSON strings
+            if isinstance(body, str):
+                body = json.loads(body)
+        response_output = {"answer": body["answer"]}
+        cache_answer(user_input, response_output["answer"])
+        if not (issued and agent_writes_history()):
+            persist_turn(session_id, user_input, body["answer"], start_time)
     except Exception as e:
         logger.error(f"Error parsing response: {e}")
-        message = "Hola, no entendí tu mensaje. ¡Puedes reformular mejor tu pregunta por favor!"
-        dynamodb_client.write_row(
-            {
-                "sessionId": session_id,
-                "creationDate": datetime.fromtimestamp(start_time).isoformat(),
-                "userMessage": user_input,
-                "response": message,
-                "finalizationDate": datetime.fromtimestamp(time.time()).isoformat(),
-            }
-        )
+        if response.get("statusCode") == 503:
+            message = config.BUSY_MESSAGE
+        else:
+            message = "Hola, no entendí tu mensaje. ¡Puedes reformular mejor tu pregunta por favor!"
+        persist_turn(session_id, user_input, message, start_time)
         response_output = {"answer": message}
 
+    response_output["request_id"] = metadata.get("request_id")
+    response_output["timings"] = timings
     logger.info(f"response_output from genai lambda: {response_output}")
     return response_output
 
 
+def get_response_stream(
+    user_input: str,
+    session_id: str,
+    on_queue: Optional[Callable[[int, float], None]] = None,
+) -> Iterator[str]:
+    """
+    Stream the response from the GenAI Lambda.
+
+    The stream holds an admission slot while it is read, as get_response does.
+    Exchanges are written to conversationHistory as in get_response.
+
+    Args:
+        user_input (str): The user's query.
+        session_id (str): The current session ID.
+        on_queue (Optional[Callable[[int, float], None]]): Called periodically
+            while queued for admission, with the queue position and the
+            estimated wait in seconds.
+
+    Yields:
+        str: Answer text chunks as the agent generates them.
+    """
+    logger.info(f"session id: {session_id}")
+    start_time = time.time()
+    cached = get_cached_answer(user_input)
+    if cached is not None:
+        persist_turn(session_id, user_input, cached["answer"], start_time)
+        yield cached["answer"]
+        return
+
+    chunks = []
+    cancel_event = st.session_state.cancel_event
+    try:
+        with lambda_client_bedrock.admission.slot(cancel_event, on_queue):
+            for chunk in lambda_client_bedrock.invoke_stream(
+                payload={"body": {"query": user_input, "session_id": session_id}},
+                cancel_event=cancel_event,
+            ):
+                chunks.append(chunk)
+                yield chunk
+        if not cancel_event.is_set():
+            cache_answer(user_input, "".join(chunks))
+            if not agent_writes_history():
+                persist_turn(session_id, user_input, "".join(chunks), start_time)
+    except CancelledError:
+        logger.info(f"Stream cancelled for session {session_id}")
+        return
+    except Exception as e:
+        logger.error(f"Error streaming response: {e}")
+        if chunks:
+            return
+        if isinstance(e, CircuitOpen):
+            stale = get_stale_answer(user_input)
+            if stale is not None:
+                persist_turn(session_id, user_input, stale["answer"], start_time)
+                yield stale["answer"]
+                return
+        if isinstance(e, (CircuitOpen, Overloaded)):
+            message = config.BUSY_MESSAGE
+        else:
+            message = "Hola, no entendí tu mensaje. ¡Puedes reformular mejor tu pregunta por favor!"
+        persist_turn(session_id, user_input, message, start_time)
+        yield message
+
+
+@st.fragment
+def feedback_form() -> None:
+    """
+    Display the feedback form in the sidebar.
+
+    Runs as a fragment, so sending feedback reruns only the form.
+    """
+    st.markdown(styles.get_feedback_style(), unsafe_allow_html=True)
+    st.markdown(
+        '<div class="feedback-title">💬 Tu opinión importa</div> <br>',
+        unsafe_allow_html=True,
+    )
+
+    comentarios = st.text_area(
+        "comentarios",
+        placeholder="✍️ Cuéntanos tu experiencia, sugerencias o reporta algún problema...",
+        height=120,
+        max_chars=500,
+        key="feedback_comments",
+        label_visibility="collapsed",
+    )
+
+    if st.button("📤 Enviar feedback", use_container_width=True, type="primary"):
+        if comentarios:
+            # Spooled to disk and delivered in the background
+            accepted = feedback_spool.append(
+                payload={
+                    "body": {
+                        "feedback": comentarios,
+                        "session_id": st.session_state.session_id,
+                    }
+                },
+                session_id=st.session_state.session_id,
+            )
+            logger.info(f"Feedback spooled: {feedback_spool.metrics()}")
+            if accepted:
+                st.success("Feedback enviado correctamente", icon="✅")
+            else:
+                st.error(
+                    "Error al enviar el feedback, inténtalo más tarde",
+                    icon="❌",
+                )
+        else:
+            st.warning("Por favor escribe tus comentarios", icon="⚠️")
+
+
 def header() -> None:
     """
     Sets up the application header and sidebar.
     """
-    # Load fonts
-    font_b64 = get_base64(config.FONT_KDAM_THMOR)
-    inter_b64 = get_base64(config.FONT_INTER)
-
     # Main style
     st.markdown(styles.get_main_style(), unsafe_allow_html=True)
 
     with st.sidebar:
         # Sidebar Header
-        st.markdown(styles.get_sidebar_header_style(font_b64), unsafe_allow_html=True)
-
-        # Sidebar Content
-        st.markdown(styles.get_sidebar_content_style(inter_b64), unsafe_allow_html=True)
-
-        # Feedback Section
-        st.markdown(styles.get_feedback_style(), unsafe_allow_html=True)
         st.markdown(
-            '<div class="feedback-title">💬 Tu opinión importa</div> <br>',
+            render_block(
+                "sidebar_header",
+                styles.get_sidebar_header_style,
+                [config.FONT_KDAM_THMOR],
+            ),
             unsafe_allow_html=True,
         )
 
-        comentarios = st.text_area(
-            "comentarios",
-            placeholder="✍️ Cuéntanos tu experiencia, sugerencias o reporta algún problema...",
-            height=120,
-            max_chars=500,
-            key="feedback_comments",
-            label_visibility="collapsed",
+        # Sidebar Content
+        st.markdown(
+            render_block(
+                "sidebar_content",
+                styles.get_sidebar_content_style,
+                [config.FONT_INTER],
+            ),
+            unsafe_allow_html=True,
         )
 
-        if st.button("📤 Enviar feedback", use_container_width=True, type="primary"):
-            if comentarios:
-                response = lambda_client_feedback.invoke_sync(
-                    payload={
-                        "body": {
-                            "feedback": comentarios,
-                            "session_id": st.session_state.session_id,
-                        }
-                    },
-                )
-                logger.info(json.dumps(response))
-                if response.get("statusCode") == 200:
-                    st.success("Feedback enviado correctamente", icon="✅")
-                else:
-                    st.error(
-                        f"Error al enviar el feedback: {json.dumps(response)}",
-                        icon="❌",
-                    )
-            else:
-                st.warning("Por favor escribe tus comentarios", icon="⚠️")
+        feedback_form()
 
         st.markdown(
             '<div class="feedback-title">🔄 ¿Algún problema?', unsafe_allow_html=True
@@ -135,11 +503,27 @@ def header() -> None:
             unsafe_allow_html=True,
         )
 
-        if st.button("Reset Chat", type="primary", use_container_width=True):
-            st.session_state.messages = [
-                {"role": "assistant", "content": response_generator()}
-            ]
-            st.rerun()
+        st.button(
+            "Reset Chat",
+            type="primary",
+            use_container_width=True,
+            on_click=reset_chat,
+        )
+
+
+def reset_chat() -> None:
+    """
+    Callback of the Reset Chat button: starts the conversation over, as a
+    new session, in the run the click triggers.
+    """
+    # Abandon any call still pending for this session
+    st.session_state.cancel_event.set()
+    st.session_state.cancel_event = threading.Event()
+    st.session_state.messages.clear()
+    start_session(resume=False)
+    st.session_state.messages.append(
+        {"role": "assistant", "content": response_generator()}
+    )
 
 
 def set_background(png_file: str) -> None:
@@ -149,8 +533,35 @@ def set_background(png_file: str) -> None:
     Args:
         png_file (str): Path to the PNG image file.
     """
-    bin_str = get_base64(png_file)
-    st.markdown(styles.get_background_style(bin_str), unsafe_allow_html=True)
+    st.markdown(
+        render_block("background", styles.get_background_style, [png_file]),
+        unsafe_allow_html=True,
+    )
+
+
+def start_session(resume: bool = True) -> None:
+    """
+    Start a session, resuming the one whose token is in the URL if any.
+
+    The session ID is the resume token: it is kept in the URL, so a
+    refresh, a reconnect or a new task picks the conversation up from
+    conversationHistory, most recent page first.
+
+    Args:
+        resume (bool): Whether to resume from the URL token.
+    """
+    token = st.query_params.get(config.CHAT_RESUME_QUERY_PARAM)
+    if resume and config.CHAT_RESUME_ENABLED and is_session_id(token):
+        history = ChatHistory(token)
+        if history.restore(StoredConversation(dynamodb_client, token)):
+            logger.info(f"Resumed session {token}")
+    else:
+        history = ChatHistory(new_session_id())
+    st.session_state.session_id = history.session_id
+    st.session_state.messages = history
+    st.session_state.earlier_pages = 0
+    if config.CHAT_RESUME_ENABLED:
+        st.query_params[config.CHAT_RESUME_QUERY_PARAM] = history.session_id
 
 
 def initialization() -> None:
@@ -158,63 +569,176 @@ def initialization() -> None:
     Initialize session_state variables.
     """
     if "session_id" not in st.session_state:
-        st.session_state.session_id = str(datetime.now()).replace(" ", "_")
-        st.session_state.messages = []
+        start_session()
+        prune_archives()
 
     if "temp" not in st.session_state:
         st.session_state.temp = ""
 
     if "cache" not in st.session_state:
-        st.session_state.cache = {}
+        st.session_state.cache = AnswerCache(
+            max_bytes=config.SESSION_ANSWER_CACHE_MAX_BYTES
+        )
+
+    if "cancel_event" not in st.session_state:
+        st.session_state.cancel_event = threading.Event()
 
-    if "chat_button" not in st.session_state:
-        st.session_state.chat_button = False
+    # On every run: a browser that reconnects keeps its session
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        concurrency_metrics.track_session(ctx.session_id)
 
 
-def disable_chat_input() -> None:
+def queue_question() -> None:
     """
-    Callback to disable chat input.
+    Callback of the chat input: keeps the submitted question for the
+    fragment run it triggers, which answers it before rendering the input.
     """
-    st.session_state.chat_button = True
+    st.session_state.pending_input = st.session_state.chat_input
+    # Back to rendering only the recent window
+    st.session_state.earlier_pages = 0
 
 
-def enable_chat_input() -> None:
+def show_earlier_messages() -> None:
+    """
+    Callback to render one more page of archived or stored messages.
     """
-    Callback to enable chat input and rerun the app.
+    st.session_state.earlier_pages += 1
+
+
+def show_queue(placeholder: Any, position: int, estimated_wait: float) -> None:
     """
-    st.session_state.chat_button = False
-    st.rerun()
+    Show the queue position and estimated wait while a question waits for
+    admission.
+
+    Args:
+        placeholder (Any): The st.empty placeholder to write to.
+        position (int): 1-based position in the queue.
+        estimated_wait (float): Estimated seconds until the call starts.
+    """
+    placeholder.caption(
+        f"⏳ Hay mucha demanda: tu consulta está en la posición {position} "
+        f"de la cola (espera estimada ~{estimated_wait:.0f} s)"
+    )
 
 
+def record_timings(
+    timings: Dict[str, float],
+    start: float,
+    request_id: Optional[str] = None,
+    source: str = "agent",
+) -> None:
+    """
+    Record the end-to-end latency of a question and export its stage
+    timings as one EMF record.
+
+    Args:
+        timings (Dict[str, float]): Seconds per stage.
+        start (float): time.perf_counter() when the question was submitted.
+        request_id (Optional[str]): Lambda request ID of the invocation.
+        source (str): Where the answer came from.
+    """
+    timings["total"] = time.perf_counter() - start
+    stage_metrics.observe("total", timings["total"])
+    stage_metrics.record_request(
+        timings,
+        request_id=request_id,
+        source=source,
+        session_id=st.session_state.session_id,
+    )
+
+
+@st.fragment
+@concurrency_metrics.rerun_timer()
 def show_message() -> None:
     """
     Display user question and answers in the chat interface.
+
+    Runs as a fragment, so submitting a question or asking for earlier
+    messages reruns only the chat, not the page around it. The question is
+    answered first and the chat input rendered last, into the bottom
+    container, so one run both shows the answer and re-enables the input.
+
+    Only the recent window of the history is rendered, unless earlier pages
+    were asked for with the "show earlier messages" button.
     """
-    for message in st.session_state.messages:
+    placeholder = "¿Cómo puedo ayudarte hoy?"
+    with st.bottom:
+        input_slot = st.empty()
+    user_input = st.session_state.pop("pending_input", None)
+    if user_input:
+        # Replaced by the enabled input once the answer is shown
+        input_slot.chat_input(placeholder, key="chat_input_busy", disabled=True)
+
+    history = st.session_state.messages
+    # Read first: fetching stored pages tells whether there are more
+    earlier = history.earlier(st.session_state.earlier_pages)
+    if history.has_earlier(st.session_state.earlier_pages):
+        st.button(
+            "Ver mensajes anteriores",
+            key="show_earlier",
+            on_click=show_earlier_messages,
+        )
+    for message in chain(earlier, history):
         with st.chat_message(message["role"], avatar=config.AVATAR[message["role"]]):
             st.markdown(message["content"])
 
-    if user_input := st.chat_input(
-        "¿Cómo puedo ayudarte hoy?",
-        max_chars=300,
-        disabled=st.session_state.chat_button,
-        on_submit=disable_chat_input,
-    ):
-        st.session_state.chat_button = True
+    if user_input:
+        start = time.perf_counter()
         session_id = st.session_state.session_id
         st.session_state.messages.append({"role": "user", "content": user_input})
         with st.chat_message("user", avatar=config.AVATAR["user"]):
             st.markdown(user_input)
 
-        with st.spinner("Procesando tu información ...", show_time=True):
+        if config.STREAMING_RESPONSES:
             assistant = st.chat_message("assistant", avatar=config.AVATAR["assistant"])
-            response_output = get_response(user_input, session_id)
-            answer = "**Respuesta**: \n\n" + response_output["answer"]
+            queue_status = st.empty()
+            chunks = get_response_stream(
+                user_input, session_id, on_queue=partial(show_queue, queue_status)
+            )
+            timings: Dict[str, float] = {}
+            # Keep the spinner only until the first token arrives
+            with st.spinner("Procesando tu información ...", show_time=True):
+                with stage_metrics.timer("first_chunk", timings):
+                    first_chunk = next(chunks, "")
+            queue_status.empty()
+            with stage_metrics.timer("stream", timings):
+                answer = assistant.write_stream(
+                    chain([config.ANSWER_PREFIX, first_chunk], chunks)
+                )
             st.session_state.messages.append({"role": "assistant", "content": answer})
-            assistant.write(answer)
-        enable_chat_input()
+            record_timings(timings, start, source="stream")
+        else:
+            with st.spinner("Procesando tu información ...", show_time=True):
+                assistant = st.chat_message(
+                    "assistant", avatar=config.AVATAR["assistant"]
+                )
+                # Any element update lets Streamlit stop the wait when the
+                # session reruns or disconnects
+                ticker = st.empty()
+                response_output = get_response(
+                    user_input,
+                    session_id,
+                    on_tick=lambda _: ticker.empty(),
+                    on_queue=partial(show_queue, ticker),
+                )
+                answer = config.ANSWER_PREFIX + response_output["answer"]
+                st.session_state.messages.append(
+                    {"role": "assistant", "content": answer}
+                )
+                timings = response_output["timings"]
+                with stage_metrics.timer("render", timings):
+                    assistant.write(answer)
+                record_timings(
+                    timings,
+                    start,
+                    request_id=response_output.get("request_id"),
+                    source=response_output.get("source", "agent"),
+                )
 
-    st.markdown(styles.get_chat_input_style(), unsafe_allow_html=True)
+    input_slot.chat_input(
+        placeholder, key="chat_input", max_chars=300, on_submit=queue_question
+    )
 
 
 def show_footer(logo_path: str, inei_logo_path: str) -> None:
@@ -225,14 +749,23 @@ def show_footer(logo_path: str, inei_logo_path: str) -> None:
         logo_path (str): Path to the LabStat logo.
         inei_logo_path (str): Path to the INEI logo.
     """
-    bin_footer = get_base64(logo_path)
-    bin_inei = get_base64(inei_logo_path)
-    st.markdown(styles.get_footer_style(bin_inei, bin_footer), unsafe_allow_html=True)
+    st.markdown(
+        render_block(
+            "footer",
+            styles.get_footer_style,
+            [inei_logo_path, logo_path],
+            resolve=get_img_attrs,
+        ),
+        unsafe_allow_html=True,
+    )
 
 
+@concurrency_metrics.rerun_timer()
 def main() -> None:
     """
     Main function to run the Streamlit App.
+
+    Full runs and fragment runs of show_message are timed as reruns.
     """
     # Page Configuration
     st.set_page_config(
@@ -251,16 +784,25 @@ def main() -> None:
         pass
 
     with col1_2:
-        abeeze_b64 = get_base64(config.FONT_ABEEZE)
-        st.markdown(styles.get_beta_badge_style(abeeze_b64), unsafe_allow_html=True)
+        st.markdown(
+            render_block(
+                "beta_badge", styles.get_beta_badge_style, [config.FONT_ABEEZE]
+            ),
+            unsafe_allow_html=True,
+        )
 
     _, col1, _ = st.columns([1, 3, 1])
     with col1:
         col1_1, col1_2 = st.columns([1, 3], gap="small")
         with col1_1:
-            st.image(
-                config.IMG_MASCOTA,
-                width=140,
+            st.markdown(
+                render_block(
+                    "mascot",
+                    partial(styles.get_mascot_image, width=140),
+                    [config.IMG_MASCOTA],
+                    resolve=get_img_attrs,
+                ),
+                unsafe_allow_html=True,
             )
         with col1_2:
             st.markdown(styles.get_hero_title_style(), unsafe_allow_html=True)
@@ -268,6 +810,7 @@ def main() -> None:
         st.write(styles.get_chat_bubble_style(), unsafe_allow_html=True)
 
     show_message()
+    st.markdown(styles.get_chat_input_style(), unsafe_allow_html=True)
     show_footer(config.IMG_LOGO_LABSTAT, config.IMG_LOGO_INEI)
 
 
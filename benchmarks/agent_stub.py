@@ -0,0 +1,174 @@
+"""
+Local stub of the Bedrock Agent Runtime InvokeAgent API.
+
+Answers every question after a log-normal latency, streamed back as
+"chunk" events in the binary event stream encoding boto3 reads, so the
+"agent" backend of OptimizedAWSClient can be exercised without AWS:
+
+    python benchmarks/agent_stub.py --port 8765
+    AGENT_BACKEND=bedrock BEDROCK_AGENT_ID=stub \\
+        AWS_ENDPOINT_URL_BEDROCK_AGENT_RUNTIME=http://127.0.0.1:8765 \\
+        streamlit run app.py
+"""
+import argparse
+import base64
+import json
+import math
+import random
+import re
+import struct
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+_PATH = re.compile(
+    r"^/agents/(?P<agent>[^/]+)/agentAliases/(?P<alias>[^/]+)"
+    r"/sessions/(?P<session>[^/]+)/text$"
+)
+
+
+def encode_event(headers: Dict[str, str], payload: bytes) -> bytes:
+    """
+    Encode one message of the AWS event stream format.
+
+    Args:
+        headers (Dict[str, str]): String-valued headers.
+        payload (bytes): The message payload.
+
+    Returns:
+        bytes: The framed message, with its prelude and message CRCs.
+    """
+    encoded = b""
+    for name, value in headers.items():
+        name_bytes, value_bytes = name.encode("utf-8"), value.encode("utf-8")
+        # Header value type 7 is a string with a 2-byte length
+        encoded += struct.pack("B", len(name_bytes)) + name_bytes
+        encoded += struct.pack(">BH", 7, len(value_bytes)) + value_bytes
+    total = 12 + len(encoded) + len(payload) + 4
+    prelude = struct.pack(">II", total, len(encoded))
+    message = prelude + struct.pack(">I", zlib.crc32(prelude)) + encoded + payload
+    return message + struct.pack(">I", zlib.crc32(message))
+
+
+def chunk_event(text: str) -> bytes:
+    """
+    Encode a completion "chunk" event.
+
+    Args:
+        text (str): Answer text carried by the chunk.
+
+    Returns:
+        bytes: The framed event.
+    """
+    payload = json.dumps(
+        {"bytes": base64.b64encode(text.encode("utf-8")).decode("ascii")}
+    ).encode("utf-8")
+    return encode_event(
+        {
+            ":message-type": "event",
+            ":event-type": "chunk",
+            ":content-type": "application/json",
+        },
+        payload,
+    )
+
+
+class AgentStubHandler(BaseHTTPRequestHandler):
+    """
+    Serves InvokeAgent requests; the latency settings are class attributes.
+    """
+
+    protocol_version = "HTTP/1.1"
+    latency_median = 1.0
+    latency_sigma = 0.5
+    chunk_size = 16
+    chunk_delay = 0.01
+
+    def do_POST(self) -> None:
+        match = _PATH.match(self.path.split("?")[0])
+        body: Dict[str, Any] = json.loads(
+            self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}"
+        )
+        if match is None or "inputText" not in body:
+            self._error(400, "ValidationException", "Malformed InvokeAgent request")
+            return
+        time.sleep(
+            random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+        )
+        answer = f"Respuesta simulada a: {body['inputText']}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("x-amzn-RequestId", f"stub-{time.time_ns()}")
+        self.send_header("x-amzn-bedrock-agent-content-type", "text/plain")
+        self.send_header("x-amz-bedrock-agent-session-id", match["session"])
+        self.end_headers()
+        streamed = body.get("streamingConfigurations", {}).get("streamFinalResponse")
+        size = self.chunk_size if streamed else len(answer)
+        for i in range(0, len(answer), size):
+            event = chunk_event(answer[i : i + size])
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+            if streamed:
+                time.sleep(self.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _error(self, status: int, code: str, message: str) -> None:
+        body = json.dumps({"message": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("x-amzn-ErrorType", code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    latency_median: float = 1.0,
+    latency_sigma: float = 0.5,
+) -> ThreadingHTTPServer:
+    """
+    Create the stub server; call serve_forever() on it to run it.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on, 0 for any free port.
+        latency_median (float): Median seconds before the answer starts.
+        latency_sigma (float): Sigma of the log-normal latency.
+
+    Returns:
+        ThreadingHTTPServer: The server.
+    """
+    handler = type(
+        "ConfiguredAgentStubHandler",
+        (AgentStubHandler,),
+        {"latency_median": latency_median, "latency_sigma": latency_sigma},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-median", type=float, default=1.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.latency_median, args.latency_sigma)
+    print(f"Agent stub listening on http://{args.host}:{server.server_port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""
+Entry point serving app.py with the AWS fakes installed, used by load.py:
+
+    streamlit run benchmarks/fake_app.py
+"""
+import os
+import runpy
+import sys
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+for path in (ROOT, BENCHMARKS):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import fakes  # noqa: E402
+
+fakes.install_from_env()
+runpy.run_path(os.path.join(ROOT, "app.py"), run_name="__main__")
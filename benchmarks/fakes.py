@@ -0,0 +1,179 @@
+"""
+In-process fakes of the AWS services behind OptimizedAWSClient.
+
+getAgentResponse answers after a log-normal latency and fails at a given
+rate; DynamoDB accepts every write. install_from_env() reads the
+distribution from FAKE_LAMBDA_LATENCY_MEDIAN, FAKE_LAMBDA_LATENCY_SIGMA and
+FAKE_LAMBDA_ERROR_RATE. With LAMBDA_TRANSPORT=replay, Lambda answers come
+from the recorded cassette instead (see transport.py).
+"""
+import io
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class FakeLambda:
+    """
+    Stand-in for the boto3 Lambda client.
+    """
+
+    def __init__(
+        self, latency_median: float, latency_sigma: float, error_rate: float
+    ):
+        """
+        Initialize the FakeLambda.
+
+        Args:
+            latency_median (float): Median invocation latency in seconds.
+            latency_sigma (float): Sigma of the log-normal latency.
+            error_rate (float): Fraction of invocations that fail.
+        """
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.invocations = 0
+        self.errors = 0
+
+    def _call(self) -> None:
+        with self._lock:
+            self.invocations += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(
+            random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+        )
+        if failed:
+            raise RuntimeError("TooManyRequestsException (simulated)")
+
+    @staticmethod
+    def _answer(payload: Any) -> str:
+        query = json.loads(payload)["body"].get("query", "")
+        return f"Respuesta simulada a: {query}"
+
+    def invoke(self, FunctionName: str, Payload: Any, **kwargs: Any) -> Dict[str, Any]:
+        self._call()
+        metadata = {"RequestId": str(uuid.uuid4())}
+        if kwargs.get("InvocationType") == "Event":
+            return {"StatusCode": 202, "ResponseMetadata": metadata}
+        body = json.dumps({"answer": self._answer(Payload)})
+        return {
+            "StatusCode": 200,
+            "ExecutedVersion": "$LATEST",
+            "Payload": io.BytesIO(
+                json.dumps({"statusCode": 200, "body": body}).encode("utf-8")
+            ),
+            "ResponseMetadata": metadata,
+        }
+
+    def invoke_with_response_stream(
+        self, FunctionName: str, Payload: Any, **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._call()
+        answer = self._answer(Payload).encode("utf-8")
+
+        def events() -> Iterator[Dict[str, Any]]:
+            for i in range(0, len(answer), 16):
+                yield {"PayloadChunk": {"Payload": answer[i : i + 16]}}
+            yield {"InvokeComplete": {}}
+
+        return {"EventStream": _EventStream(events())}
+
+    def get_function_configuration(self, **kwargs: Any) -> Dict[str, Any]:
+        return {}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"invocations": self.invocations, "errors": self.errors}
+
+
+class _EventStream:
+    def __init__(self, events: Iterator[Dict[str, Any]]):
+        self._events = events
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self._events
+
+    def close(self) -> None:
+        pass
+
+
+class FakeDynamoDB:
+    """
+    Stand-in for a DynamoDB Table and its low-level client (meta.client).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = 0
+        self.meta = self
+        self.client = self
+
+    def put_item(self, Item: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.items += 1
+        return {}
+
+    def batch_write_item(self, RequestItems: Dict[str, List]) -> Dict[str, Any]:
+        with self._lock:
+            self.items += sum(len(r) for r in RequestItems.values())
+        return {"UnprocessedItems": {}}
+
+    def describe_table(self, **kwargs: Any) -> Dict[str, Any]:
+        return {}
+
+    def query(self, **kwargs: Any) -> Dict[str, Any]:
+        # Sessions are never resumed in load tests
+        return {"Items": []}
+
+
+fake_lambda: Optional[FakeLambda] = None
+fake_dynamodb: Optional[FakeDynamoDB] = None
+
+
+def install(lambda_client: FakeLambda, dynamodb: FakeDynamoDB) -> None:
+    """
+    Make every OptimizedAWSClient of this process use the fakes.
+
+    Args:
+        lambda_client (FakeLambda): Replaces the boto3 Lambda clients.
+        dynamodb (FakeDynamoDB): Replaces the DynamoDB tables.
+    """
+    import config
+    import connections
+    from transport import Cassette, ReplayTransport
+    from write_behind import WriteBehindBuffer
+
+    def create_client(self: connections.OptimizedAWSClient) -> Any:
+        if self._aws_resource_type == "lambda":
+            if config.LAMBDA_TRANSPORT == "replay":
+                return ReplayTransport(Cassette(config.CASSETTE_PATH))
+            return lambda_client
+        if config.WRITE_BEHIND_ENABLED:
+            self._write_buffer = WriteBehindBuffer(dynamodb, self._aws_resource_name)
+        return dynamodb
+
+    connections.OptimizedAWSClient._create_client = create_client
+
+
+def install_from_env() -> None:
+    """
+    Install the fakes once per process, configured from the environment.
+    """
+    global fake_lambda, fake_dynamodb
+    if fake_lambda is not None:
+        return
+    fake_lambda = FakeLambda(
+        float(os.environ.get("FAKE_LAMBDA_LATENCY_MEDIAN", "1.0")),
+        float(os.environ.get("FAKE_LAMBDA_LATENCY_SIGMA", "0.5")),
+        float(os.environ.get("FAKE_LAMBDA_ERROR_RATE", "0.0")),
+    )
+    fake_dynamodb = FakeDynamoDB()
+    install(fake_lambda, fake_dynamodb)
@@ -0,0 +1,392 @@
+"""
+Multi-session load test for app.py.
+
+Starts app.py under a real Streamlit server, with the boto3 clients behind
+OptimizedAWSClient replaced by in-process fakes (see fakes.py), and drives
+it with many concurrent headless websocket sessions speaking Streamlit's
+protocol. Each session renders the page, then asks questions one at a time
+through the chat input. No AWS access is needed.
+
+Reports reruns/sec, end-to-end answer latency percentiles, server RSS per
+session and server CPU per rerun, plus the app's own per-stage latency
+histograms scraped from its /metrics endpoint.
+
+With --cassette, getAgentResponse is replayed from invocations recorded with
+LAMBDA_TRANSPORT=record instead, at --time-scale times the recorded latency
+and with optional --fuzz-sigma noise.
+
+Usage:
+    python benchmarks/load.py [--sessions 20] [--questions 5]
+        [--latency-median 1.0] [--latency-sigma 0.5] [--error-rate 0.05]
+        [--cassette invocations.jsonl.gz] [--time-scale 1] [--fuzz-sigma 0]
+        [--output load.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from startup import stub_aws_env
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "¿Cuál fue la población del Perú en 2017?",
+    "¿Cuál es la tasa de pobreza monetaria en 2023?",
+    "¿Cuántas viviendas particulares hay en Lima?",
+    "¿Cuál fue el PBI del Perú en 2022?",
+    "¿Cuál es la tasa de desempleo en Lima Metropolitana?",
+    "¿Cuántos nacimientos se registraron en 2021?",
+    "¿Cuál es la esperanza de vida al nacer?",
+    "¿Cuál fue la inflación anual en 2023?",
+    "¿Cuántas empresas se crearon en 2022?",
+    "¿Cuál es el porcentaje de hogares con internet?",
+]
+
+
+class Session:
+    """
+    Headless Streamlit client: one browser tab's worth of protocol.
+    """
+
+    def __init__(self, url: str):
+        """
+        Initialize the Session.
+
+        Args:
+            url (str): Websocket URL of the server's /_stcore/stream.
+        """
+        self.url = url
+        self.ws: Any = None
+        self.chat_input_id: Optional[str] = None
+        self.chat_fragment_id = ""
+        self.script_runs = 0
+
+    async def connect(self) -> None:
+        """
+        Open the websocket and wait for the first render.
+        """
+        self.ws = await websockets.connect(
+            self.url, subprotocols=["streamlit"], max_size=None
+        )
+        await self.rerun()
+
+    async def rerun(self, chat_input: Optional[str] = None) -> float:
+        """
+        Request a script run and wait until the app is idle again.
+
+        Args:
+            chat_input (Optional[str]): Text submitted through the chat input.
+
+        Returns:
+            float: Seconds until the assistant's answer was rendered, or until
+                the run finished when no answer was expected.
+        """
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        if chat_input is not None:
+            widget = msg.rerun_script.widget_states.widgets.add()
+            widget.id = self.chat_input_id
+            widget.chat_input_value.data = chat_input
+            # As the browser does, only the fragment holding the input reruns
+            msg.rerun_script.fragment_id = self.chat_fragment_id
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+
+        answered: Optional[float] = None
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            kind = fwd.WhichOneof("type")
+            if kind == "new_session":
+                self.script_runs += 1
+            elif kind == "delta":
+                element = fwd.delta.new_element
+                if element.WhichOneof("type") == "chat_input":
+                    self.chat_input_id = element.chat_input.id
+                    self.chat_fragment_id = fwd.delta.fragment_id
+                elif (
+                    answered is None
+                    and chat_input is not None
+                    and "Respuesta" in element.markdown.body
+                ):
+                    answered = time.perf_counter() - start
+            elif kind == "script_finished" and (
+                fwd.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN
+            ):
+                if answered is None:
+                    answered = time.perf_counter() - start
+                return answered
+
+    async def close(self) -> None:
+        """
+        Close the websocket.
+        """
+        await self.ws.close()
+
+
+async def run_session(
+    url: str, index: int, questions: int, think_time: float
+) -> Dict[str, Any]:
+    """
+    Drive one session: render the app, then ask questions one at a time.
+
+    Args:
+        url (str): Websocket URL of the server.
+        index (int): Number of the session, seeds its question order.
+        questions (int): Questions to ask.
+        think_time (float): Seconds between an answer and the next question.
+
+    Returns:
+        Dict[str, Any]: Answer latencies and script runs of the session.
+    """
+    rng = random.Random(index)
+    session = Session(url)
+    await session.connect()
+    latencies = []
+    for _ in range(questions):
+        latencies.append(await session.rerun(rng.choice(QUESTIONS)))
+        await asyncio.sleep(think_time)
+    return {"latencies": latencies, "session": session}
+
+
+def free_port() -> int:
+    """
+    Return a TCP port nothing listens on.
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_stats(pid: int) -> Dict[str, float]:
+    """
+    Read the RSS and CPU time of a process from /proc (Linux).
+
+    Args:
+        pid (int): Process ID.
+
+    Returns:
+        Dict[str, float]: rss_bytes and cpu_seconds.
+    """
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(
+            int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:")
+        )
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime, in clock ticks
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return {"rss_bytes": rss, "cpu_seconds": cpu}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """
+    Summarize latencies.
+
+    Args:
+        values (List[float]): Latencies in seconds.
+
+    Returns:
+        Dict[str, float]: count, mean, p50, p95, p99 and max.
+    """
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.mean(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def stage_counts(metrics_text: str) -> Dict[str, Dict[str, float]]:
+    """
+    Extract the per-stage count and mean from the app's /metrics page.
+
+    Args:
+        metrics_text (str): Prometheus text exposition.
+
+    Returns:
+        Dict[str, Dict[str, float]]: count and mean seconds per stage.
+    """
+    stages: Dict[str, Dict[str, float]] = {}
+    for line in metrics_text.splitlines():
+        for suffix in ("_sum", "_count"):
+            prefix = f"chat_stage_seconds{suffix}{{stage=\""
+            if line.startswith(prefix):
+                stage = line[len(prefix) :].split('"', 1)[0]
+                value = float(line.rsplit(" ", 1)[1])
+                stages.setdefault(stage, {})[suffix[1:]] = value
+    return {
+        stage: {
+            "count": v.get("count", 0),
+            "mean": v.get("sum", 0.0) / v["count"] if v.get("count") else 0.0,
+        }
+        for stage, v in stages.items()
+    }
+
+
+async def drive(args: argparse.Namespace, url: str, pid: int) -> Dict[str, Any]:
+    """
+    Warm the server up with one session, then run the measured sessions.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+        url (str): Websocket URL of the server.
+        pid (int): Process ID of the server.
+
+    Returns:
+        Dict[str, Any]: The measurements.
+    """
+    warmup = await run_session(url, -1, 1, 0.0)
+    await warmup["session"].close()
+
+    before = process_stats(pid)
+    start = time.perf_counter()
+    sessions = await asyncio.gather(
+        *(
+            run_session(url, i, args.questions, args.think_time)
+            for i in range(args.sessions)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    # Measured while every session is still connected
+    after = process_stats(pid)
+    for s in sessions:
+        await s["session"].close()
+
+    runs = sum(s["session"].script_runs for s in sessions)
+    return {
+        "wall_seconds": elapsed,
+        "script_runs": runs,
+        "reruns_per_second": runs / elapsed,
+        "answer_latency_seconds": percentiles(
+            [latency for s in sessions for latency in s["latencies"]]
+        ),
+        "server_rss_bytes": after["rss_bytes"],
+        "rss_bytes_per_session": (after["rss_bytes"] - before["rss_bytes"])
+        / args.sessions,
+        "cpu_seconds_per_rerun": (after["cpu_seconds"] - before["cpu_seconds"]) / runs
+        if runs
+        else 0.0,
+    }
+
+
+def main() -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--latency-median", type=float, default=1.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--think-time", type=float, default=0.0)
+    parser.add_argument("--cassette", help="replay recorded Lambda invocations")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--fuzz-sigma", type=float, default=0.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    port, metrics_port = free_port(), free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = stub_aws_env(data_dir)
+        env.update(
+            {
+                "METRICS_PORT": str(metrics_port),
+                "FAKE_LAMBDA_LATENCY_MEDIAN": str(args.latency_median),
+                "FAKE_LAMBDA_LATENCY_SIGMA": str(args.latency_sigma),
+                "FAKE_LAMBDA_ERROR_RATE": str(args.error_rate),
+            }
+        )
+        if args.cassette:
+            env.update(
+                {
+                    "LAMBDA_TRANSPORT": "replay",
+                    "CASSETTE_PATH": os.path.abspath(args.cassette),
+                    "REPLAY_TIME_SCALE": str(args.time_scale),
+                    "REPLAY_FUZZ_SIGMA": str(args.fuzz_sigma),
+                }
+            )
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "streamlit",
+                "run",
+                os.path.join("benchmarks", "fake_app.py"),
+                "--server.headless=true",
+                f"--server.port={port}",
+                "--server.fileWatcherType=none",
+            ],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            deadline = time.monotonic() + args.startup_timeout
+            while True:
+                try:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health")
+                    break
+                except OSError:
+                    if time.monotonic() > deadline or server.poll() is not None:
+                        raise RuntimeError("Streamlit server did not start")
+                    time.sleep(0.2)
+
+            url = f"ws://127.0.0.1:{port}/_stcore/stream"
+            results = asyncio.run(drive(args, url, server.pid))
+            metrics_text = urllib.request.urlopen(
+                f"http://127.0.0.1:{metrics_port}/metrics"
+            ).read().decode("utf-8")
+        finally:
+            server.terminate()
+            server.wait()
+
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    results = {
+        "commit": commit,
+        "parameters": vars(args),
+        **results,
+        "stages": stage_counts(metrics_text),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
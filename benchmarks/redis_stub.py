@@ -0,0 +1,129 @@
+"""
+Local stub of a Redis server, speaking just the commands RedisBackend uses.
+
+Keeps everything in memory, with key expiry, so the "redis://" answer
+cache backend can be exercised without a Redis installation:
+
+    python benchmarks/redis_stub.py --port 6380
+    CACHE_BACKEND_URL=redis://127.0.0.1:6380/0 streamlit run app.py
+"""
+import argparse
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+_lock = threading.Lock()
+_data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+
+
+def _encode(reply: Any) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return f"-ERR {reply}\r\n".encode("utf-8")
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode("ascii")
+    if reply == b"OK" or reply == b"PONG":
+        return b"+" + reply + b"\r\n"
+    return f"${len(reply)}\r\n".encode("ascii") + reply + b"\r\n"
+
+
+def _get(key: bytes) -> Optional[bytes]:
+    entry = _data.get(key)
+    if entry is None:
+        return None
+    if entry[1] is not None and entry[1] <= time.time():
+        del _data[key]
+        return None
+    return entry[0]
+
+
+def execute(args: List[bytes]) -> Any:
+    """
+    Run one command against the in-memory store.
+
+    Args:
+        args (List[bytes]): Command name and arguments.
+
+    Returns:
+        Any: The reply: bytes, int, None or an Exception for an error.
+    """
+    command, args = args[0].upper(), args[1:]
+    with _lock:
+        if command in (b"PING", b"AUTH", b"SELECT"):
+            return b"PONG" if command == b"PING" else b"OK"
+        if command == b"GET":
+            return _get(args[0])
+        if command == b"DEL":
+            return sum(_data.pop(key, None) is not None for key in args)
+        if command == b"INCRBY":
+            value = int(_get(args[0]) or 0) + int(args[1])
+            _data[args[0]] = (str(value).encode("ascii"), None)
+            return value
+        if command == b"SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            expires = None
+            if b"PX" in options:
+                expires = time.time() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            if b"EX" in options:
+                expires = time.time() + int(args[2 + options.index(b"EX") + 1])
+            if b"NX" in options and _get(key) is not None:
+                return None
+            _data[key] = (value, expires)
+            return b"OK"
+    return ValueError(f"unknown command '{command.decode('utf-8', 'replace')}'")
+
+
+class RedisStubHandler(socketserver.StreamRequestHandler):
+    """
+    Serves RESP commands on one connection until the client closes it.
+    """
+
+    def handle(self) -> None:
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            try:
+                reply = execute(args)
+            except (IndexError, ValueError) as e:
+                reply = e
+            self.wfile.write(_encode(reply))
+
+
+def serve(host: str = "127.0.0.1", port: int = 6380) -> socketserver.TCPServer:
+    """
+    Create the stub server; call serve_forever() on it to run it.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on, 0 for any free port.
+
+    Returns:
+        socketserver.TCPServer: The server.
+    """
+    server = socketserver.ThreadingTCPServer((host, port), RedisStubHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    server = serve(args.host, args.port)
+    print(f"Redis stub listening on redis://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Startup benchmark for app.py.
+
+Measures, in a fresh interpreter per run, the import time of the modules
+app.py depends on and the time of its first render through Streamlit's
+AppTest. AWS is stubbed: fake credentials, an unreachable endpoint and no
+identity lookup, so any AWS call made during startup shows up as a failure
+instead of silently adding network latency.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+import connections, config, styles, utils, cache, similarity
+t1 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60)
+t2 = time.perf_counter()
+at.run()
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_seconds": t1 - t0,
+    "first_render_seconds": t3 - t2,
+    "boto3_imported": __import__("sys").modules.get("boto3") is not None,
+    "exception": [str(e.value) for e in at.exception],
+}))
+"""
+
+
+def stub_aws_env(data_dir: str) -> Dict[str, str]:
+    """
+    Build the environment of a benchmark run.
+
+    Args:
+        data_dir (str): Directory for the spool and the near-duplicate index.
+
+    Returns:
+        Dict[str, str]: Environment with AWS stubbed out.
+    """
+    env = dict(os.environ)
+    env.update(
+        {
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ENDPOINT_URL": "http://127.0.0.1:9",
+            "SKIP_IDENTITY_LOOKUP": "true",
+            "AWS_PREWARM_CONNECTIONS": "0",
+            "METRICS_PORT": "0",
+            "METRICS_EMF_ENABLED": "false",
+            "SPOOL_DIR": os.path.join(data_dir, "spool"),
+            "CHAT_ARCHIVE_DIR": os.path.join(data_dir, "chat_archive"),
+            "NEAR_DUP_INDEX_PATH": os.path.join(data_dir, "near_duplicates.jsonl.gz"),
+        }
+    )
+    return env
+
+
+def run_once(env: Dict[str, str]) -> Dict[str, float]:
+    """
+    Run one measurement in a fresh interpreter.
+
+    Args:
+        env (Dict[str, str]): Environment of the child process.
+
+    Returns:
+        Dict[str, float]: The child's measurements.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """
+    Summarize the measurements of a metric.
+
+    Args:
+        values (List[float]): One value per run.
+
+    Returns:
+        Dict[str, float]: min, median and max.
+    """
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values),
+    }
+
+
+def main() -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = stub_aws_env(data_dir)
+        runs = [run_once(env) for _ in range(args.runs)]
+
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    results = {
+        "commit": commit,
+        "runs": args.runs,
+        "import_seconds": summarize([run["import_seconds"] for run in runs]),
+        "first_render_seconds": summarize(
+            [run["first_render_seconds"] for run in runs]
+        ),
+        "boto3_imported_at_startup": any(run["boto3_imported"] for run in runs),
+        "exceptions": sorted({e for run in runs for e in run["exception"]}),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Asset build stage.
+
+Copies every file under config.ASSETS_DIR into config.STATIC_DIR with a
+content-hashed filename and writes the manifest that config.py and styles.py
+use to emit static URLs instead of inline data URIs. With --optimize, fonts
+and images go through optimize_assets.py first and the build fails if the
+page exceeds config.PAGE_BYTE_BUDGET.
+
+Usage:
+    python build_assets.py [--optimize]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+from typing import Any, Dict
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES: Dict[str, str] = {
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+}
+
+
+def fingerprinted_name(rel_path: str, digest: str) -> str:
+    """
+    Build a URL-safe, content-hashed filename for an asset.
+
+    Args:
+        rel_path (str): Path of the asset relative to the assets directory.
+        digest (str): Hex digest of the asset content.
+
+    Returns:
+        str: Relative path of the fingerprinted copy, e.g.
+            "img/mascota-labstat.1a2b3c4d5e.png".
+    """
+    directory, filename = os.path.split(rel_path)
+    stem, ext = os.path.splitext(filename)
+    slug = re.sub(r"[^a-z0-9_-]+", "-", stem.lower()).strip("-")
+    return "/".join(part for part in (directory, f"{slug}.{digest[:10]}{ext}") if part)
+
+
+def write_asset(
+    static_dir: str, rel_path: str, data: bytes, ext: str
+) -> Dict[str, Any]:
+    """
+    Write one fingerprinted asset and return its manifest entry.
+
+    Args:
+        static_dir (str): Output directory.
+        rel_path (str): Path of the source asset relative to the assets directory.
+        data (bytes): Content to write.
+        ext (str): Extension of the written file, including the dot.
+
+    Returns:
+        Dict[str, Any]: The manifest entry for the written file.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    stem = os.path.splitext(rel_path)[0]
+    name = fingerprinted_name(stem + ext, digest)
+    target = os.path.join(static_dir, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if not os.path.exists(target):
+        with open(target, "wb") as f:
+            f.write(data)
+    return {
+        "file": name,
+        "mime": MIME_TYPES.get(ext.lower(), "application/octet-stream"),
+        "bytes": len(data),
+        "sha256": digest,
+    }
+
+
+def build(
+    assets_dir: str = config.ASSETS_DIR,
+    static_dir: str = config.STATIC_DIR,
+    optimize: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Copy the assets into the static directory and write the manifest.
+
+    Fingerprinted files from a previous build that are no longer referenced
+    are removed.
+
+    Args:
+        assets_dir (str): Directory with the source assets.
+        static_dir (str): Output directory served by Streamlit.
+        optimize (bool): Subset fonts and resample images before writing.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The new manifest.
+    """
+    os.makedirs(static_dir, exist_ok=True)
+    manifest_path = os.path.join(static_dir, os.path.basename(config.STATIC_MANIFEST))
+    previous = config.load_asset_manifest(manifest_path)
+    manifest: Dict[str, Dict[str, Any]] = {}
+
+    for root, _, files in os.walk(assets_dir):
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            rel_path = os.path.relpath(source, assets_dir).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            if optimize:
+                import optimize_assets
+
+                variants = optimize_assets.optimize(rel_path, data)
+            else:
+                variants = [("", os.path.splitext(filename)[1], data)]
+
+            entry: Dict[str, Any] = {}
+            for variant, ext, content in variants:
+                if not variant:
+                    entry.update(write_asset(static_dir, rel_path, content, ext))
+                    continue
+                stem = os.path.splitext(rel_path)[0]
+                extra = write_asset(static_dir, f"{stem}@{variant}{ext}", content, ext)
+                entry[f"file_{variant}"] = extra["file"]
+                entry[f"bytes_{variant}"] = extra["bytes"]
+            manifest[rel_path] = entry
+            logger.info(f"{rel_path} -> {entry['file']}")
+
+    referenced = {
+        value
+        for entry in manifest.values()
+        for key, value in entry.items()
+        if key.startswith("file")
+    }
+    for entry in previous.values():
+        for key, value in entry.items():
+            if key.startswith("file") and value not in referenced:
+                try:
+                    os.remove(os.path.join(static_dir, value))
+                except OSError:
+                    pass
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def main() -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--assets-dir", default=config.ASSETS_DIR)
+    parser.add_argument("--static-dir", default=config.STATIC_DIR)
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="subset fonts, resample images and enforce the page byte budget",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("fontTools").setLevel(logging.WARNING)
+    manifest = build(args.assets_dir, args.static_dir, optimize=args.optimize)
+    total = sum(entry["bytes"] for entry in manifest.values())
+    logger.info(f"Wrote {len(manifest)} assets ({total} bytes) to {args.static_dir}")
+
+    if args.optimize:
+        import optimize_assets
+
+        within_budget, report = optimize_assets.budget_report(manifest)
+        for line in report:
+            logger.info(line)
+        if not within_budget:
+            logger.error("Page byte budget exceeded")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
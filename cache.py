@@ -0,0 +1,476 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from base64 import b64encode
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import config
+from shared_cache import CacheBackend, RedisError, create_backend
+
+
+class AssetCache:
+    """
+    Process-wide cache of base64 encoded assets and rendered style blocks.
+
+    Entries are keyed by the SHA-256 digest of the files they depend on, so
+    identical content is only encoded once. A file is re-hashed only when its
+    mtime or size changes. The cache is bounded by the total size of the
+    cached strings and evicts the least recently used entries first.
+    """
+
+    def __init__(self, max_bytes: int = config.ASSET_CACHE_MAX_BYTES):
+        """
+        Initialize the AssetCache.
+
+        Args:
+            max_bytes (int): Maximum total size of the cached strings.
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, ...], str]" = OrderedDict()
+        self._fingerprints: Dict[str, Tuple[int, int, str]] = {}
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def fingerprint(self, path: str) -> str:
+        """
+        Return the content digest of a file, re-hashing it only if its mtime
+        or size changed since the last call.
+
+        Args:
+            path (str): Path to the file.
+
+        Returns:
+            str: Hex SHA-256 digest of the file content.
+        """
+        stat = os.stat(path)
+        with self._lock:
+            known = self._fingerprints.get(path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            self._fingerprints[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def get_base64(self, path: str) -> str:
+        """
+        Return the base64 encoded content of a file.
+
+        Args:
+            path (str): Path to the binary file.
+
+        Returns:
+            str: Base64 encoded string of the file content.
+        """
+        key = ("b64", self.fingerprint(path))
+        value = self._get(key)
+        if value is None:
+            with open(path, "rb") as f:
+                value = b64encode(f.read()).decode()
+            self._put(key, value)
+        return value
+
+    def render(
+        self,
+        name: str,
+        render: Callable[..., str],
+        asset_paths: Iterable[str] = (),
+        resolve: Optional[Callable[[str], str]] = None,
+    ) -> str:
+        """
+        Return a rendered style/HTML block, rendering it only on a miss.
+
+        The renderer is called with one resolved value per asset path, in
+        order, and its result is cached under the digests of those assets.
+
+        Args:
+            name (str): Name identifying the block.
+            render (Callable[..., str]): Function that builds the block.
+            asset_paths (Iterable[str]): Assets the block embeds.
+            resolve (Optional[Callable[[str], str]]): Maps an asset path to the
+                value passed to the renderer. Defaults to its base64 content.
+
+        Returns:
+            str: The rendered block.
+        """
+        resolve = resolve or self.get_base64
+        asset_paths = tuple(asset_paths)
+        key = (name,) + tuple(self.fingerprint(path) for path in asset_paths)
+        value = self._get(key)
+        if value is None:
+            value = render(*(resolve(path) for path in asset_paths))
+            self._put(key, value)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return hit/miss counters and current memory usage.
+
+        Returns:
+            Dict[str, int]: The cache statistics.
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self) -> None:
+        """
+        Drop every cached entry and fingerprint.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._fingerprints.clear()
+            self._size = 0
+
+    def _get(self, key: Tuple[str, ...]):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def _put(self, key: Tuple[str, ...], value: str) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._evictions += 1
+
+
+class AnswerCache:
+    """
+    Bounded LRU cache of agent answers with a time-to-live.
+
+    Keys are normalized queries (see normalize_query). The cache is bounded
+    by the UTF-8 size of its keys and answers, and expired entries are
+    dropped when they are read or when room is needed.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = config.ANSWER_CACHE_MAX_BYTES,
+        ttl_seconds: float = config.ANSWER_CACHE_TTL_SECONDS,
+    ):
+        """
+        Initialize the AnswerCache.
+
+        Args:
+            max_bytes (int): Maximum total size of the cached keys and answers.
+            ttl_seconds (float): Seconds an answer stays valid.
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached answer for a key, if present and not expired.
+
+        Args:
+            key (str): The normalized query.
+
+        Returns:
+            Optional[str]: The answer, or None on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: str, answer: str) -> None:
+        """
+        Cache an answer, evicting expired and then least recently used entries
+        until it fits.
+
+        Args:
+            key (str): The normalized query.
+            answer (str): The answer to cache.
+        """
+        size = len(key.encode("utf-8")) + len(answer.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self._size + size > self.max_bytes:
+                for expired in [k for k, e in self._entries.items() if e[1] <= now]:
+                    self._remove(expired)
+            while self._size + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+            self._entries[key] = (answer, now + self.ttl_seconds, size)
+            self._size += size
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return hit/miss counters, hit rate and current memory usage.
+
+        Returns:
+            Dict[str, float]: The cache statistics.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self) -> None:
+        """
+        Drop every cached answer.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._size -= size
+
+
+class SharedAnswerCache:
+    """
+    Answer cache kept in a CacheBackend, with the interface of AnswerCache.
+
+    With a shared backend every process reuses the others' answers, and the
+    hit and miss counters add up across them. It also coordinates identical
+    questions across processes: the first to claim() a question asks the
+    agent, the others wait() for its answer to appear. A failing backend is
+    logged and treated as a miss.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttl_seconds: float = config.ANSWER_CACHE_TTL_SECONDS,
+        prefix: str = config.CACHE_KEY_PREFIX,
+    ):
+        """
+        Initialize the SharedAnswerCache.
+
+        Args:
+            backend (CacheBackend): Where answers and counters are stored.
+            ttl_seconds (float): Seconds an answer stays valid.
+            prefix (str): Prefix of every key, to share a server with other
+                applications.
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached answer for a key, if present and not expired.
+
+        Args:
+            key (str): The normalized query.
+
+        Returns:
+            Optional[str]: The answer, or None on a miss.
+        """
+        try:
+            answer = self.backend.get(f"{self.prefix}answer:{key}")
+            outcome = "misses" if answer is None else "hits"
+            self.backend.incr(f"{self.prefix}stats:{outcome}")
+            return answer
+        except (OSError, RedisError, sqlite3.Error) as e:
+            logging.error(f"Error reading the answer cache: {e}")
+            return None
+
+    def put(self, key: str, answer: str) -> None:
+        """
+        Cache an answer.
+
+        Args:
+            key (str): The normalized query.
+            answer (str): The answer to cache.
+        """
+        try:
+            self.backend.set(f"{self.prefix}answer:{key}", answer, self.ttl_seconds)
+        except (OSError, RedisError, sqlite3.Error) as e:
+            logging.error(f"Error writing the answer cache: {e}")
+
+    def claim(self, key: str, ttl: float = config.INVOKE_TIMEOUT_SECONDS) -> bool:
+        """
+        Claim the right to ask the agent a question, unless another process
+        holds it.
+
+        Args:
+            key (str): The normalized query.
+            ttl (float): Seconds after which the claim lapses, should its
+                holder never release it.
+
+        Returns:
+            bool: True if claimed, or if the backend is unavailable.
+        """
+        try:
+            return self.backend.add(f"{self.prefix}flight:{key}", "1", ttl)
+        except (OSError, RedisError, sqlite3.Error) as e:
+            logging.error(f"Error claiming a shared flight: {e}")
+            return True
+
+    def release(self, key: str) -> None:
+        """
+        Release a claim taken with claim().
+
+        Args:
+            key (str): The normalized query.
+        """
+        try:
+            self.backend.delete(f"{self.prefix}flight:{key}")
+        except (OSError, RedisError, sqlite3.Error) as e:
+            logging.error(f"Error releasing a shared flight: {e}")
+
+    def wait(
+        self,
+        key: str,
+        cancel_event: Optional[threading.Event] = None,
+        timeout: float = config.INVOKE_TIMEOUT_SECONDS,
+    ) -> Optional[str]:
+        """
+        Wait for the process holding the claim on a question to answer it.
+
+        Args:
+            key (str): The normalized query.
+            cancel_event (Optional[threading.Event]): Stops waiting when set.
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            Optional[str]: The answer, or None if the claim was released or
+                lapsed without one, or the wait was cancelled.
+        """
+        start = time.monotonic()
+        cancel_event = cancel_event or threading.Event()
+        while time.monotonic() - start < timeout:
+            if cancel_event.wait(config.CACHE_FLIGHT_POLL_SECONDS):
+                return None
+            try:
+                answer = self.backend.get(f"{self.prefix}answer:{key}")
+                if answer is not None:
+                    self.backend.incr(f"{self.prefix}stats:shared_flights")
+                    return answer
+                if self.backend.get(f"{self.prefix}flight:{key}") is None:
+                    return None
+            except (OSError, RedisError, sqlite3.Error) as e:
+                logging.error(f"Error waiting for a shared flight: {e}")
+                return None
+        return None
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return hit/miss counters and the hit rate, across every process
+        sharing the backend.
+
+        Returns:
+            Dict[str, float]: The cache statistics.
+        """
+        try:
+            hits, misses, shared_flights = (
+                self.backend.counter(f"{self.prefix}stats:{name}")
+                for name in ("hits", "misses", "shared_flights")
+            )
+        except (OSError, RedisError, sqlite3.Error) as e:
+            logging.error(f"Error reading answer cache counters: {e}")
+            return {}
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "shared_flights": shared_flights,
+            "backend": type(self.backend).__name__,
+        }
+
+
+_SESSION_DEPENDENT = re.compile(
+    r"\b(" + "|".join(config.SESSION_DEPENDENT_WORDS) + r")\b"
+    r"|^[\s¿¡]*(" + "|".join(config.SESSION_DEPENDENT_PREFIXES) + r")\b",
+    re.IGNORECASE,
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query into an answer cache key.
+
+    Applies Unicode NFC, lowercases, strips surrounding punctuation such as
+    "¿" and "?" and collapses whitespace.
+
+    Args:
+        query (str): The user's query.
+
+    Returns:
+        str: The cache key.
+    """
+    query = unicodedata.normalize("NFC", query).lower()
+    query = re.sub(r"\s+", " ", query)
+    return query.strip(" ¿?¡!.,;:")
+
+
+def is_cacheable(query: str) -> bool:
+    """
+    Whether an answer to the query can be reused for other turns.
+
+    Queries that refer back to the conversation ("¿y en el año anterior?",
+    "repite eso") depend on the session's context and are never cached.
+    Polite phrasings of standalone questions ("¿me puedes decir...?") are
+    cacheable.
+
+    Args:
+        query (str): The user's query.
+
+    Returns:
+        bool: False if the query looks session-dependent.
+    """
+    return _SESSION_DEPENDENT.search(query) is None
+
+
+asset_cache = AssetCache()
+answer_cache = SharedAnswerCache(create_backend())
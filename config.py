@@ -1,4 +1,6 @@
-from typing import Dict, List
+import json
+import os
+from typing import Any, Dict, FrozenSet, List
 
 # Assets
 ASSETS_DIR: str = "./assets"
@@ -16,6 +18,309 @@ IMG_LOGO_INEI: str = f"{IMG_DIR}/Logotipo-INEI.png"
 IMG_LOGO_LABSTAT: str = f"{IMG_DIR}/Logo de Labstat.png"
 IMG_BACKGROUND: str = f"{IMG_DIR}/Placa circuito.png"
 
+# Static assets (fingerprinted copies written by build_assets.py)
+STATIC_DIR: str = "./static"
+STATIC_URL: str = "app/static"
+STATIC_MANIFEST: str = f"{STATIC_DIR}/manifest.json"
+
+
+def load_asset_manifest(path: str = STATIC_MANIFEST) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the static asset manifest.
+
+    Args:
+        path (str): Path to the manifest file.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Entries keyed by path relative to ASSETS_DIR,
+            or an empty dict if the assets have not been built.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+ASSET_MANIFEST: Dict[str, Dict[str, Any]] = load_asset_manifest()
+
+# Asset optimization (build_assets.py --optimize)
+FONT_SUBSET_TEXT: str = (
+    " !\"#$%&'()*+,-./0123456789:;<=>?@"
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+    "¡¿«»°ºª·ÁÉÍÓÚÜÑáéíóúüñ–—‘’“”…€"
+)
+# Rendered CSS width of each image; a 2x version is built as well
+IMG_RENDER_WIDTHS: Dict[str, int] = {
+    IMG_MASCOTA: 140,
+    IMG_LOGO_INEI: 72,  # 44px high in the footer
+    IMG_LOGO_LABSTAT: 115,  # 30px high in the footer
+    IMG_BACKGROUND: 960,  # Covers the page under a 90% white overlay
+}
+PAGE_BYTE_BUDGET: int = 1024 * 1024
+
+# DynamoDB write-behind (write_behind.py)
+WRITE_BEHIND_ENABLED: bool = (
+    os.environ.get("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+)
+WRITE_BEHIND_FLUSH_SECONDS: float = 1.0
+WRITE_BEHIND_MAX_QUEUE: int = 10000
+WRITE_BEHIND_MAX_RETRIES: int = 8
+WRITE_BEHIND_DRAIN_SECONDS: float = 10.0
+# Items DynamoDB rejected, or still unprocessed after the retries, as JSON lines
+WRITE_BEHIND_DEAD_LETTER_PATH: str = os.environ.get(
+    "WRITE_BEHIND_DEAD_LETTER_PATH", "./data/dynamodb-dead-letter.log"
+)
+
+# Event spool for feedback and other fire-and-forget events (spool.py). One
+# process writes SPOOL_DIR; others sharing it get a slot-<n> subdirectory
+SPOOL_DIR: str = os.environ.get("SPOOL_DIR", "./data/spool")
+SPOOL_SEGMENT_BYTES: int = 1024 * 1024
+SPOOL_MAX_BYTES: int = 64 * 1024 * 1024
+SPOOL_FSYNC_SECONDS: float = 0.2
+# Delivery attempts before an event is moved to the dead-letter file
+SPOOL_MAX_ATTEMPTS: int = int(os.environ.get("SPOOL_MAX_ATTEMPTS", "10"))
+
+# Chat history (history.py): messages rendered on every rerun; older ones
+# are archived to disk in pages and loaded with "show earlier messages"
+CHAT_HISTORY_WINDOW: int = int(os.environ.get("CHAT_HISTORY_WINDOW", "20"))
+CHAT_HISTORY_PAGE_SIZE: int = 20
+CHAT_ARCHIVE_DIR: str = os.environ.get("CHAT_ARCHIVE_DIR", "./data/chat_archive")
+CHAT_ARCHIVE_MAX_AGE_SECONDS: float = 24 * 3600
+CHAT_ARCHIVE_PRUNE_SECONDS: float = 3600
+# Sessions can be resumed after a refresh, reconnect or task replacement
+# from the token kept in this URL query parameter: the most recent
+# CHAT_RESUME_PAGE_SIZE exchanges are read back from conversationHistory at
+# once, earlier ones page by page with "show earlier messages"
+CHAT_RESUME_ENABLED: bool = (
+    os.environ.get("CHAT_RESUME_ENABLED", "true").lower() == "true"
+)
+CHAT_RESUME_QUERY_PARAM: str = "session"
+CHAT_RESUME_PAGE_SIZE: int = 10
+# Whether getAgentResponse writes the exchanges it answers to
+# conversationHistory. The app writes every other exchange: cached answers,
+# shared flights, fallbacks and the "bedrock" backend's answers
+AGENT_WRITES_HISTORY: bool = (
+    os.environ.get("AGENT_WRITES_HISTORY", "true").lower() == "true"
+)
+
+# Caching
+ASSET_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+ANSWER_CACHE_MAX_BYTES: int = int(
+    os.environ.get("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024))
+)
+ANSWER_CACHE_TTL_SECONDS: float = float(
+    os.environ.get("ANSWER_CACHE_TTL_SECONDS", str(6 * 60 * 60))
+)
+SESSION_ANSWER_CACHE_MAX_BYTES: int = 1024 * 1024
+# Backend of the process-wide answer cache (shared_cache.py): "memory://"
+# (this process only), "sqlite:///data/cache.db" (processes on one host) or
+# "redis://host:6379/0" (every task). Shared backends also coordinate
+# identical questions across processes.
+CACHE_BACKEND_URL: str = os.environ.get("CACHE_BACKEND_URL", "memory://")
+CACHE_BACKEND_MAX_BYTES: int = ANSWER_CACHE_MAX_BYTES
+CACHE_KEY_PREFIX: str = os.environ.get("CACHE_KEY_PREFIX", "compendium:")
+CACHE_FLIGHT_POLL_SECONDS: float = 0.25
+CACHE_SQLITE_MMAP_BYTES: int = 64 * 1024 * 1024
+CACHE_REDIS_POOL_SIZE: int = 16
+CACHE_REDIS_TIMEOUT_SECONDS: float = float(
+    os.environ.get("CACHE_REDIS_TIMEOUT_SECONDS", "0.5")
+)
+# Queries containing these words refer back to the conversation and are not cached
+SESSION_DEPENDENT_WORDS: List[str] = [
+    "anterior(es)?",
+    "anteriormente",
+    "dijiste",
+    "mencionaste",
+    "eso",
+    "esa",
+    "ese",
+    "esos",
+    "esas",
+    "lo mismo",
+    "la misma",
+    "el mismo",
+    "otra vez",
+]
+# ... and so do queries starting with one of these ("¿Y en Cusco?")
+SESSION_DEPENDENT_PREFIXES: List[str] = ["y", "e", "pero"]
+
+# Near-duplicate question index (similarity.py)
+NEAR_DUP_INDEX_PATH: str = os.environ.get(
+    "NEAR_DUP_INDEX_PATH", "./data/near_duplicates.jsonl.gz"
+)
+NEAR_DUP_THRESHOLD: float = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.85"))
+# Questions with at most this many content tokens only match identical ones:
+# in "hogares pobres extremos en Lima" every word changes the statistic
+NEAR_DUP_EXACT_MAX_TOKENS: int = 6
+# A question with one of these never matches a question without it
+NEAR_DUP_NEGATIONS: FrozenSet[str] = frozenset(
+    ["no", "sin", "ni", "nunca", "tampoco", "excepto", "salvo"]
+)
+NEAR_DUP_MAX_ENTRIES: int = 5000
+NEAR_DUP_PERMUTATIONS: int = 32
+NEAR_DUP_BANDS: int = 8
+NEAR_DUP_SEED: int = 20250101
+NEAR_DUP_SAVE_EVERY: int = 20
+# Accent-folded phrases stripped before comparing questions
+NEAR_DUP_GREETINGS: List[str] = [
+    "hola",
+    "buen dia",
+    "buenos dias",
+    "buenas tardes",
+    "buenas noches",
+    "buenas",
+    "saludos",
+    "por favor",
+    "porfa",
+    "gracias",
+    "muchas gracias",
+    "numy",
+]
+NEAR_DUP_STOPWORDS: FrozenSet[str] = frozenset(
+    """
+    a al algo algun alguna ante cada como con cual cuales cuando cuanto cuanta
+    cuantos cuantas de del desde donde dime el ella en entre era es esta este
+    estos estas fue fueron ha hay la las le lo los mas me mi necesito o para
+    podrias por puedes que quiero saber se segun ser si sobre su sus tasa tiene
+    un una uno unos unas y ya cifra cifras dato datos informacion valor nivel
+    """.split()
+)
+
+# Backend
+# "lambda" asks getAgentResponse; "bedrock" calls the Bedrock agent directly
+# (bedrock-agent-runtime InvokeAgent), skipping the Lambda hop
+AGENT_BACKEND: str = os.environ.get("AGENT_BACKEND", "lambda").lower()
+BEDROCK_AGENT_ID: str = os.environ.get("BEDROCK_AGENT_ID", "")
+BEDROCK_AGENT_ALIAS_ID: str = os.environ.get("BEDROCK_AGENT_ALIAS_ID", "TSTALIASID")
+# Requires getAgentResponse to be deployed with the RESPONSE_STREAM invoke mode
+STREAMING_RESPONSES: bool = (
+    os.environ.get("STREAMING_RESPONSES", "false").lower() == "true"
+)
+INVOKE_TIMEOUT_SECONDS: float = float(
+    os.environ.get("INVOKE_TIMEOUT_SECONDS", "120")
+)
+INVOKE_MAX_WORKERS: int = int(os.environ.get("INVOKE_MAX_WORKERS", "32"))
+INVOKE_POLL_SECONDS: float = 0.5
+# Response compression offered to getAgentResponse through "accept_encoding":
+# "gzip", "zstd" (needs the zstandard package) or "none" (payload_codec.py)
+PAYLOAD_COMPRESSION: str = os.environ.get("PAYLOAD_COMPRESSION", "none").lower()
+# Synchronous Lambda payloads are limited to 6 MB each way; a warning is
+# logged past this fraction of it
+PAYLOAD_LIMIT_BYTES: int = 6 * 1024 * 1024
+PAYLOAD_WARN_RATIO: float = 0.8
+# Identical cacheable questions in flight at the same time share one call
+SINGLE_FLIGHT_ENABLED: bool = (
+    os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+)
+SINGLE_FLIGHT_MAX_WAITERS: int = int(
+    os.environ.get("SINGLE_FLIGHT_MAX_WAITERS", "100")
+)
+# Admission control of getAgentResponse calls per task (admission.py)
+ADMISSION_MAX_IN_FLIGHT: int = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "16"))
+ADMISSION_MAX_QUEUE: int = int(os.environ.get("ADMISSION_MAX_QUEUE", "200"))
+ADMISSION_MAX_WAIT_SECONDS: float = float(
+    os.environ.get("ADMISSION_MAX_WAIT_SECONDS", "30")
+)
+# Hedged invocations (resilience.py): once HEDGE_MIN_SAMPLES latencies are
+# known, a call still running after their HEDGE_PERCENTILE is sent a second
+# time. Only idempotent functions are hedged: getAgentResponse forwards every
+# call to the agent session, where a duplicate is asked as a second turn, so
+# it is hedged only if AGENT_LAMBDA_IDEMPOTENT says it drops repeated turns
+HEDGE_ENABLED: bool = os.environ.get("HEDGE_ENABLED", "false").lower() == "true"
+AGENT_LAMBDA_IDEMPOTENT: bool = (
+    os.environ.get("AGENT_LAMBDA_IDEMPOTENT", "false").lower() == "true"
+)
+HEDGE_PERCENTILE: float = 95
+HEDGE_MIN_DELAY_SECONDS: float = 1.0
+HEDGE_LATENCY_WINDOW: int = 200
+HEDGE_MIN_SAMPLES: int = 20
+# Hedges allowed per call, and how many may be saved up for a burst
+HEDGE_BUDGET_RATIO: float = float(os.environ.get("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_BURST: float = 5
+# Circuit breaker (resilience.py)
+BREAKER_FAILURE_RATE: float = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS: int = 10
+BREAKER_WINDOW_SECONDS: float = 60
+BREAKER_OPEN_SECONDS: float = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+
+# Latency metrics (metrics.py)
+METRICS_BUCKETS: List[float] = [
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120
+]
+METRICS_NAMESPACE: str = os.environ.get(
+    "METRICS_NAMESPACE", "StatisticalCompendiumAgent"
+)
+# One CloudWatch Embedded Metric Format line per answered question on stdout
+METRICS_EMF_ENABLED: bool = (
+    os.environ.get("METRICS_EMF_ENABLED", "true").lower() == "true"
+)
+# Value of the "Service" dimension of every EMF record; the deploy stack
+# sets it to the stack name so its scaling policy only sees its own tasks
+METRICS_SERVICE: str = os.environ.get("METRICS_SERVICE", "chat")
+# Load gauges (sessions, in-flight calls) are sampled every
+# METRICS_SAMPLE_SECONDS and published as one EMF line every
+# METRICS_PUBLISH_SECONDS, for autoscaling on concurrency rather than CPU
+METRICS_SAMPLE_SECONDS: float = 1.0
+METRICS_PUBLISH_SECONDS: float = float(
+    os.environ.get("METRICS_PUBLISH_SECONDS", "30")
+)
+# Prometheus text endpoint at /metrics; port 0 disables it
+METRICS_HOST: str = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT: int = int(os.environ.get("METRICS_PORT", "9464"))
+
+# AWS connection settings, shared by every OptimizedAWSClient
+# Skips the STS lookup that fills ACCOUNT_ID/AWS_REGION on first AWS use
+SKIP_IDENTITY_LOOKUP: bool = (
+    os.environ.get("SKIP_IDENTITY_LOOKUP", "false").lower() == "true"
+)
+AWS_MAX_POOL_CONNECTIONS: int = int(
+    os.environ.get("AWS_MAX_POOL_CONNECTIONS", str(INVOKE_MAX_WORKERS + 8))
+)
+AWS_CONNECT_TIMEOUT: float = float(os.environ.get("AWS_CONNECT_TIMEOUT", "3"))
+AWS_LAMBDA_READ_TIMEOUT: float = float(
+    os.environ.get("AWS_LAMBDA_READ_TIMEOUT", str(INVOKE_TIMEOUT_SECONDS))
+)
+AWS_DYNAMODB_READ_TIMEOUT: float = float(
+    os.environ.get("AWS_DYNAMODB_READ_TIMEOUT", "5")
+)
+AWS_TCP_KEEPALIVE: bool = (
+    os.environ.get("AWS_TCP_KEEPALIVE", "true").lower() == "true"
+)
+AWS_RETRY_MODE: str = os.environ.get("AWS_RETRY_MODE", "adaptive")
+AWS_MAX_ATTEMPTS: int = int(os.environ.get("AWS_MAX_ATTEMPTS", "3"))
+# Connections opened per client at startup; 0 disables pre-warming
+AWS_PREWARM_CONNECTIONS: int = int(
+    os.environ.get("AWS_PREWARM_CONNECTIONS", "0")
+)
+
+# Lambda transport (transport.py): "aws" calls Lambda, "record" also writes
+# every invocation to CASSETTE_PATH, "replay" answers from it without AWS
+LAMBDA_TRANSPORT: str = os.environ.get("LAMBDA_TRANSPORT", "aws").lower()
+CASSETTE_PATH: str = os.environ.get("CASSETTE_PATH", "invocations.jsonl.gz")
+# Replayed latency multiplier: 1 keeps the recorded timing, 0 replies instantly
+REPLAY_TIME_SCALE: float = float(os.environ.get("REPLAY_TIME_SCALE", "1"))
+# Sigma of log-normal noise applied to replayed latencies; 0 disables it
+REPLAY_FUZZ_SIGMA: float = float(os.environ.get("REPLAY_FUZZ_SIGMA", "0"))
+
+# Keep-warm scheduler for getAgentResponse (warmer.py)
+WARMER_ENABLED: bool = os.environ.get("WARMER_ENABLED", "false").lower() == "true"
+# getAgentResponse should return early when the body carries "warmup"
+WARMER_PAYLOAD: Dict[str, Any] = {"body": {"warmup": True}}
+WARMER_INTERVAL_SECONDS: float = float(
+    os.environ.get("WARMER_INTERVAL_SECONDS", "240")
+)
+WARMER_MAX_INTERVAL_SECONDS: float = 3600
+# Traffic within this window already keeps instances warm; the first warm-up
+# is sent once the function has been idle this long, then one per interval
+WARMER_IDLE_SECONDS: float = float(os.environ.get("WARMER_IDLE_SECONDS", "300"))
+# After this long without traffic the interval backs off exponentially
+WARMER_MAX_IDLE_SECONDS: float = float(
+    os.environ.get("WARMER_MAX_IDLE_SECONDS", "7200")
+)
+WARMER_MIN_CONCURRENCY: int = int(os.environ.get("WARMER_MIN_CONCURRENCY", "1"))
+WARMER_MAX_CONCURRENCY: int = int(os.environ.get("WARMER_MAX_CONCURRENCY", "4"))
+
 # Avatars
 AVATAR: Dict[str, str] = {
     "user": "https://api.dicebear.com/7.x/notionists-neutral/svg?seed=Felix",
@@ -33,3 +338,18 @@ GREETINGS: List[str] = [
     "👋 ¡Hola! Soy tu asistente. ¿Listo/a?",
     "🚀 ¡A despegar! ¿Qué consultamos?",
 ]
+# Prefix of every answer shown in the chat
+ANSWER_PREFIX: str = "**Respuesta**: \n\n"
+# Shown before an answer served from the near-duplicate index
+NEAR_DUP_ANSWER_NOTICE: str = (
+    "_Respuesta para una pregunta similar: «{matched_query}»._\n\n"
+)
+# Shown before an expired answer served while the agent is unavailable
+STALE_ANSWER_NOTICE: str = (
+    "_El servicio no está disponible en este momento. Esta respuesta es del "
+    "{answered_at} y respondía a la pregunta «{matched_query}»._\n\n"
+)
+BUSY_MESSAGE: str = (
+    "Hola, en este momento hay muchas consultas en curso. "
+    "¡Inténtalo de nuevo en unos segundos por favor!"
+)
@@ -1,20 +1,106 @@
+import base64
+import codecs
 import logging
 import os
 import json
-import boto3
-from botocore.config import Config
-from typing import Dict, Any, Optional
+import re
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 import streamlit as st
+from streamlit import runtime
 
-# Initialize session
-session = boto3.Session()
+import config
+from admission import AdmissionController
+from metrics import concurrency_metrics, stage_metrics, start_metrics_server
+from payload_codec import PayloadCodec
+from resilience import CircuitBreaker, HedgeBudget, LatencyTracker
+from single_flight import SingleFlight
+from spool import EventSpool
+from transport import Cassette, RecordingTransport, ReplayTransport
+from warmer import LambdaWarmer
+from write_behind import WriteBehindBuffer
 
-# Set environment variables if not present
-if os.environ.get("ACCOUNT_ID") is None:
-    os.environ["ACCOUNT_ID"] = (
-        session.client("sts").get_caller_identity().get("Account")
-    )
-    os.environ["AWS_REGION"] = session.region_name
+# boto3 and botocore are imported on first use: they account for most of the
+# import time of this module, and nothing below needs AWS until a client is used
+_session = None
+_session_lock = threading.Lock()
+_client_creation_lock = threading.Lock()
+_boto_configs: Dict[str, Any] = {}
+
+
+def get_session() -> Any:
+    """
+    Get the boto3 session shared by every client, creating it on first use.
+
+    The first call also resolves the account identity (see resolve_identity).
+
+    Returns:
+        boto3.Session: The shared session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import boto3
+
+            _session = boto3.Session()
+            resolve_identity(_session)
+        return _session
+
+
+def resolve_identity(session: Any) -> None:
+    """
+    Set the ACCOUNT_ID and AWS_REGION environment variables if not present.
+
+    The STS call is skipped when ACCOUNT_ID is already set or when
+    config.SKIP_IDENTITY_LOOKUP is enabled, and a failed lookup is logged
+    rather than raised, so the app can start offline.
+
+    Args:
+        session (boto3.Session): Session used for the STS call.
+    """
+    if os.environ.get("ACCOUNT_ID") is not None or config.SKIP_IDENTITY_LOOKUP:
+        return
+    try:
+        os.environ["ACCOUNT_ID"] = (
+            session.client("sts").get_caller_identity().get("Account")
+        )
+        os.environ["AWS_REGION"] = session.region_name
+    except Exception as e:
+        logging.error(f"Error resolving AWS identity: {e}")
+
+
+def get_boto_config(service: str) -> Any:
+    """
+    Get the tuned botocore Config for a service.
+
+    DynamoDB calls are short, agent invocations are not, so DynamoDB gets its
+    own read timeout.
+
+    Args:
+        service (str): "lambda", "agent" or "dynamodb".
+
+    Returns:
+        botocore.config.Config: The shared Config instance.
+    """
+    if service not in _boto_configs:
+        from botocore.config import Config
+
+        base = Config(
+            max_pool_connections=config.AWS_MAX_POOL_CONNECTIONS,
+            connect_timeout=config.AWS_CONNECT_TIMEOUT,
+            read_timeout=config.AWS_LAMBDA_READ_TIMEOUT,
+            tcp_keepalive=config.AWS_TCP_KEEPALIVE,
+            retries={
+                "mode": config.AWS_RETRY_MODE,
+                "max_attempts": config.AWS_MAX_ATTEMPTS,
+            },
+        )
+        if service == "dynamodb":
+            base = base.merge(Config(read_timeout=config.AWS_DYNAMODB_READ_TIMEOUT))
+        _boto_configs[service] = base
+    return _boto_configs[service]
 
 
 class OptimizedAWSClient:
@@ -28,38 +114,145 @@ class OptimizedAWSClient:
         aws_resource_name: str,
         aws_resource_type: str,
         region_name: str = "us-east-1",
+        executor: Optional[ThreadPoolExecutor] = None,
+        codec: Optional[PayloadCodec] = None,
+        idempotent: bool = False,
     ):
         """
         Initialize the OptimizedAWSClient.
 
         Args:
             region_name (str): AWS region name. Defaults to "us-east-1".
-            aws_resource_name (str): Name of the AWS resource.
-            aws_resource_type (str): Type of the AWS resource.
+            aws_resource_name (str): Name of the AWS resource. For a Bedrock
+                agent, "{AgentId}/{AgentAliasId}".
+            aws_resource_type (str): Type of the AWS resource: "lambda",
+                "agent" (Bedrock Agent Runtime) or "dynamodb".
+            executor (Optional[ThreadPoolExecutor]): Executor used by
+                invoke_future. Defaults to the shared invocation executor.
+            codec (Optional[PayloadCodec]): Encodes Lambda payloads and
+                decodes responses. Defaults to a PayloadCodec configured from
+                config.PAYLOAD_COMPRESSION.
+            idempotent (bool): Whether invoking the Lambda function twice with
+                the same payload is harmless. Only then are slow calls hedged.
 
         Raises:
-            ValueError: If the resource type is not 'lambda' or 'dynamodb'.
+            ValueError: If the resource type is not 'lambda', 'agent' or
+                'dynamodb', or if an agent's ID or alias ID is malformed.
         """
         self.region_name = region_name
         self._aws_resource_name = aws_resource_name
         self._aws_resource_type = aws_resource_type
-        if self._aws_resource_type == "lambda":
-            self._client = boto3.Session(region_name=self.region_name).client("lambda")
-        elif self._aws_resource_type == "dynamodb":
-            self._client = boto3.resource("dynamodb").Table(self._aws_resource_name)
-        else:
+        self._executor = executor
+        self.codec = codec or PayloadCodec()
+        self.idempotent = idempotent and aws_resource_type == "lambda"
+        self._client: Any = None
+        self._client_lock = threading.Lock()
+        self._write_buffer: Optional[WriteBehindBuffer] = None
+        self.warmer: Optional[LambdaWarmer] = None
+        self.single_flight = SingleFlight()
+        self.admission = AdmissionController()
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.hedge_budget = HedgeBudget()
+        self._hedge_lock = threading.Lock()
+        self._hedge_metrics = {"calls": 0, "hedges": 0, "hedge_wins": 0, "denied": 0}
+        if self._aws_resource_type not in ("lambda", "agent", "dynamodb"):
             raise ValueError("Invalid resource type.")
+        if self._aws_resource_type == "agent":
+            _check_agent(aws_resource_name)
 
     @property
     def client(self) -> Any:
         """
-        Lazy initialization of the boto3 Lambda client.
+        Lazy initialization of the boto3 Lambda client or DynamoDB Table.
         """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
         return self._client
 
+    def _create_client(self) -> Any:
+        if self._aws_resource_type == "lambda" and config.LAMBDA_TRANSPORT == "replay":
+            return ReplayTransport(Cassette(config.CASSETTE_PATH))
+        session = get_session()
+        # boto3 sessions are not thread-safe while creating clients, and the
+        # lambda, agent and dynamodb clients are built lazily from any thread
+        with _client_creation_lock:
+            if self._aws_resource_type == "lambda":
+                client = session.client(
+                    "lambda",
+                    region_name=self.region_name,
+                    config=get_boto_config("lambda"),
+                )
+            elif self._aws_resource_type == "agent":
+                # AWS_ENDPOINT_URL_BEDROCK_AGENT_RUNTIME points it at a local stub
+                client = session.client(
+                    "bedrock-agent-runtime",
+                    region_name=self.region_name,
+                    config=get_boto_config("agent"),
+                )
+            else:
+                client = session.resource(
+                    "dynamodb", config=get_boto_config("dynamodb")
+                ).Table(self._aws_resource_name)
+        if self._aws_resource_type == "lambda":
+            if config.LAMBDA_TRANSPORT == "record":
+                return RecordingTransport(client, Cassette(config.CASSETTE_PATH))
+            return client
+        if self._aws_resource_type == "agent":
+            return client
+        if config.WRITE_BEHIND_ENABLED:
+            self._write_buffer = WriteBehindBuffer(
+                client.meta.client, self._aws_resource_name
+            )
+            stage_metrics.source("write_behind", self._write_buffer.metrics)
+        return client
+
+    def prewarm(self, connections: int = config.AWS_PREWARM_CONNECTIONS) -> None:
+        """
+        Open pooled connections ahead of the first real request.
+
+        Issues concurrent, cheap read-only calls so that DNS resolution and
+        TLS handshakes happen before a user is waiting. Errors (including
+        AccessDenied) are ignored, since the connection is established
+        either way.
+
+        Args:
+            connections (int): Number of connections to open.
+        """
+        if self._aws_resource_type == "agent":
+            # Bedrock Agent Runtime has no cheap read-only call to warm with
+            return
+        if self._aws_resource_type == "lambda":
+            client = self.client
+
+            def call() -> Any:
+                return client.get_function_configuration(
+                    FunctionName=self._aws_resource_name
+                )
+
+        else:
+            client = self.client.meta.client
+
+            def call() -> Any:
+                return client.describe_table(TableName=self._aws_resource_name)
+
+        def warm() -> None:
+            try:
+                call()
+            except Exception as e:
+                logging.debug(f"Pre-warm call for {self._aws_resource_name}: {e}")
+
+        threads = [threading.Thread(target=warm) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
     def invoke_sync(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Synchronous invocation of the Lambda function.
+        Synchronous invocation of the Lambda function or Bedrock agent.
 
         Args:
             payload (Dict[str, Any]): The payload to send to the Lambda function.
@@ -68,28 +261,52 @@ class OptimizedAWSClient:
             Dict[str, Any]: The response from the Lambda function.
 
         Raises:
-            ValueError: If the resource type is not 'lambda'.
+            ValueError: If the resource type is not 'lambda' or 'agent'.
         """
+        if self._aws_resource_type == "agent":
+            return self._invoke_agent(payload)
         if self._aws_resource_type != "lambda":
             raise ValueError(
                 "Resource type must be 'lambda' for synchronous invocation."
             )
+        warmer = self.warmer
+        cold_start = False
+        if warmer is not None:
+            warmer.begin()
+            start = time.monotonic()
+        timings: Dict[str, float] = {}
         try:
-            response = self.client.invoke(
-                FunctionName=self._aws_resource_name,
-                InvocationType="RequestResponse",
-                Payload=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-            )
+            kwargs = {}
+            if warmer is not None:
+                # The log tail tells whether this call paid a cold start
+                kwargs["LogType"] = "Tail"
+            with stage_metrics.timer("serialize", timings):
+                body = self.codec.encode(payload)
+            with stage_metrics.timer("invoke", timings):
+                response = self.client.invoke(
+                    FunctionName=self._aws_resource_name,
+                    InvocationType="RequestResponse",
+                    Payload=body,
+                    **kwargs,
+                )
+            if "LogResult" in response:
+                cold_start = b"Init Duration" in base64.b64decode(
+                    response["LogResult"]
+                )
 
             # Read response
-            payload_response = response["Payload"].read()
-            result = json.loads(payload_response)
+            with stage_metrics.timer("read", timings):
+                payload_response = response["Payload"].read()
+            with stage_metrics.timer("decode", timings):
+                result = self.codec.decode(payload_response)
 
             # Add metadata
             result["_metadata"] = {
                 "status_code": response["StatusCode"],
-                "execution_time": response.get("ExecutedVersion"),
+                "executed_version": response.get("ExecutedVersion"),
                 "request_id": response["ResponseMetadata"]["RequestId"],
+                "timings": timings,
+                "bytes": {"request": len(body), **result.pop("_bytes", {})},
             }
 
             return result
@@ -98,9 +315,518 @@ class OptimizedAWSClient:
             return {
                 "statusCode": 500,
                 "body": json.dumps({"error": str(e)}),
-                "_metadata": {"error": True},
+                "_metadata": {"error": True, "timings": timings},
+            }
+        finally:
+            if warmer is not None:
+                warmer.end(time.monotonic() - start, cold_start)
+
+    def _invoke_agent(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ask the Bedrock agent directly, without the getAgentResponse hop.
+
+        The answer is read from the completion event stream and returned in
+        the shape getAgentResponse uses, except that the body is not
+        JSON-encoded a second time.
+
+        Args:
+            payload (Dict[str, Any]): The getAgentResponse payload.
+
+        Returns:
+            Dict[str, Any]: The response, with the answer in body["answer"].
+        """
+        timings: Dict[str, float] = {}
+        try:
+            with stage_metrics.timer("invoke", timings):
+                response = self.client.invoke_agent(**self._agent_request(payload))
+            with stage_metrics.timer("read", timings):
+                answer = "".join(self._agent_chunks(response["completion"], None))
+            metadata = response["ResponseMetadata"]
+            return {
+                "statusCode": 200,
+                "body": {"answer": answer},
+                "_metadata": {
+                    "status_code": metadata["HTTPStatusCode"],
+                    "executed_version": None,
+                    "request_id": metadata["RequestId"],
+                    "timings": timings,
+                },
+            }
+        except Exception as e:
+            return {
+                "statusCode": 500,
+                "body": json.dumps({"error": str(e)}),
+                "_metadata": {"error": True, "timings": timings},
             }
 
+    def _agent_request(
+        self, payload: Dict[str, Any], stream: bool = False
+    ) -> Dict[str, Any]:
+        agent_id, agent_alias_id = self._aws_resource_name.split("/", 1)
+        body = payload["body"]
+        # Session IDs hold 2 to 100 of [0-9a-zA-Z._:-]
+        session_id = re.sub(r"[^0-9a-zA-Z._:-]", "-", body["session_id"])
+        request = {
+            "agentId": agent_id,
+            "agentAliasId": agent_alias_id,
+            "sessionId": session_id[:100].ljust(2, "-"),
+            "inputText": body["query"],
+        }
+        if stream:
+            request["streamingConfigurations"] = {"streamFinalResponse": True}
+        return request
+
+    @staticmethod
+    def _agent_chunks(
+        completion: Any, cancel_event: Optional[threading.Event]
+    ) -> Iterator[str]:
+        # Error events are raised by botocore while iterating
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for event in completion:
+            if cancel_event is not None and cancel_event.is_set():
+                completion.close()
+                return
+            if "chunk" in event:
+                text = decoder.decode(event["chunk"].get("bytes", b""))
+                if text:
+                    yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    def invoke_future(
+        self,
+        payload: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Future:
+        """
+        Submit a synchronous invocation to the shared, bounded executor.
+
+        Args:
+            payload (Dict[str, Any]): The payload to send to the Lambda function.
+            cancel_event (Optional[threading.Event]): If set before a worker
+                picks the call up, the call is not issued.
+
+        Returns:
+            Future: Resolves to the invoke_sync response. Raises
+                CancelledError if the call was cancelled before it started.
+        """
+
+        def run() -> Dict[str, Any]:
+            if cancel_event is not None and cancel_event.is_set():
+                raise CancelledError()
+            return self.invoke_sync(payload)
+
+        return (self._executor or get_invoke_executor()).submit(run)
+
+    @staticmethod
+    def wait_for(
+        future: Future,
+        timeout: float = config.INVOKE_TIMEOUT_SECONDS,
+        cancel_event: Optional[threading.Event] = None,
+        on_tick: Optional[Callable[[float], None]] = None,
+        cancel_on_exit: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Wait for an invocation future with a deadline and cooperative
+        cancellation.
+
+        The wait wakes up every config.INVOKE_POLL_SECONDS to check the
+        cancel event and call on_tick. Any exception raised by on_tick (for
+        instance Streamlit stopping the script run when the session goes away)
+        abandons the call the same way a cancellation does.
+
+        Args:
+            future (Future): Future returned by invoke_future.
+            timeout (float): Seconds to wait before giving up.
+            cancel_event (Optional[threading.Event]): Abandons the wait when set.
+            on_tick (Optional[Callable[[float], None]]): Called with the elapsed
+                seconds on every poll.
+            cancel_on_exit (bool): Whether to cancel the future when the wait
+                is abandoned. Shared futures are left to their other waiters.
+
+        Returns:
+            Dict[str, Any]: The response from the Lambda function.
+
+        Raises:
+            TimeoutError: If the deadline passes first.
+            CancelledError: If the cancel event is set or the call was cancelled.
+        """
+        start = time.monotonic()
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError()
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise TimeoutError(f"Invocation exceeded {timeout}s")
+                try:
+                    return future.result(
+                        timeout=min(config.INVOKE_POLL_SECONDS, remaining)
+                    )
+                except TimeoutError:
+                    if on_tick is not None:
+                        on_tick(time.monotonic() - start)
+        except BaseException:
+            if cancel_on_exit:
+                future.cancel()
+            raise
+
+    def invoke_hedged(
+        self,
+        payload: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None,
+        on_finished: Optional[Callable[[], None]] = None,
+    ) -> Future:
+        """
+        Start a synchronous invocation, hedged when config.HEDGE_ENABLED and
+        the client is idempotent.
+
+        If the call is still running after the recent
+        config.HEDGE_PERCENTILE latency, and the hedge budget allows it, the
+        same payload is sent a second time and the first successful response
+        wins. The outcome of every attempt, unless it failed because the caller
+        cancelled it, feeds the circuit breaker, which callers must check
+        first (see invoke_admitted).
+
+        Args:
+            payload (Dict[str, Any]): The payload to send to the Lambda function.
+            cancel_event (Optional[threading.Event]): If set before a worker
+                picks an attempt up, the attempt is not issued.
+            on_finished (Optional[Callable[[], None]]): Called once no attempt
+                is running any more, which for a cancelled future can be well
+                after it was cancelled. Resources held for the invocation,
+                such as an admission slot, are released here.
+
+        Returns:
+            Future: Resolves to the invoke_sync response of the winning attempt.
+                Cancelling it cancels the attempts that have not started;
+                those already running finish in the background.
+        """
+        result: Future = Future()
+        attempts: List[Future] = []
+        # Reentrant: settling the result runs its callbacks under the lock
+        lock = threading.RLock()
+        finished: List[bool] = []
+        self.hedge_budget.earn()
+        with self._hedge_lock:
+            self._hedge_metrics["calls"] += 1
+
+        def settle(hedge: bool, attempt: Future, seconds: float) -> None:
+            if attempt.cancelled():
+                return
+            error = None
+            try:
+                response = attempt.result()
+            except BaseException as e:
+                response, error = None, e
+            success = response is not None and not _is_error(response)
+            abandoned = isinstance(error, CancelledError) or (
+                cancel_event is not None and cancel_event.is_set()
+            )
+            # Failing a call the caller gave up on says nothing about the backend
+            if success or not abandoned:
+                self.breaker.record(success)
+            if success:
+                self.latency.record(seconds)
+            with lock:
+                if result.done():
+                    return
+                # A failed attempt leaves the answer to one still running
+                if not success and any(not a.done() for a in attempts):
+                    return
+                if response is None:
+                    result.set_exception(error)
+                else:
+                    result.set_result(response)
+            if hedge and success:
+                with self._hedge_lock:
+                    self._hedge_metrics["hedge_wins"] += 1
+            for other in attempts:
+                other.cancel()
+
+        def finish_if_idle() -> None:
+            with lock:
+                if finished or not result.done():
+                    return
+                if not all(attempt.done() for attempt in attempts):
+                    return
+                finished.append(True)
+            if on_finished is not None:
+                on_finished()
+
+        def on_attempt_done(hedge: bool, attempt: Future, start: float) -> None:
+            settle(hedge, attempt, time.monotonic() - start)
+            finish_if_idle()
+
+        def launch(hedge: bool) -> None:
+            start = time.monotonic()
+            with lock:
+                # No new attempt once the result is settled or cancelled
+                if result.done():
+                    return
+                attempt = self.invoke_future(payload, cancel_event)
+                attempts.append(attempt)
+            attempt.add_done_callback(lambda a: on_attempt_done(hedge, a, start))
+
+        def fire_hedge() -> None:
+            if result.done():
+                return
+            if not self.hedge_budget.spend():
+                with self._hedge_lock:
+                    self._hedge_metrics["denied"] += 1
+                return
+            with self._hedge_lock:
+                self._hedge_metrics["hedges"] += 1
+            launch(hedge=True)
+
+        def on_result(future: Future) -> None:
+            if future.cancelled():
+                for attempt in list(attempts):
+                    attempt.cancel()
+            finish_if_idle()
+
+        result.add_done_callback(on_result)
+        launch(hedge=False)
+        delay = self.latency.percentile(config.HEDGE_PERCENTILE)
+        # A duplicate call to a stateful backend, such as an agent session,
+        # would be a second turn rather than a second chance
+        if config.HEDGE_ENABLED and delay is not None and self.idempotent:
+            timer = threading.Timer(
+                max(delay, config.HEDGE_MIN_DELAY_SECONDS), fire_hedge
+            )
+            timer.daemon = True
+            timer.start()
+            result.add_done_callback(lambda _: timer.cancel())
+        return result
+
+    def hedge_metrics(self) -> Dict[str, float]:
+        """
+        Return hedging counters, the hedge win rate and the current hedge
+        delay.
+
+        Returns:
+            Dict[str, float]: The hedging metrics.
+        """
+        with self._hedge_lock:
+            metrics = dict(self._hedge_metrics)
+        metrics["hedge_win_rate"] = (
+            metrics["hedge_wins"] / metrics["hedges"] if metrics["hedges"] else 0.0
+        )
+        metrics["hedge_delay_seconds"] = self.latency.percentile(
+            config.HEDGE_PERCENTILE
+        )
+        return metrics
+
+    def invoke_admitted(
+        self,
+        payload: Dict[str, Any],
+        timeout: float = config.INVOKE_TIMEOUT_SECONDS,
+        cancel_event: Optional[threading.Event] = None,
+        on_tick: Optional[Callable[[float], None]] = None,
+        on_queue: Optional[Callable[[int, float], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Synchronous invocation behind the client's admission control.
+
+        The call is rejected at once while the circuit breaker is open.
+        Otherwise it waits for a slot of self.admission (see
+        AdmissionController) and holds it until the invocation, hedged as in
+        invoke_hedged, completes. The timeout only starts once the call is
+        admitted.
+
+        Args:
+            payload (Dict[str, Any]): The payload to send to the Lambda function.
+            timeout (float): Seconds to wait for the invocation.
+            cancel_event (Optional[threading.Event]): Abandons the wait when set.
+            on_tick (Optional[Callable[[float], None]]): Called with the elapsed
+                seconds on every poll.
+            on_queue (Optional[Callable[[int, float], None]]): Called while
+                queued, with the queue position and the estimated wait.
+
+        Returns:
+            Dict[str, Any]: The response from the Lambda function.
+
+        Raises:
+            CircuitOpen: If the circuit breaker rejects the call.
+            Overloaded: If the call is shed by admission control.
+            TimeoutError: If the deadline passes first.
+            CancelledError: If the cancel event is set or the call was cancelled.
+        """
+        future = self._start_admitted(payload, cancel_event, on_queue)
+        return self.wait_for(future, timeout, cancel_event, on_tick)
+
+    def _start_admitted(
+        self,
+        payload: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None,
+        on_queue: Optional[Callable[[int, float], None]] = None,
+        shared: bool = False,
+    ) -> Future:
+        # Every real invocation passes the breaker and holds an admission
+        # slot until its last attempt finishes, even if the caller gave up.
+        # A shared call outlives the cancel event of the caller starting it.
+        self.breaker.check()
+        ticket = self.admission.acquire(cancel_event, on_queue)
+        try:
+            return self.invoke_hedged(
+                payload,
+                None if shared else cancel_event,
+                on_finished=lambda: self.admission.release(ticket),
+            )
+        except BaseException:
+            self.admission.release(ticket)
+            raise
+
+    def invoke_coalesced(
+        self,
+        key: str,
+        payload: Dict[str, Any],
+        timeout: float = config.INVOKE_TIMEOUT_SECONDS,
+        cancel_event: Optional[threading.Event] = None,
+        on_tick: Optional[Callable[[float], None]] = None,
+        on_queue: Optional[Callable[[int, float], None]] = None,
+        on_start: Optional[Callable[[], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Synchronous invocation shared with identical calls already in flight.
+
+        Calls with the same key that overlap in time issue a single
+        invocation, with the payload of the first one, and all receive its
+        response (see SingleFlight). Each caller keeps its own deadline and
+        cancel event. Every call that starts an invocation, including one
+        over the waiter limit, goes through the circuit breaker and admission
+        control as in invoke_admitted. If the caller that started the shared
+        call gives up while still queued, the others start over.
+
+        Args:
+            key (str): Identifies identical calls, e.g. the normalized query.
+            payload (Dict[str, Any]): The payload to send to the Lambda function.
+            timeout (float): Seconds to wait for the invocation.
+            cancel_event (Optional[threading.Event]): Abandons the wait when set.
+            on_tick (Optional[Callable[[float], None]]): Called with the elapsed
+                seconds on every poll.
+            on_queue (Optional[Callable[[int, float], None]]): Called while
+                queued, with the queue position and the estimated wait.
+            on_start (Optional[Callable[[], None]]): Called if this call is
+                the one issuing the invocation, with its own payload.
+
+        Returns:
+            Dict[str, Any]: The response from the Lambda function.
+
+        Raises:
+            CircuitOpen: If the circuit breaker rejects the call.
+            Overloaded: If the call is shed by admission control.
+            TimeoutError: If the deadline passes first.
+            CancelledError: If the cancel event is set or the call was cancelled.
+        """
+        while True:
+            started = []
+
+            def start() -> Future:
+                started.append(True)
+                if on_start is not None:
+                    on_start()
+                return self._start_admitted(
+                    payload, cancel_event, on_queue, shared=True
+                )
+
+            future = self.single_flight.join(key, start)
+            try:
+                return self.wait_for(
+                    future, timeout, cancel_event, on_tick, cancel_on_exit=False
+                )
+            except CancelledError:
+                if started or (cancel_event is not None and cancel_event.is_set()):
+                    raise
+                # The caller that started the shared call gave up before it
+                # was issued: start over, possibly as the one starting it
+            finally:
+                self.single_flight.leave(key, future)
+
+    def invoke_stream(
+        self,
+        payload: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """
+        Streaming invocation of the Lambda function or Bedrock agent.
+
+        Uses Lambda response streaming, so the function must be configured
+        with the RESPONSE_STREAM invoke mode and write the answer text to the
+        stream as it is generated. A Bedrock agent streams its final response
+        directly.
+
+        Args:
+            payload (Dict[str, Any]): The payload to send to the Lambda function.
+            cancel_event (Optional[threading.Event]): Stops reading the stream
+                when set.
+
+        Yields:
+            str: Text chunks in the order the function wrote them.
+
+        Raises:
+            ValueError: If the resource type is not 'lambda'.
+            RuntimeError: If the function reports an error while streaming.
+            CircuitOpen: If the circuit breaker rejects the call.
+        """
+        if self._aws_resource_type not in ("lambda", "agent"):
+            raise ValueError(
+                "Resource type must be 'lambda' or 'agent' for streaming "
+                "invocation."
+            )
+        self.breaker.check()
+        start = time.monotonic()
+        if self.warmer is not None:
+            # Counts as traffic for the warmer, without cold start detection
+            self.warmer.begin()
+        try:
+            yield from self._stream(payload, cancel_event)
+        except Exception:
+            self.breaker.record(False)
+            raise
+        finally:
+            if self.warmer is not None:
+                self.warmer.end(time.monotonic() - start, None)
+        self.breaker.record(True)
+
+    def _stream(
+        self,
+        payload: Dict[str, Any],
+        cancel_event: Optional[threading.Event],
+    ) -> Iterator[str]:
+        if self._aws_resource_type == "agent":
+            response = self.client.invoke_agent(
+                **self._agent_request(payload, stream=True)
+            )
+            yield from self._agent_chunks(response["completion"], cancel_event)
+            return
+        response = self.client.invoke_with_response_stream(
+            FunctionName=self._aws_resource_name,
+            InvocationType="RequestResponse",
+            Payload=self.codec.encode(payload, negotiate=False),
+        )
+
+        # Chunk boundaries may split multi-byte characters
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for event in response["EventStream"]:
+            if cancel_event is not None and cancel_event.is_set():
+                response["EventStream"].close()
+                return
+            if "PayloadChunk" in event:
+                text = decoder.decode(event["PayloadChunk"]["Payload"])
+                if text:
+                    yield text
+            elif "InvokeComplete" in event:
+                complete = event["InvokeComplete"]
+                if complete.get("ErrorCode"):
+                    raise RuntimeError(
+                        f"{complete['ErrorCode']}: {complete.get('ErrorDetails')}"
+                    )
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
     def invoke_async(self, payload: Dict[str, Any]) -> Optional[str]:
         """
         Asynchronous invocation (fire and forget) of the Lambda function.
@@ -122,7 +848,7 @@ class OptimizedAWSClient:
             response = self.client.invoke(
                 FunctionName=self._aws_resource_name,
                 InvocationType="Event",  # Asynchronous
-                Payload=json.dumps(payload, ensure_ascii=False),
+                Payload=self.codec.encode(payload, negotiate=False),
             )
 
             return response["ResponseMetadata"]["RequestId"]
@@ -135,30 +861,210 @@ class OptimizedAWSClient:
         """
         Write a single row to the DynamoDB table.
 
+        With write-behind enabled the row is only queued, and a background
+        thread writes it in a batch.
+
         Args:
             item (Dict[str, Any]): The item to write to the DynamoDB table.
         """
+        table = self.client
+        if self._write_buffer is not None:
+            self._write_buffer.put(item)
+            return
         try:
-            self._client.put_item(Item=item)
+            with stage_metrics.timer("dynamodb_write"):
+                table.put_item(Item=item)
         except Exception as e:
             logging.error(f"Error writing row to DynamoDB: {e}")
 
+    def query_session(
+        self,
+        session_id: str,
+        limit: int,
+        start_key: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Read one page of a session's rows from the DynamoDB table, newest
+        first.
+
+        Only the fields needed to show the conversation are read. The table
+        must have sessionId as its partition key and creationDate as its
+        sort key.
+
+        Args:
+            session_id (str): The session's sessionId.
+            limit (int): Maximum rows in the page.
+            start_key (Optional[Dict[str, Any]]): LastEvaluatedKey of the
+                previous page, None for the first one.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]: The rows
+                and the key to continue from, None after the last page or on
+                error.
+        """
+        request = {
+            "KeyConditionExpression": "#s = :s",
+            "ProjectionExpression": "#c, #u, #r",
+            "ExpressionAttributeNames": {
+                "#s": "sessionId",
+                "#c": "creationDate",
+                "#u": "userMessage",
+                "#r": "response",
+            },
+            "ExpressionAttributeValues": {":s": session_id},
+            "ScanIndexForward": False,
+            "Limit": limit,
+        }
+        if start_key is not None:
+            request["ExclusiveStartKey"] = start_key
+        try:
+            with stage_metrics.timer("dynamodb_query"):
+                response = self.client.query(**request)
+        except Exception as e:
+            logging.error(f"Error querying session {session_id} from DynamoDB: {e}")
+            return [], None
+        return response.get("Items", []), response.get("LastEvaluatedKey")
+
+
+def _is_error(response: Dict[str, Any]) -> bool:
+    """
+    Check whether an invoke_sync response reports a failure.
+
+    Args:
+        response (Dict[str, Any]): The invoke_sync response.
+
+    Returns:
+        bool: True for client errors and 5xx responses of the function.
+    """
+    if response.get("_metadata", {}).get("error"):
+        return True
+    try:
+        return int(response.get("statusCode", 200)) >= 500
+    except (TypeError, ValueError):
+        return False
+
+
+def _start_prewarm(client: OptimizedAWSClient) -> None:
+    """
+    Pre-warm a client's connection pool in the background, if enabled.
+
+    Args:
+        client (OptimizedAWSClient): The client to pre-warm.
+    """
+    if config.AWS_PREWARM_CONNECTIONS > 0:
+        threading.Thread(
+            target=client.prewarm, name="aws-prewarm", daemon=True
+        ).start()
+
+
+@st.cache_resource
+def get_invoke_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide executor shared by every invoke_future call.
+
+    Returns:
+        ThreadPoolExecutor: Executor bounded by config.INVOKE_MAX_WORKERS.
+    """
+    return ThreadPoolExecutor(
+        max_workers=config.INVOKE_MAX_WORKERS, thread_name_prefix="aws-invoke"
+    )
+
+
+@st.cache_resource
+def get_metrics_server() -> Any:
+    """
+    Start the process-wide Prometheus endpoint (see start_metrics_server).
+
+    Returns:
+        Optional[ThreadingHTTPServer]: The server, or None if disabled.
+    """
+    return start_metrics_server()
+
+
+@st.cache_resource
+def get_concurrency_metrics() -> Any:
+    """
+    Start publishing the process-wide load metrics (see ConcurrencyMetrics),
+    including the number of connected browser sessions.
+
+    Returns:
+        ConcurrencyMetrics: The metrics. Without config.METRICS_EMF_ENABLED
+            nothing is published, but flush() still returns the aggregates.
+    """
+    concurrency_metrics.gauge("active_sessions", _active_sessions)
+    if config.METRICS_EMF_ENABLED:
+        concurrency_metrics.start()
+    return concurrency_metrics
+
+
+def _active_sessions() -> int:
+    # Sessions the app has run for whose websocket is still open; 0 outside
+    # of a Streamlit server
+    if not runtime.exists():
+        return 0
+    return concurrency_metrics.active_sessions(
+        runtime.get_instance().is_active_session
+    )
+
+
+def _check_agent(agent: str) -> None:
+    # Fail at startup rather than on every InvokeAgent call
+    agent_id, _, agent_alias_id = agent.partition("/")
+    for setting, value in (
+        ("BEDROCK_AGENT_ID", agent_id),
+        ("BEDROCK_AGENT_ALIAS_ID", agent_alias_id),
+    ):
+        if not re.fullmatch(r"[0-9a-zA-Z]{1,10}", value):
+            raise ValueError(
+                f"AGENT_BACKEND=bedrock needs {setting} set to the agent's "
+                f"alphanumeric ID of up to 10 characters, got {value!r}"
+            )
+
 
 @st.cache_resource
 def get_lambda_client_bedrock(lambda_function_name: str) -> OptimizedAWSClient:
     """
     Get a cached instance of OptimizedAWSClient for Bedrock.
 
+    With config.AGENT_BACKEND set to "bedrock", the client calls the Bedrock
+    agent directly instead of the Lambda function. Otherwise, with
+    config.WARMER_ENABLED, the client owns a LambdaWarmer that keeps the
+    function warm between questions.
+
     Args:
         lambda_function_name (str): Name of the Lambda function.
 
     Returns:
         OptimizedAWSClient: The client instance.
+
+    Raises:
+        ValueError: If config.BEDROCK_AGENT_ID or config.BEDROCK_AGENT_ALIAS_ID
+            is missing or malformed with the "bedrock" backend.
     """
-    return OptimizedAWSClient(
-        aws_resource_name=lambda_function_name,
-        aws_resource_type="lambda",
+    if config.AGENT_BACKEND == "bedrock":
+        agent = f"{config.BEDROCK_AGENT_ID}/{config.BEDROCK_AGENT_ALIAS_ID}"
+        client = OptimizedAWSClient(
+            aws_resource_name=agent, aws_resource_type="agent"
+        )
+    else:
+        client = OptimizedAWSClient(
+            aws_resource_name=lambda_function_name,
+            aws_resource_type="lambda",
+            idempotent=config.AGENT_LAMBDA_IDEMPOTENT,
+        )
+        _start_prewarm(client)
+        stage_metrics.source("codec", client.codec.metrics)
+        if config.WARMER_ENABLED:
+            client.warmer = LambdaWarmer(client, lambda_function_name)
+            client.warmer.start()
+            stage_metrics.source("warmer", client.warmer.metrics)
+    concurrency_metrics.gauge(
+        "in_flight_calls", lambda: client.admission.metrics()["in_flight"]
     )
+    concurrency_metrics.gauge(
+        "queued_calls", lambda: client.admission.metrics()["queue_depth"]
+    )
+    return client
 
 
 @st.cache_resource
@@ -172,10 +1078,12 @@ def get_lambda_client_feedback(lambda_function_name: str) -> OptimizedAWSClient:
     Returns:
         OptimizedAWSClient: The client instance.
     """
-    return OptimizedAWSClient(
+    client = OptimizedAWSClient(
         aws_resource_name=lambda_function_name,
         aws_resource_type="lambda",
     )
+    _start_prewarm(client)
+    return client
 
 
 @st.cache_resource
@@ -189,7 +1097,27 @@ def get_dynamodb_client(dynamodb_table_name: str) -> OptimizedAWSClient:
     Returns:
         OptimizedAWSClient: The client instance.
     """
-    return OptimizedAWSClient(
+    client = OptimizedAWSClient(
         aws_resource_name=dynamodb_table_name,
         aws_resource_type="dynamodb",
     )
+    _start_prewarm(client)
+    return client
+
+
+@st.cache_resource
+def get_event_spool(lambda_function_name: str) -> EventSpool:
+    """
+    Get a cached EventSpool that delivers events to a Lambda function
+    through asynchronous invocations.
+
+    Args:
+        lambda_function_name (str): Name of the Lambda function.
+
+    Returns:
+        EventSpool: The spool instance.
+    """
+    return EventSpool(
+        directory=os.path.join(config.SPOOL_DIR, lambda_function_name),
+        deliver=get_lambda_client_feedback(lambda_function_name).invoke_async,
+    )
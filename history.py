@@ -0,0 +1,304 @@
+import json
+import logging
+import os
+import re
+import secrets
+import shutil
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import config
+
+_last_prune = 0.0
+
+# Session IDs carry a random part, so one cannot be guessed from its time
+_SESSION_ID = re.compile(r"^\d{4}-\d{2}-\d{2}_[\d:.]+_[0-9a-f]{16}$")
+
+
+class ChatHistory:
+    """
+    Chat messages of one session, bounded in memory.
+
+    The most recent config.CHAT_HISTORY_WINDOW messages, and at most one
+    page more, are kept in memory and rendered on every rerun. Once a full
+    page of older messages has accumulated past the window it is moved to a
+    JSON file in the session's archive directory, from which it can be
+    loaded on demand, so memory and rerun cost stay proportional to the
+    window rather than to the whole conversation.
+
+    A resumed session also reaches back into its StoredConversation once
+    the local archive is exhausted.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        directory: str = config.CHAT_ARCHIVE_DIR,
+        window: int = config.CHAT_HISTORY_WINDOW,
+        page_size: int = config.CHAT_HISTORY_PAGE_SIZE,
+    ):
+        """
+        Initialize the ChatHistory.
+
+        Args:
+            session_id (str): ID of the session the messages belong to.
+            directory (str): Directory holding one archive per session.
+            window (int): Messages kept in memory.
+            page_size (int): Messages per archived page.
+        """
+        self.session_id = session_id
+        self.directory = os.path.join(
+            directory, re.sub(r"[^0-9A-Za-z._-]", "_", session_id)
+        )
+        self.window = window
+        self.page_size = page_size
+        self.pages = 0
+        self.stored: Optional[StoredConversation] = None
+        self._recent: List[Dict[str, Any]] = []
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._recent)
+
+    def __len__(self) -> int:
+        return self.pages * self.page_size + len(self._recent)
+
+    def append(self, message: Dict[str, Any]) -> None:
+        """
+        Add a message, archiving the oldest page once the window overflows.
+
+        Args:
+            message (Dict[str, Any]): The message, with "role" and "content".
+        """
+        self._recent.append(message)
+        if len(self._recent) < self.window + self.page_size:
+            return
+        page, rest = self._recent[: self.page_size], self._recent[self.page_size :]
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{self.pages:06d}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(page, f, ensure_ascii=False)
+        except OSError as e:
+            # Keep the messages in memory rather than lose them
+            logging.error(f"Error archiving chat history: {e}")
+            return
+        self.pages += 1
+        self._recent = rest
+
+    def clear(self) -> None:
+        """
+        Forget every message, deleting the archive.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.pages = 0
+        self.stored = None
+        self._recent = []
+
+    def restore(self, stored: "StoredConversation") -> bool:
+        """
+        Start from the most recent page of a stored conversation, reading
+        earlier pages from it on demand.
+
+        Args:
+            stored (StoredConversation): The session's stored conversation.
+
+        Returns:
+            bool: False if nothing was stored for the session.
+        """
+        messages = stored.page(0)
+        if not messages:
+            return False
+        # Stale pages left on this task would shadow the stored ones
+        self.clear()
+        for message in messages:
+            self.append(message)
+        self.stored = stored
+        return True
+
+    def has_earlier(self, pages: int) -> bool:
+        """
+        Check whether there is more to show than the given earlier pages.
+
+        Args:
+            pages (int): Earlier pages already shown.
+
+        Returns:
+            bool: True if another page can be loaded.
+        """
+        if pages < self.pages:
+            return True
+        # Page 0 of the stored conversation is the restored window
+        return self.stored is not None and self.stored.has_page(pages - self.pages + 1)
+
+    def load_page(self, page: int) -> List[Dict[str, Any]]:
+        """
+        Read an archived page.
+
+        Args:
+            page (int): Page number, 0 being the oldest.
+
+        Returns:
+            List[Dict[str, Any]]: The page's messages, empty if unreadable.
+        """
+        try:
+            with open(
+                os.path.join(self.directory, f"{page:06d}.json"), encoding="utf-8"
+            ) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading chat history page {page}: {e}")
+            return []
+
+    def earlier(self, pages: int) -> List[Dict[str, Any]]:
+        """
+        Read the archived messages right before the in-memory window,
+        continuing with the stored conversation of a resumed session.
+
+        Args:
+            pages (int): How many of the most recent archived pages to read.
+
+        Returns:
+            List[Dict[str, Any]]: Their messages, oldest first.
+        """
+        first = max(0, self.pages - pages)
+        messages = [
+            m for page in range(first, self.pages) for m in self.load_page(page)
+        ]
+        if self.stored is None:
+            return messages
+        stored = range(pages - self.pages, 0, -1)
+        return [m for page in stored for m in self.stored.page(page)] + messages
+
+
+class StoredConversation:
+    """
+    A session's exchanges as stored in the conversationHistory table, read
+    back newest page first.
+
+    Pages are fetched with a DynamoDB Query on the session's key, sorted by
+    creationDate in descending order and projected to the fields the chat
+    shows, only when first asked for; fetched pages are kept.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        session_id: str,
+        page_size: int = config.CHAT_RESUME_PAGE_SIZE,
+    ):
+        """
+        Initialize the StoredConversation.
+
+        Args:
+            client (Any): OptimizedAWSClient of the conversationHistory table.
+            session_id (str): ID of the session.
+            page_size (int): Exchanges per page.
+        """
+        self.client = client
+        self.session_id = session_id
+        self.page_size = page_size
+        self._pages: List[List[Dict[str, Any]]] = []
+        self._next_key: Optional[Dict[str, Any]] = None
+        self._done = False
+
+    def page(self, page: int) -> List[Dict[str, Any]]:
+        """
+        Return a page of messages, fetching the pages up to it if needed.
+
+        Args:
+            page (int): Page number, 0 being the most recent.
+
+        Returns:
+            List[Dict[str, Any]]: The page's messages, oldest first; empty
+                past the first exchange.
+        """
+        while len(self._pages) <= page and not self._done:
+            items, self._next_key = self.client.query_session(
+                self.session_id, self.page_size, self._next_key
+            )
+            self._done = self._next_key is None
+            if items:
+                self._pages.append(_to_messages(items))
+        return self._pages[page] if page < len(self._pages) else []
+
+    def has_page(self, page: int) -> bool:
+        """
+        Check whether a page may exist, without fetching it.
+
+        Args:
+            page (int): Page number, 0 being the most recent.
+
+        Returns:
+            bool: False once the page is known to be past the first exchange.
+        """
+        return page < len(self._pages) or not self._done
+
+
+def _to_messages(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Items come newest first
+    messages: List[Dict[str, Any]] = []
+    for item in reversed(items):
+        messages.append({"role": "user", "content": item.get("userMessage", "")})
+        messages.append(
+            {
+                "role": "assistant",
+                "content": config.ANSWER_PREFIX + item.get("response", ""),
+            }
+        )
+    return messages
+
+
+def new_session_id() -> str:
+    """
+    Create the ID of a new session, which also serves as its resume token.
+
+    Returns:
+        str: The creation time followed by a random part.
+    """
+    return f"{str(datetime.now()).replace(' ', '_')}_{secrets.token_hex(8)}"
+
+
+def is_session_id(token: Optional[str]) -> bool:
+    """
+    Check whether a resume token has the form new_session_id creates.
+
+    Args:
+        token (Optional[str]): The token, e.g. from the URL.
+
+    Returns:
+        bool: True if it can be resumed.
+    """
+    return bool(token) and _SESSION_ID.match(token) is not None
+
+
+def prune_archives(
+    directory: str = config.CHAT_ARCHIVE_DIR,
+    max_age: float = config.CHAT_ARCHIVE_MAX_AGE_SECONDS,
+) -> None:
+    """
+    Delete session archives not written to for max_age seconds.
+
+    Runs at most once per config.CHAT_ARCHIVE_PRUNE_SECONDS per process, so
+    it can be called whenever a session starts.
+
+    Args:
+        directory (str): Directory holding one archive per session.
+        max_age (float): Age in seconds after which an archive is deleted.
+    """
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < config.CHAT_ARCHIVE_PRUNE_SECONDS:
+        return
+    _last_prune = now
+    cutoff = now - max_age
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path)
+        except OSError as e:
+            logging.error(f"Error pruning chat archive {entry.path}: {e}")
@@ -0,0 +1,537 @@
+import bisect
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set
+
+import config
+
+# EMF records must reach the log stream as bare JSON lines
+_emf_logger = logging.getLogger("emf")
+_emf_logger.propagate = False
+if not _emf_logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _emf_logger.addHandler(_handler)
+    _emf_logger.setLevel(logging.INFO)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+
+    Quantiles are interpolated linearly within the bucket they fall in, the
+    same way Prometheus' histogram_quantile does.
+    """
+
+    def __init__(self, buckets: Sequence[float] = config.METRICS_BUCKETS):
+        """
+        Initialize the Histogram.
+
+        Args:
+            buckets (Sequence[float]): Ascending upper bounds, in seconds.
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        """
+        Add a sample.
+
+        Args:
+            seconds (float): The observed latency.
+        """
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile of the samples.
+
+        Args:
+            q (float): Quantile between 0 and 1.
+
+        Returns:
+            float: The estimated latency, or 0.0 without samples.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    # Above the last bucket: its bound is all that is known
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class StageMetrics:
+    """
+    Latency histograms per stage of the request path.
+
+    Stages are observed individually (serialize, invoke, read, decode,
+    dynamodb_write, ...) and summarized as p50/p95/p99. Each answered
+    question can also be written as one CloudWatch Embedded Metric Format
+    record holding all its stage timings and the Lambda request ID, so slow
+    answers can be matched with the function's own logs.
+
+    Components with their own counters (the Lambda warmer, the write-behind
+    buffer, ...) register their metrics() as sources: these are rendered as
+    gauges next to the histograms and written as one EMF record by
+    publish_sources().
+    """
+
+    def __init__(self):
+        """
+        Initialize the StageMetrics.
+        """
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Record the latency of a stage.
+
+        Args:
+            stage (str): Name of the stage.
+            seconds (float): Latency of the stage.
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(
+        self, stage: str, timings: Optional[Dict[str, float]] = None
+    ) -> Iterator[None]:
+        """
+        Time a with block as a stage.
+
+        Args:
+            stage (str): Name of the stage.
+            timings (Optional[Dict[str, float]]): Per-request timings the
+                latency is added to as well.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(stage, elapsed)
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + elapsed
+
+    def record_request(
+        self,
+        timings: Dict[str, float],
+        request_id: Optional[str] = None,
+        **properties: Any,
+    ) -> None:
+        """
+        Write the stage timings of one request as a CloudWatch EMF record.
+
+        Args:
+            timings (Dict[str, float]): Seconds per stage.
+            request_id (Optional[str]): Lambda request ID of the invocation.
+            **properties (Any): Extra properties, e.g. the answer source.
+        """
+        if not config.METRICS_EMF_ENABLED or not timings:
+            return
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": config.METRICS_NAMESPACE,
+                        "Dimensions": [["Service"]],
+                        "Metrics": [
+                            {"Name": f"{stage}_ms", "Unit": "Milliseconds"}
+                            for stage in timings
+                        ],
+                    }
+                ],
+            },
+            "Service": config.METRICS_SERVICE,
+            "RequestId": request_id,
+            **properties,
+        }
+        for stage, seconds in timings.items():
+            record[f"{stage}_ms"] = round(seconds * 1000, 3)
+        _emf_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+    def source(self, component: str, read: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Register the metrics of a component, replacing any source of the
+        same name.
+
+        Args:
+            component (str): Name of the component, e.g. "warmer". It
+                prefixes the name of each of its metrics.
+            read (Callable[[], Dict[str, Any]]): Returns the current values,
+                usually the component's metrics(). Non-numeric values are
+                left out.
+        """
+        with self._lock:
+            self._sources[component] = read
+
+    def read_sources(self) -> Dict[str, float]:
+        """
+        Read every registered source once.
+
+        Returns:
+            Dict[str, float]: Values keyed by "<component>_<metric>".
+        """
+        with self._lock:
+            sources = sorted(self._sources.items())
+        values: Dict[str, float] = {}
+        for component, read in sources:
+            try:
+                metrics = read()
+            except Exception as e:
+                logging.error(f"Error reading {component} metrics: {e}")
+                continue
+            for name, value in metrics.items():
+                if isinstance(value, (int, float)):
+                    values[f"{component}_{name}"] = float(value)
+        return values
+
+    def publish_sources(self) -> Dict[str, float]:
+        """
+        Write the current values of every source as one CloudWatch EMF
+        record when config.METRICS_EMF_ENABLED.
+
+        Returns:
+            Dict[str, float]: The values, as returned by read_sources().
+        """
+        values = self.read_sources()
+        if config.METRICS_EMF_ENABLED and values:
+            record = {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": config.METRICS_NAMESPACE,
+                            "Dimensions": [["Service"]],
+                            "Metrics": [
+                                {"Name": name, "Unit": _unit(name)}
+                                for name in values
+                            ],
+                        }
+                    ],
+                },
+                "Service": config.METRICS_SERVICE,
+                **values,
+            }
+            _emf_logger.info(json.dumps(record))
+        return values
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return count, mean and p50/p95/p99 of every stage.
+
+        Returns:
+            Dict[str, Dict[str, float]]: Statistics keyed by stage.
+        """
+        with self._lock:
+            return {
+                stage: {
+                    "count": h.count,
+                    "mean": h.sum / h.count if h.count else 0.0,
+                    "p50": h.quantile(0.50),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for stage, h in self._histograms.items()
+            }
+
+    def prometheus_text(self) -> str:
+        """
+        Render the histograms in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page.
+        """
+        name = "chat_stage_seconds"
+        lines: List[str] = [
+            f"# HELP {name} Latency of each stage of the request path.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets + [float("inf")], h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(
+                        f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}'
+                    )
+                lines.append(f'{name}_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+        for metric, value in self.read_sources().items():
+            lines.append(f"# TYPE chat_{metric} gauge")
+            lines.append(f"chat_{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+
+
+class ConcurrencyMetrics:
+    """
+    Load signals of this process, published for autoscaling.
+
+    The app is I/O bound: a task waiting on many slow agent calls uses
+    little CPU while users queue, so CPU is a poor scaling signal. Gauges
+    (active sessions, in-flight and queued backend calls) are read from
+    registered callables on every sample() and averaged; latencies (queue
+    wait, rerun) are observed as they happen. flush() writes the average
+    and maximum of each since the previous flush as one CloudWatch EMF
+    record, so CloudWatch's Average across tasks is the per-task load a
+    target tracking policy can scale on.
+    """
+
+    def __init__(self):
+        """
+        Initialize the ConcurrencyMetrics.
+        """
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._sessions: Set[str] = set()
+        # Per metric: [sum, max, count] since the last flush
+        self._values: Dict[str, List[float]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def gauge(self, name: str, read: Callable[[], float]) -> None:
+        """
+        Register a gauge, replacing any gauge of the same name.
+
+        Args:
+            name (str): Name of the metric, e.g. "in_flight_calls".
+            read (Callable[[], float]): Returns the current value.
+        """
+        with self._lock:
+            self._gauges[name] = read
+
+    def track_session(self, session_id: str) -> None:
+        """
+        Count a session as active until active_sessions finds it gone.
+
+        Args:
+            session_id (str): ID of the Streamlit session.
+        """
+        with self._lock:
+            self._sessions.add(session_id)
+
+    def active_sessions(self, is_active: Callable[[str], bool]) -> int:
+        """
+        Count the tracked sessions that are still active, forgetting the
+        others.
+
+        Args:
+            is_active (Callable[[str], bool]): Tells whether a session is
+                still connected.
+
+        Returns:
+            int: The active sessions.
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+        gone = {session_id for session_id in sessions if not is_active(session_id)}
+        with self._lock:
+            self._sessions -= gone
+        return len(sessions) - len(gone)
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Record one observation of a metric.
+
+        Args:
+            name (str): Name of the metric, e.g. "queue_wait_ms".
+            value (float): The observed value.
+        """
+        with self._lock:
+            values = self._values.setdefault(name, [0.0, 0.0, 0])
+            values[0] += value
+            values[1] = max(values[1], value)
+            values[2] += 1
+
+    @contextmanager
+    def rerun_timer(self) -> Iterator[None]:
+        """
+        Time a script or fragment run as "rerun_ms"; also usable as a
+        decorator. Nested timers on the same thread, such as a fragment run
+        as part of a full run, count once.
+        """
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if not depth:
+                self.observe("rerun_ms", (time.perf_counter() - start) * 1000)
+
+    def sample(self) -> None:
+        """
+        Read every gauge once.
+        """
+        with self._lock:
+            gauges = list(self._gauges.items())
+        for name, read in gauges:
+            try:
+                value = float(read())
+            except Exception as e:
+                logging.error(f"Error reading gauge {name}: {e}")
+                continue
+            self.observe(name, value)
+
+    def flush(self) -> Dict[str, float]:
+        """
+        Aggregate the values since the previous flush, write them as one
+        EMF record when config.METRICS_EMF_ENABLED, and start over.
+
+        Gauges are sampled once more first, so a flush always reports them.
+        Latencies without observations are reported as 0.
+
+        Returns:
+            Dict[str, float]: "<name>" (the average) and "<name>_max" per
+                metric.
+        """
+        self.sample()
+        with self._lock:
+            values, self._values = self._values, {}
+        aggregates: Dict[str, float] = {}
+        for name in sorted(set(values) | {"queue_wait_ms", "rerun_ms"}):
+            total, maximum, count = values.get(name, (0.0, 0.0, 0))
+            aggregates[name] = round(total / count, 3) if count else 0.0
+            aggregates[f"{name}_max"] = round(maximum, 3)
+        if config.METRICS_EMF_ENABLED:
+            record = {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": config.METRICS_NAMESPACE,
+                            "Dimensions": [["Service"]],
+                            "Metrics": [
+                                {"Name": name, "Unit": _unit(name)}
+                                for name in aggregates
+                            ],
+                        }
+                    ],
+                },
+                "Service": config.METRICS_SERVICE,
+                **aggregates,
+            }
+            _emf_logger.info(json.dumps(record))
+        return aggregates
+
+    def start(
+        self,
+        sample_seconds: float = config.METRICS_SAMPLE_SECONDS,
+        publish_seconds: float = config.METRICS_PUBLISH_SECONDS,
+    ) -> None:
+        """
+        Sample and flush in a background thread, publishing the component
+        sources of stage_metrics along with every flush. Calling it again is
+        a no-op.
+
+        Args:
+            sample_seconds (float): Seconds between gauge samples.
+            publish_seconds (float): Seconds between published records.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(sample_seconds, publish_seconds),
+                name="concurrency-metrics",
+                daemon=True,
+            )
+        self._thread.start()
+
+    def _run(self, sample_seconds: float, publish_seconds: float) -> None:
+        next_flush = time.monotonic() + publish_seconds
+        while True:
+            time.sleep(sample_seconds)
+            if time.monotonic() >= next_flush:
+                next_flush += publish_seconds
+                self.flush()
+                # Component metrics share the publishing schedule
+                stage_metrics.publish_sources()
+            else:
+                self.sample()
+
+
+def _unit(name: str) -> str:
+    if name.endswith(("_ms", "_ms_max")):
+        return "Milliseconds"
+    if "_seconds" in name:
+        return "Seconds"
+    if "_bytes" in name:
+        return "Bytes"
+    return "Count"
+
+
+concurrency_metrics = ConcurrencyMetrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = stage_metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_metrics_server(
+    host: str = config.METRICS_HOST, port: int = config.METRICS_PORT
+) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve stage_metrics at /metrics in a background thread.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on. 0 disables the endpoint.
+
+    Returns:
+        Optional[ThreadingHTTPServer]: The server, or None if disabled or
+            the port is taken.
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.error(f"Error starting metrics endpoint on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-http", daemon=True
+    ).start()
+    return server
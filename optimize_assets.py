@@ -0,0 +1,141 @@
+"""
+Offline asset optimization, run by build_assets.py --optimize.
+
+Fonts are subset to config.FONT_SUBSET_TEXT, pinned to their default
+variation instance and converted to WOFF2. PNGs listed in
+config.IMG_RENDER_WIDTHS are resampled to their rendered width plus a 2x
+version. budget_report() checks the result against config.PAGE_BYTE_BUDGET.
+
+fontTools, brotli and Pillow are build-time dependencies only
+(requirements-build.txt).
+"""
+import io
+import os
+from typing import Any, Dict, List, Tuple
+
+import config
+
+
+def subset_font(data: bytes, text: str = config.FONT_SUBSET_TEXT) -> bytes:
+    """
+    Subset a font to the given characters and convert it to WOFF2.
+
+    Variable fonts are pinned to the default value of each axis first, since
+    the UI only renders them at their regular weight.
+
+    Args:
+        data (bytes): TTF/OTF font content.
+        text (str): Characters the subset must cover.
+
+    Returns:
+        bytes: The WOFF2 font.
+    """
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    font = TTFont(io.BytesIO(data))
+    if "fvar" in font:
+        from fontTools.varLib import instancer
+
+        font = instancer.instantiateVariableFont(
+            font, {axis.axisTag: axis.defaultValue for axis in font["fvar"].axes}
+        )
+
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.desubroutinize = True
+    subsetter = subset.Subsetter(options=options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+
+    # Keep the output byte-identical across builds so fingerprints are stable
+    font.recalcTimestamp = False
+    out = io.BytesIO()
+    font.flavor = "woff2"
+    font.save(out)
+    return out.getvalue()
+
+
+def resample_image(data: bytes, width: int) -> bytes:
+    """
+    Resample an image to the given width, keeping its aspect ratio.
+
+    Images are never upscaled.
+
+    Args:
+        data (bytes): PNG content.
+        width (int): Target width in pixels.
+
+    Returns:
+        bytes: The resampled, optimized PNG.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if width < image.width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.LANCZOS)
+
+    out = io.BytesIO()
+    image.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def optimize(rel_path: str, data: bytes) -> List[Tuple[str, str, bytes]]:
+    """
+    Build the optimized variants of one asset.
+
+    Args:
+        rel_path (str): Path of the asset relative to config.ASSETS_DIR.
+        data (bytes): Original content.
+
+    Returns:
+        List[Tuple[str, str, bytes]]: (variant, extension, content) tuples,
+            where variant is "" for the main file and "2x" for the
+            high-density image. Assets without an optimization are returned
+            unchanged.
+    """
+    ext = os.path.splitext(rel_path)[1].lower()
+    if ext in (".ttf", ".otf"):
+        return [("", ".woff2", subset_font(data))]
+
+    widths = {
+        os.path.relpath(path, config.ASSETS_DIR).replace(os.sep, "/"): width
+        for path, width in config.IMG_RENDER_WIDTHS.items()
+    }
+    if ext == ".png" and rel_path in widths:
+        width = widths[rel_path]
+        return [
+            ("", ext, resample_image(data, width)),
+            ("2x", ext, resample_image(data, 2 * width)),
+        ]
+
+    return [("", ext, data)]
+
+
+def budget_report(
+    manifest: Dict[str, Dict[str, Any]], budget: int = config.PAGE_BYTE_BUDGET
+) -> Tuple[bool, List[str]]:
+    """
+    Compare the bytes a page load transfers against the budget.
+
+    Every asset in the manifest is used by the single page of the app. The
+    2x variant is counted where it exists, since that is what high-density
+    screens download.
+
+    Args:
+        manifest (Dict[str, Dict[str, Any]]): The asset manifest.
+        budget (int): Maximum bytes per page load.
+
+    Returns:
+        Tuple[bool, List[str]]: Whether the page fits the budget, and the
+            report lines.
+    """
+    lines = []
+    total = 0
+    for rel_path, entry in sorted(manifest.items()):
+        size = entry.get("bytes_2x", entry["bytes"])
+        total += size
+        lines.append(f"{size:>10}  {rel_path} -> {entry.get('file_2x', entry['file'])}")
+    lines.append(f"{total:>10}  total (budget {budget})")
+    return total <= budget, lines
@@ -0,0 +1,215 @@
+import base64
+import gzip
+import json
+import logging
+import threading
+from typing import Any, Dict
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    # Optional: the standard library encoder is used instead
+    orjson = None
+
+
+class PayloadCodec:
+    """
+    Encodes Lambda request payloads and decodes their responses.
+
+    JSON goes through orjson when it is installed. Requests can offer
+    response compression through an "accept_encoding" flag in the body; a
+    function that honours it answers with "content_encoding" set and the
+    compressed body base64-encoded, which is worth it for long answers with
+    tables. The body is a JSON document nested as a string in the envelope,
+    so decode() parses it in a second pass, after decompressing it, and
+    callers get body as a dict. Request and response sizes and the
+    compression ratio are counted, and a warning is logged for payloads
+    close to the Lambda payload limit.
+    """
+
+    def __init__(self, compression: str = config.PAYLOAD_COMPRESSION):
+        """
+        Initialize the PayloadCodec.
+
+        Args:
+            compression (str): Response compression to offer: "gzip",
+                "zstd" or "none". "zstd" needs the zstandard package and
+                falls back to "gzip" without it.
+        """
+        if compression == "zstd" and _zstd() is None:
+            logging.warning("zstandard is not installed, offering gzip instead")
+            compression = "gzip"
+        self.compression = compression
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "request_bytes": 0,
+            "max_request_bytes": 0,
+            "responses": 0,
+            "response_bytes": 0,
+            "body_bytes": 0,
+            "max_response_bytes": 0,
+            "compressed": 0,
+            "compressed_response_bytes": 0,
+            "compressed_body_bytes": 0,
+        }
+
+    def encode(self, payload: Dict[str, Any], negotiate: bool = True) -> bytes:
+        """
+        Serialize a request payload.
+
+        Args:
+            payload (Dict[str, Any]): The payload, with its "body" dict.
+            negotiate (bool): Offer response compression; False for
+                invocations whose response is not read.
+
+        Returns:
+            bytes: UTF-8 JSON.
+        """
+        if negotiate and self.compression != "none" and "body" in payload:
+            payload = {
+                **payload,
+                "body": {**payload["body"], "accept_encoding": self.compression},
+            }
+        data = dumps(payload)
+        with self._lock:
+            self._metrics["requests"] += 1
+            self._metrics["request_bytes"] += len(data)
+            self._metrics["max_request_bytes"] = max(
+                self._metrics["max_request_bytes"], len(data)
+            )
+        self._check_size("Request", len(data))
+        return data
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        """
+        Parse a response payload, then its nested body.
+
+        Args:
+            data (bytes): The raw response payload.
+
+        Returns:
+            Dict[str, Any]: The response, with "body" decompressed and parsed
+                when it holds a JSON object. The byte sizes are added as
+                "_bytes".
+        """
+        result = loads(data)
+        body = result.get("body") if isinstance(result, dict) else None
+        body_bytes = 0
+        encoding = result.get("content_encoding") if body is not None else None
+        if isinstance(body, str):
+            raw = body.encode("utf-8")
+            if encoding:
+                raw = decompress(base64.b64decode(raw), encoding)
+                del result["content_encoding"]
+            body_bytes = len(raw)
+            try:
+                result["body"] = loads(raw)
+            except ValueError:
+                # Not JSON: callers get the string as it was sent
+                result["body"] = raw.decode("utf-8")
+        with self._lock:
+            self._metrics["responses"] += 1
+            self._metrics["response_bytes"] += len(data)
+            self._metrics["body_bytes"] += body_bytes
+            if encoding:
+                self._metrics["compressed"] += 1
+                self._metrics["compressed_response_bytes"] += len(data)
+                self._metrics["compressed_body_bytes"] += body_bytes
+            self._metrics["max_response_bytes"] = max(
+                self._metrics["max_response_bytes"], len(data)
+            )
+        self._check_size("Response", len(data))
+        if isinstance(result, dict):
+            result["_bytes"] = {"response": len(data), "body": body_bytes}
+        return result
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Return request and response counts, byte totals and the compression
+        ratio of compressed responses (decoded body bytes per payload byte).
+
+        Returns:
+            Dict[str, float]: The counters and the ratio, 0.0 until a
+                compressed response has been decoded.
+        """
+        with self._lock:
+            metrics: Dict[str, float] = dict(self._metrics)
+        metrics["compression_ratio"] = (
+            metrics["compressed_body_bytes"] / metrics["compressed_response_bytes"]
+            if metrics["compressed_response_bytes"]
+            else 0.0
+        )
+        return metrics
+
+    @staticmethod
+    def _check_size(kind: str, size: int) -> None:
+        if size > config.PAYLOAD_LIMIT_BYTES * config.PAYLOAD_WARN_RATIO:
+            logging.warning(
+                f"{kind} payload of {size} bytes is close to the "
+                f"{config.PAYLOAD_LIMIT_BYTES} byte Lambda limit"
+            )
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Serialize to UTF-8 JSON, with orjson when available.
+
+    Args:
+        value (Any): The value to serialize.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """
+    Parse JSON from bytes or str, with orjson when available.
+
+    Args:
+        data (Any): The JSON document.
+
+    Returns:
+        Any: The parsed value.
+
+    Raises:
+        ValueError: If data is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """
+    Decompress a response body.
+
+    Args:
+        data (bytes): The compressed body.
+        encoding (str): "gzip" or "zstd".
+
+    Returns:
+        bytes: The decompressed body.
+
+    Raises:
+        ValueError: If the encoding is not supported.
+    """
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd" and _zstd() is not None:
+        return _zstd().ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def _zstd() -> Any:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
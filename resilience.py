@@ -0,0 +1,231 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import config
+
+
+class CircuitOpen(Exception):
+    """
+    Raised when a call is rejected because the circuit breaker is open.
+    """
+
+
+class LatencyTracker:
+    """
+    Rolling window of recent call latencies.
+    """
+
+    def __init__(self, window: int = config.HEDGE_LATENCY_WINDOW):
+        """
+        Initialize the LatencyTracker.
+
+        Args:
+            window (int): Number of latencies kept.
+        """
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        """
+        Record the latency of a call.
+
+        Args:
+            seconds (float): Latency of the call.
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Return a percentile of the recorded latencies.
+
+        Args:
+            q (float): Percentile between 0 and 100.
+
+        Returns:
+            Optional[float]: The percentile, or None until
+                config.HEDGE_MIN_SAMPLES latencies were recorded.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < config.HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+
+class HedgeBudget:
+    """
+    Token bucket limiting hedged invocations to a fraction of all calls.
+
+    Every call earns ratio tokens, up to burst, and every hedge spends one,
+    so a degraded backend cannot double its own load.
+    """
+
+    def __init__(
+        self,
+        ratio: float = config.HEDGE_BUDGET_RATIO,
+        burst: float = config.HEDGE_BUDGET_BURST,
+    ):
+        """
+        Initialize the HedgeBudget.
+
+        Args:
+            ratio (float): Hedges allowed per call.
+            burst (float): Maximum tokens saved up.
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = burst
+
+    def earn(self) -> None:
+        """
+        Credit the budget for one call.
+        """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def spend(self) -> bool:
+        """
+        Take one hedge from the budget.
+
+        Returns:
+            bool: False if the budget is exhausted.
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker.
+
+    The breaker opens when at least config.BREAKER_FAILURE_RATE of the calls
+    within the last config.BREAKER_WINDOW_SECONDS failed, once that window
+    holds config.BREAKER_MIN_CALLS calls. While open, calls are rejected
+    with CircuitOpen. After config.BREAKER_OPEN_SECONDS the breaker turns
+    half-open and lets a single probe through: its success closes the
+    breaker, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_rate: float = config.BREAKER_FAILURE_RATE,
+        min_calls: int = config.BREAKER_MIN_CALLS,
+        window_seconds: float = config.BREAKER_WINDOW_SECONDS,
+        open_seconds: float = config.BREAKER_OPEN_SECONDS,
+    ):
+        """
+        Initialize the CircuitBreaker.
+
+        Args:
+            failure_rate (float): Failure ratio that opens the breaker.
+            min_calls (int): Calls needed in the window before it can open.
+            window_seconds (float): Seconds of outcomes considered.
+            open_seconds (float): Seconds the breaker stays open before a
+                probe, and the longest a probe may stay unanswered.
+        """
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._state = self.CLOSED
+        self._changed_at = time.monotonic()
+        self._probe_started: Optional[float] = None
+        self._metrics = {"opened": 0, "rejected": 0, "probes": 0}
+
+    def check(self) -> None:
+        """
+        Let a call through or reject it.
+
+        Raises:
+            CircuitOpen: If the breaker is open, or half-open with its probe
+                still pending.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._state == self.OPEN
+                and now - self._changed_at >= self.open_seconds
+            ):
+                self._set_state(self.HALF_OPEN, now)
+            if self._state == self.CLOSED:
+                return
+            # A probe that never reported back must not wedge the breaker
+            if self._state == self.HALF_OPEN and (
+                self._probe_started is None
+                or now - self._probe_started >= self.open_seconds
+            ):
+                self._probe_started = now
+                self._metrics["probes"] += 1
+                return
+            self._metrics["rejected"] += 1
+            state = self._state
+        raise CircuitOpen(f"Circuit breaker {state}")
+
+    def record(self, success: bool) -> None:
+        """
+        Record the outcome of a call.
+
+        Args:
+            success (bool): Whether the call succeeded.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_started = None
+                self._set_state(self.CLOSED if success else self.OPEN, now)
+                return
+            self._outcomes.append((now, success))
+            horizon = now - self.window_seconds
+            while self._outcomes and self._outcomes[0][0] < horizon:
+                self._outcomes.popleft()
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (
+                self._state == self.CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and failures >= self.failure_rate * len(self._outcomes)
+            ):
+                self._set_state(self.OPEN, now)
+
+    @property
+    def state(self) -> str:
+        """
+        Current state: "closed", "open" or "half_open".
+        """
+        with self._lock:
+            return self._state
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Return the breaker state, its error rate and rejection counters.
+
+        Returns:
+            Dict[str, float]: The breaker metrics.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            calls = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            metrics["state"] = self._state
+            metrics["error_rate"] = failures / calls if calls else 0.0
+        return metrics
+
+    def _set_state(self, state: str, now: float) -> None:
+        if state == self.OPEN:
+            self._metrics["opened"] += 1
+        if state == self.CLOSED:
+            self._outcomes.clear()
+        self._state = state
+        self._changed_at = now
@@ -0,0 +1,546 @@
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import config
+from payload_codec import dumps, loads
+
+
+class CacheBackend(ABC):
+    """
+    Key-value store for answers, single-flight claims and counters, shared
+    by whatever processes use the same backend.
+
+    Every backend has the same semantics: values are strings stored as
+    UTF-8, an entry with a TTL is never returned once it has expired, and
+    when the size budget is exceeded the least recently used entries are
+    evicted. Counters never expire and are not evicted.
+    """
+
+    # Whether other processes see the same entries
+    shared = True
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the value of a key.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            Optional[str]: The value, or None if absent or expired.
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """
+        Store a value.
+
+        Args:
+            key (str): The key.
+            value (str): The value.
+            ttl (Optional[float]): Seconds until it expires; None keeps it
+                until evicted.
+        """
+
+    @abstractmethod
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """
+        Store a value only if the key is absent or expired, atomically.
+
+        Args:
+            key (str): The key.
+            value (str): The value.
+            ttl (Optional[float]): Seconds until it expires.
+
+        Returns:
+            bool: True if the value was stored.
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Remove a key.
+
+        Args:
+            key (str): The key.
+        """
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1) -> int:
+        """
+        Add to a counter, creating it at 0.
+
+        Args:
+            key (str): Name of the counter.
+            amount (int): Value to add.
+
+        Returns:
+            int: The new value.
+        """
+
+    @abstractmethod
+    def counter(self, key: str) -> int:
+        """
+        Read a counter.
+
+        Args:
+            key (str): Name of the counter.
+
+        Returns:
+            int: Its value, 0 if it was never incremented.
+        """
+
+    def get_json(self, key: str) -> Any:
+        """
+        Return a JSON value stored with set_json.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            Any: The value, or None if absent or expired.
+        """
+        value = self.get(key)
+        return None if value is None else loads(value)
+
+    def set_json(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a JSON-serializable value.
+
+        Args:
+            key (str): The key.
+            value (Any): The value.
+            ttl (Optional[float]): Seconds until it expires.
+        """
+        self.set(key, dumps(value).decode("utf-8"), ttl)
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process backend: a byte-bounded LRU dict. Nothing is shared with
+    other processes.
+    """
+
+    shared = False
+
+    def __init__(self, max_bytes: int = config.CACHE_BACKEND_MAX_BYTES):
+        """
+        Initialize the MemoryBackend.
+
+        Args:
+            max_bytes (int): Maximum total UTF-8 size of keys and values.
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, Optional[float], int]]" = (
+            OrderedDict()
+        )
+        self._counters: Dict[str, int] = {}
+        self._size = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl, time.time())
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, value, ttl, now)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = self._counters.get(key, 0) + amount
+            self._counters[key] = value
+            return value
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def _live(self, key: str, now: float) -> Optional[Tuple[Any, ...]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            self._remove(key)
+            return None
+        return entry
+
+    def _store(self, key: str, value: str, ttl: Optional[float], now: float) -> None:
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+        self._remove(key)
+        if size > self.max_bytes:
+            return
+        if self._size + size > self.max_bytes:
+            for k in [
+                k for k, e in self._entries.items() if e[1] is not None and e[1] <= now
+            ]:
+                self._remove(k)
+        while self._size + size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        self._entries[key] = (value, None if ttl is None else now + ttl, size)
+        self._size += size
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    SQLite backend for several processes on one host, such as multiple
+    Streamlit workers sharing a volume. The database runs in WAL mode and is
+    read through a memory map, so lookups do not copy pages through the
+    kernel. Each thread has its own connection.
+    """
+
+    def __init__(self, path: str, max_bytes: int = config.CACHE_BACKEND_MAX_BYTES):
+        """
+        Initialize the SQLiteBackend, creating the database if needed.
+
+        Args:
+            path (str): Database file.
+            max_bytes (int): Maximum total UTF-8 size of keys and values.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL,"
+                " size INTEGER NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(f"PRAGMA mmap_size={config.CACHE_SQLITE_MMAP_BYTES}")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[str]:
+        db = self._connection()
+        now = time.time()
+        row = db.execute(
+            "SELECT value FROM entries WHERE key = ?"
+            " AND (expires IS NULL OR expires > ?)",
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._write(key, value, ttl, replace=True)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return self._write(key, value, ttl, replace=False)
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        db = self._connection()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "INSERT INTO counters (key, value) VALUES (?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = value + excluded.value",
+                (key, amount),
+            )
+            return db.execute(
+                "SELECT value FROM counters WHERE key = ?", (key,)
+            ).fetchone()[0]
+
+    def counter(self, key: str) -> int:
+        row = (
+            self._connection()
+            .execute("SELECT value FROM counters WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return row[0] if row else 0
+
+    def _write(
+        self, key: str, value: str, ttl: Optional[float], replace: bool
+    ) -> bool:
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return False
+        now = time.time()
+        db = self._connection()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            if not replace:
+                live = db.execute(
+                    "SELECT 1 FROM entries WHERE key = ?"
+                    " AND (expires IS NULL OR expires > ?)",
+                    (key, now),
+                ).fetchone()
+                if live:
+                    return False
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            used = self._used(db)
+            if used + size > self.max_bytes:
+                db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+                used = self._used(db)
+            while used + size > self.max_bytes:
+                oldest = db.execute(
+                    "SELECT key, size FROM entries ORDER BY accessed LIMIT 1"
+                ).fetchone()
+                db.execute("DELETE FROM entries WHERE key = ?", (oldest[0],))
+                used -= oldest[1]
+            db.execute(
+                "INSERT INTO entries (key, value, expires, accessed, size)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value, None if ttl is None else now + ttl, now, size),
+            )
+        return True
+
+    @staticmethod
+    def _used(db: sqlite3.Connection) -> int:
+        return db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+class RedisError(Exception):
+    """
+    Error reply from a Redis server, or a reply that cannot be understood.
+    """
+
+
+class RedisProtocolError(RedisError):
+    """
+    Reply that breaks the Redis protocol. The connection it came from is out
+    of step with the server and cannot be reused.
+    """
+
+
+class RedisBackend(CacheBackend):
+    """
+    Backend speaking the Redis protocol (RESP) to a Redis-compatible server,
+    shared by every task of the service.
+
+    TTLs use the server's expiry. Eviction is the server's: it must run with
+    a maxmemory limit and the allkeys-lru policy, and counters must not be
+    evicted, to behave like the other backends.
+    """
+
+    def __init__(self, url: str, pool_size: int = config.CACHE_REDIS_POOL_SIZE):
+        """
+        Initialize the RedisBackend. Connections are opened on first use.
+
+        Args:
+            url (str): redis://[:password@]host[:port][/db]
+            pool_size (int): Maximum idle connections kept open.
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._pool: "queue.LifoQueue[Any]" = queue.LifoQueue(maxsize=pool_size)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.execute("GET", key)
+        try:
+            return None if value is None else value.decode("utf-8")
+        except (AttributeError, UnicodeDecodeError) as e:
+            raise RedisError(f"Unexpected value for {key}: {value!r}") from e
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.execute("SET", key, value, *self._expiry(ttl))
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return self.execute("SET", key, value, "NX", *self._expiry(ttl)) is not None
+
+    def delete(self, key: str) -> None:
+        self.execute("DEL", key)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return self.execute("INCRBY", key, amount)
+
+    def counter(self, key: str) -> int:
+        value = self.execute("GET", key)
+        try:
+            return int(value) if value is not None else 0
+        except (TypeError, ValueError) as e:
+            raise RedisError(f"Unexpected counter value for {key}: {value!r}") from e
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> List[Any]:
+        return [] if ttl is None else ["PX", max(1, int(ttl * 1000))]
+
+    def execute(self, *args: Any) -> Any:
+        """
+        Send one command and read its reply.
+
+        Args:
+            *args (Any): Command name and arguments.
+
+        Returns:
+            Any: The reply: bytes, int, None or a list of those.
+
+        Raises:
+            RedisError: If the server replies with an error, or with a reply
+                that breaks the protocol.
+            OSError: If the server cannot be reached.
+        """
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+        try:
+            connection[0].sendall(_encode_command(args))
+            reply = _read_reply(connection[1])
+        except RedisProtocolError:
+            _close(connection)
+            raise
+        except RedisError:
+            # An error reply was read in full: the connection is still usable
+            self._release(connection)
+            raise
+        except BaseException:
+            _close(connection)
+            raise
+        self._release(connection)
+        return reply
+
+    def _connect(self) -> Tuple[socket.socket, Any]:
+        sock = socket.create_connection(
+            (self.host, self.port), timeout=config.CACHE_REDIS_TIMEOUT_SECONDS
+        )
+        connection = (sock, sock.makefile("rb"))
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.password:
+                connection[0].sendall(_encode_command(("AUTH", self.password)))
+                _read_reply(connection[1])
+            if self.db:
+                connection[0].sendall(_encode_command(("SELECT", self.db)))
+                _read_reply(connection[1])
+        except BaseException:
+            _close(connection)
+            raise
+        return connection
+
+    def _release(self, connection: Tuple[socket.socket, Any]) -> None:
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            _close(connection)
+
+
+def _close(connection: Tuple[socket.socket, Any]) -> None:
+    # The socket stays open until its file object is closed too
+    connection[1].close()
+    connection[0].close()
+
+
+def _encode_command(args: Tuple[Any, ...]) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode("ascii")]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(f"${len(data)}\r\n".encode("ascii") + data + b"\r\n")
+    return b"".join(parts)
+
+
+def _read_reply(stream: Any) -> Any:
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("Connection closed by the Redis server")
+    if not line.endswith(b"\r\n"):
+        raise RedisProtocolError(f"Truncated Redis reply: {line!r}")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        raise RedisError(rest.decode("utf-8", "replace"))
+    if kind not in (b":", b"$", b"*"):
+        raise RedisProtocolError(f"Unexpected Redis reply: {line!r}")
+    try:
+        number = int(rest)
+    except ValueError as e:
+        raise RedisProtocolError(f"Unexpected Redis reply: {line!r}") from e
+    if kind == b":":
+        return number
+    if kind == b"$":
+        if number < 0:
+            return None
+        data = stream.read(number + 2)
+        if len(data) < number + 2:
+            raise ConnectionError("Connection closed by the Redis server")
+        if not data.endswith(b"\r\n"):
+            raise RedisProtocolError(f"Malformed Redis bulk reply: {data!r}")
+        return data[:-2]
+    if number < 0:
+        return None
+    # An error inside an array leaves the rest of it unread
+    try:
+        return [_read_reply(stream) for _ in range(number)]
+    except RedisProtocolError:
+        raise
+    except RedisError as e:
+        raise RedisProtocolError(f"Error inside a Redis array: {e}") from e
+
+
+def create_backend(url: str = config.CACHE_BACKEND_URL) -> CacheBackend:
+    """
+    Create the backend a URL names.
+
+    Args:
+        url (str): "memory://", "sqlite:///path/to/cache.db" or
+            "redis://host:port/db".
+
+    Returns:
+        CacheBackend: The backend.
+
+    Raises:
+        ValueError: If the scheme is not supported.
+    """
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme == "sqlite":
+        # sqlite:///relative/path or sqlite:////absolute/path
+        return SQLiteBackend(url[len("sqlite:///") :])
+    if scheme == "redis":
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported cache backend: {url}")
+
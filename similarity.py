@@ -0,0 +1,325 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import config
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_THOUSANDS = re.compile(r"\b\d{1,3}(?:[.,]\d{3})+\b")
+_DECIMAL_COMMA = re.compile(r"\b(\d+),(\d+)\b")
+_TOKEN = re.compile(r"\d+(?:\.\d+)?|[a-z]+")
+
+
+def normalize_spanish(text: str) -> FrozenSet[str]:
+    """
+    Reduce a Spanish question to its set of content tokens.
+
+    Folds accents and case, canonicalizes numbers ("1.500" and "1,500" become
+    "1500", "2,5" becomes "2.5"), drops greetings and stopwords, and strips a
+    trailing plural "s".
+
+    Args:
+        text (str): The user's query.
+
+    Returns:
+        FrozenSet[str]: The content tokens.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    for greeting in config.NEAR_DUP_GREETINGS:
+        text = re.sub(rf"\b{greeting}\b", " ", text)
+    text = _THOUSANDS.sub(lambda m: re.sub(r"[.,]", "", m.group()), text)
+    text = _DECIMAL_COMMA.sub(r"\1.\2", text)
+
+    tokens = set()
+    for token in _TOKEN.findall(text):
+        if token in config.NEAR_DUP_STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token[0].isdigit():
+            token = token[:-1]
+        tokens.add(token)
+    return frozenset(tokens)
+
+
+def is_near_duplicate(
+    tokens: FrozenSet[str], candidate: FrozenSet[str], threshold: float
+) -> bool:
+    """
+    Decide whether two questions ask for the same statistic.
+
+    The Jaccard similarity of their content tokens must reach the threshold,
+    and besides:
+
+    - numbers (years, amounts) and negations ("no", "sin") must be the same;
+    - neither question may only add words to the other: an extra qualifier
+      such as "rural" or "de mujeres" asks for a different figure;
+    - questions of up to config.NEAR_DUP_EXACT_MAX_TOKENS content tokens
+      must have exactly the same ones.
+
+    Args:
+        tokens (FrozenSet[str]): Content tokens of the query.
+        candidate (FrozenSet[str]): Content tokens of an answered query.
+        threshold (float): Minimum Jaccard similarity.
+
+    Returns:
+        bool: True if the answer to candidate also answers the query.
+    """
+    if tokens == candidate:
+        return True
+    if max(len(tokens), len(candidate)) <= config.NEAR_DUP_EXACT_MAX_TOKENS:
+        return False
+    if tokens < candidate or candidate < tokens:
+        return False
+    for token in tokens ^ candidate:
+        if token[0].isdigit() or token in config.NEAR_DUP_NEGATIONS:
+            return False
+    return len(tokens & candidate) / len(tokens | candidate) >= threshold
+
+
+@dataclass
+class Match:
+    """
+    A previously answered query similar to the one looked up.
+    """
+
+    answer: str
+    query: str
+    similarity: float
+    created: float
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of answered questions.
+
+    Queries are reduced to content tokens (see normalize_spanish), signed
+    with config.NEAR_DUP_PERMUTATIONS MinHash permutations and bucketed in
+    config.NEAR_DUP_BANDS LSH bands. Candidates that share a band are
+    verified with is_near_duplicate.
+
+    The index persists to a gzipped JSON lines file, so a new task can start
+    from the answers another one already collected.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = config.NEAR_DUP_INDEX_PATH,
+        threshold: float = config.NEAR_DUP_THRESHOLD,
+        max_entries: int = config.NEAR_DUP_MAX_ENTRIES,
+        ttl_seconds: float = config.ANSWER_CACHE_TTL_SECONDS,
+    ):
+        """
+        Initialize the NearDuplicateIndex and load it from disk.
+
+        Args:
+            path (Optional[str]): File the index persists to. None disables
+                persistence.
+            threshold (float): Minimum Jaccard similarity of a match.
+            max_entries (int): Maximum number of indexed questions.
+            ttl_seconds (float): Seconds an answer stays valid.
+        """
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        rng = random.Random(config.NEAR_DUP_SEED)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(config.NEAR_DUP_PERMUTATIONS)
+        ]
+        self._rows = config.NEAR_DUP_PERMUTATIONS // config.NEAR_DUP_BANDS
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[FrozenSet[str], Tuple[str, str, float]]" = (
+            OrderedDict()
+        )
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[FrozenSet[str]]] = (
+            defaultdict(set)
+        )
+        self._unsaved = 0
+        self._hits = 0
+        self._misses = 0
+        if path:
+            self.load()
+
+    def signature(self, tokens: FrozenSet[str]) -> List[int]:
+        """
+        Compute the MinHash signature of a token set.
+
+        Args:
+            tokens (FrozenSet[str]): Content tokens of a query.
+
+        Returns:
+            List[int]: One minimum hash per permutation.
+        """
+        hashes = [zlib.crc32(token.encode("utf-8")) for token in tokens]
+        return [
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._permutations
+        ]
+
+    def lookup(
+        self,
+        query: str,
+        threshold: Optional[float] = None,
+        include_expired: bool = False,
+    ) -> Optional[Match]:
+        """
+        Find the most similar previously answered query.
+
+        Args:
+            query (str): The user's query.
+            threshold (Optional[float]): Minimum similarity. Defaults to the
+                index threshold.
+            include_expired (bool): Whether answers past their TTL may match,
+                for when no fresh answer can be obtained.
+
+        Returns:
+            Optional[Match]: The best match at or above the threshold, or None.
+        """
+        tokens = normalize_spanish(query)
+        if not tokens:
+            return None
+        if threshold is None:
+            threshold = self.threshold
+        now = time.time()
+        best = None
+        with self._lock:
+            for candidate in self._candidates(tokens):
+                answer, source, created = self._entries[candidate]
+                if created + self.ttl_seconds <= now and not include_expired:
+                    continue
+                similarity = len(tokens & candidate) / len(tokens | candidate)
+                if is_near_duplicate(tokens, candidate, threshold) and (
+                    best is None or similarity > best.similarity
+                ):
+                    best = Match(answer, source, similarity, created)
+            if best is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return best
+
+    def add(self, query: str, answer: str, created: Optional[float] = None) -> None:
+        """
+        Index an answered query.
+
+        Args:
+            query (str): The user's query.
+            answer (str): The agent's answer.
+            created (Optional[float]): Epoch time of the answer. Defaults to now.
+        """
+        tokens = normalize_spanish(query)
+        if not tokens:
+            return
+        with self._lock:
+            self._insert(tokens, answer, query, created or time.time())
+            self._unsaved += 1
+            should_save = self._unsaved >= config.NEAR_DUP_SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def load(self) -> None:
+        """
+        Load the index from its file, skipping expired answers.
+        """
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+        except (OSError, EOFError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.error(f"Error loading near-duplicate index: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for record in records:
+                tokens = normalize_spanish(record["query"])
+                if tokens and record["created"] + self.ttl_seconds > now:
+                    self._insert(
+                        tokens, record["answer"], record["query"], record["created"]
+                    )
+
+    def save(self) -> None:
+        """
+        Atomically write the index to its file.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            records = [
+                {"query": query, "answer": answer, "created": created}
+                for answer, query, created in self._entries.values()
+            ]
+            self._unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Error saving near-duplicate index: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return hit/miss counters and the index size.
+
+        Returns:
+            Dict[str, float]: The index statistics.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _bands(self, tokens: FrozenSet[str]) -> List[Tuple[int, Tuple[int, ...]]]:
+        signature = self.signature(tokens)
+        return [
+            (band, tuple(signature[band * self._rows : (band + 1) * self._rows]))
+            for band in range(config.NEAR_DUP_BANDS)
+        ]
+
+    def _candidates(self, tokens: FrozenSet[str]) -> Set[FrozenSet[str]]:
+        candidates = set()
+        for band in self._bands(tokens):
+            candidates |= self._buckets.get(band, set())
+        return candidates
+
+    def _insert(
+        self, tokens: FrozenSet[str], answer: str, query: str, created: float
+    ) -> None:
+        if tokens in self._entries:
+            self._remove(tokens)
+        self._entries[tokens] = (answer, query, created)
+        for band in self._bands(tokens):
+            self._buckets[band].add(tokens)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, tokens: FrozenSet[str]) -> None:
+        del self._entries[tokens]
+        for band in self._bands(tokens):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(tokens)
+                if not bucket:
+                    del self._buckets[band]
+
+
+near_duplicates = NearDuplicateIndex()
+atexit.register(near_duplicates.save)
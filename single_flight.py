@@ -0,0 +1,164 @@
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict
+
+import config
+
+
+class _Flight:
+    def __init__(self, future: Future):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls that are in flight at the same time.
+
+    The first caller for a key starts the call; callers arriving before it
+    completes attach to the same future instead of starting their own, up to
+    max_waiters per key. The call is cancelled only once every waiter has
+    left, so one user giving up does not fail the others. Completed calls
+    are forgotten immediately: later callers are served by the answer cache.
+
+    start() runs outside the lock, so it may block, for instance waiting for
+    admission. Callers arriving meanwhile already attach to the flight; if
+    start() raises, they all get its exception.
+    """
+
+    def __init__(self, max_waiters: int = config.SINGLE_FLIGHT_MAX_WAITERS):
+        """
+        Initialize the SingleFlight.
+
+        Args:
+            max_waiters (int): Maximum callers sharing one call. Callers past
+                the limit start a call of their own.
+        """
+        self.max_waiters = max_waiters
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._metrics = {"calls": 0, "coalesced": 0, "overflow": 0, "abandoned": 0}
+
+    def join(self, key: str, start: Callable[[], Future]) -> Future:
+        """
+        Attach to the call in flight for a key, starting it if there is none.
+
+        Every join must be paired with a leave, unless start() raised.
+
+        Args:
+            key (str): Identifies identical calls.
+            start (Callable[[], Future]): Starts the call.
+
+        Returns:
+            Future: The shared future of the call.
+
+        Raises:
+            Exception: Whatever start() raises, when this caller started the
+                call.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.waiters < self.max_waiters:
+                flight.waiters += 1
+                self._metrics["coalesced"] += 1
+                return flight.future
+            if flight is not None:
+                # Over the waiter limit: an independent, unshared call
+                self._metrics["overflow"] += 1
+                shared = None
+            else:
+                self._metrics["calls"] += 1
+                shared = Future()
+                flight = self._flights[key] = _Flight(shared)
+                flight.waiters = 1
+        if shared is None:
+            return start()
+        # The callback runs at once if the flight is already done
+        shared.add_done_callback(lambda _: self._forget(key, shared))
+        try:
+            future = start()
+        except BaseException as e:
+            _settle(shared, exception=e)
+            raise
+        future.add_done_callback(lambda done: _copy(done, shared))
+
+        def on_shared_done(_: Future) -> None:
+            # Every waiter left: the call itself is abandoned
+            if shared.cancelled():
+                future.cancel()
+
+        shared.add_done_callback(on_shared_done)
+        return shared
+
+    def in_flight(self, key: str) -> bool:
+        """
+        Check whether a call for a key is in flight.
+
+        Args:
+            key (str): Identifies identical calls.
+
+        Returns:
+            bool: True if a join would attach to an existing call.
+        """
+        with self._lock:
+            return key in self._flights
+
+    def leave(self, key: str, future: Future) -> None:
+        """
+        Detach from a call, cancelling it if no waiter is left and it has
+        not started yet.
+
+        Args:
+            key (str): Key passed to join.
+            future (Future): Future returned by join.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.future is future:
+                flight.waiters -= 1
+                if flight.waiters > 0:
+                    return
+                # Nobody joins a call that is about to be cancelled
+                del self._flights[key]
+            if future.done():
+                return
+            self._metrics["abandoned"] += 1
+        future.cancel()
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Return the number of calls started and of invocations saved.
+
+        Returns:
+            Dict[str, int]: The single-flight metrics.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["in_flight"] = len(self._flights)
+        return metrics
+
+    def _forget(self, key: str, future: Future) -> None:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.future is future:
+                del self._flights[key]
+
+
+def _copy(source: Future, target: Future) -> None:
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        _settle(target, exception=source.exception())
+    else:
+        _settle(target, result=source.result())
+
+
+def _settle(future: Future, result: Any = None, exception: Any = None) -> None:
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        # Cancelled by its last waiter in the meantime
+        pass
@@ -0,0 +1,357 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: spool directories are then not locked
+    fcntl = None
+
+
+class EventSpool:
+    """
+    Append-only on-disk spool for fire-and-forget events.
+
+    Events are appended as JSON lines to numbered segment files and become
+    durable when a background thread fsyncs the active segment, at most
+    config.SPOOL_FSYNC_SECONDS later. A second thread delivers them in
+    append order, retrying the oldest undelivered event with backoff, so
+    events of a session always arrive in order. The delivery cursor is
+    persisted, so events survive restarts, and fully delivered segments are
+    deleted.
+
+    Each process writes to a new segment, so a line torn by a crash is never
+    continued. Lines that cannot be decoded, and events still failing after
+    max_attempts deliveries, are moved to dead-letter.log instead of
+    blocking the events behind them. Both threads are restarted if they
+    fail.
+
+    The segments and the cursor assume a single writer and a single
+    deliverer, so a spool holds an exclusive lock on its directory for the
+    life of the process. When another process already holds it, for
+    instance a second app process sharing SPOOL_DIR, the spool uses the
+    first free "slot-<n>" subdirectory instead. Events left undelivered in
+    a slot no longer in use are moved to the spool that owns the directory
+    itself when it starts. Ordering only holds within a slot.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        deliver: Callable[[Dict[str, Any]], Any],
+        segment_bytes: int = config.SPOOL_SEGMENT_BYTES,
+        max_bytes: int = config.SPOOL_MAX_BYTES,
+        max_attempts: int = config.SPOOL_MAX_ATTEMPTS,
+    ):
+        """
+        Initialize the EventSpool and start its background threads.
+
+        Args:
+            directory (str): Directory holding the segments and the cursor,
+                or the slot subdirectories when it is in use by another
+                process.
+            deliver (Callable[[Dict[str, Any]], Any]): Delivers one event
+                payload. A falsy return value or an exception means the
+                delivery failed and will be retried.
+            segment_bytes (int): Size at which a new segment is started.
+            max_bytes (int): Maximum total size of the segments on disk.
+            max_attempts (int): Delivery attempts before an event is
+                dead-lettered.
+        """
+        self.directory, self._lock_file = _lock_directory(directory)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_attempts = max_attempts
+        self._deliver = deliver
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dirty = threading.Event()
+        self._metrics = {
+            "appended": 0,
+            "rejected": 0,
+            "delivered": 0,
+            "retries": 0,
+            "dead_lettered": 0,
+            "corrupt": 0,
+            "restarts": 0,
+            "adopted": 0,
+        }
+
+        self._cursor = self._load_cursor()
+        segments = self._segments()
+        # Never append after what a previous process left, possibly torn
+        self._active_seq = max([self._cursor[0]] + [seq + 1 for seq in segments])
+        self._active = open(self._segment_path(self._active_seq), "ab")
+        if self.directory == directory:
+            self._adopt_slots()
+
+        for target, name in (
+            (self._sync_loop, "fsync"),
+            (self._deliver_loop, "deliver"),
+        ):
+            threading.Thread(
+                target=self._supervise,
+                args=(target,),
+                name=f"spool-{name}-{os.path.basename(self.directory)}",
+                daemon=True,
+            ).start()
+
+    def append(self, payload: Dict[str, Any], session_id: str = "") -> bool:
+        """
+        Append an event to the spool.
+
+        Args:
+            payload (Dict[str, Any]): The event payload to deliver.
+            session_id (str): Session the event belongs to.
+
+        Returns:
+            bool: False if the spool is full and the event was not accepted.
+        """
+        record = {
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "created": time.time(),
+            "payload": payload,
+        }
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._disk_usage() + len(line) > self.max_bytes:
+                self._metrics["rejected"] += 1
+                logging.error(f"Spool {self.directory} is full, rejecting event")
+                return False
+            self._write(line)
+            self._active.flush()
+            self._metrics["appended"] += 1
+        self._dirty.set()
+        self._wakeup.set()
+        return True
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Return event counters and the spool's disk usage.
+
+        Returns:
+            Dict[str, int]: The spool metrics.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["disk_bytes"] = self._disk_usage()
+            metrics["segments"] = len(self._segments())
+        return metrics
+
+    def _segment_path(self, seq: int, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.directory, f"segment-{seq:012d}.log")
+
+    def _segments(self, directory: Optional[str] = None) -> List[int]:
+        return sorted(
+            int(name[len("segment-") : -len(".log")])
+            for name in os.listdir(directory or self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+
+    def _disk_usage(self) -> int:
+        return sum(
+            os.path.getsize(self._segment_path(seq)) for seq in self._segments()
+        )
+
+    def _write(self, line: bytes) -> None:
+        # Callers hold self._lock
+        if self._active.tell() + len(line) > self.segment_bytes:
+            self._rotate()
+        self._active.write(line)
+
+    def _rotate(self) -> None:
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._active.close()
+        self._active_seq += 1
+        self._active = open(self._segment_path(self._active_seq), "ab")
+
+    def _load_cursor(self, directory: Optional[str] = None) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(directory or self.directory, "cursor.json")) as f:
+                cursor = json.load(f)
+            return cursor["segment"], cursor["offset"]
+        except (OSError, ValueError, KeyError):
+            segments = self._segments(directory)
+            return (segments[0] if segments else 0), 0
+
+    def _adopt_slots(self) -> None:
+        # Append what processes that used a slot left undelivered, once the
+        # slot is free again
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not name.startswith("slot-") or not os.path.isdir(path):
+                continue
+            lock_file = _try_lock(path)
+            if lock_file is None:
+                continue
+            try:
+                cursor_seq, cursor_offset = self._load_cursor(path)
+                for seq in self._segments(path):
+                    segment = self._segment_path(seq, path)
+                    if seq >= cursor_seq:
+                        with open(segment, "rb") as f:
+                            f.seek(cursor_offset if seq == cursor_seq else 0)
+                            lines = f.readlines()
+                        for line in lines:
+                            if not line.endswith(b"\n"):
+                                self._dead_letter(line, "torn")
+                                continue
+                            with self._lock:
+                                self._write(line)
+                                self._metrics["adopted"] += 1
+                        with self._lock:
+                            self._active.flush()
+                            os.fsync(self._active.fileno())
+                    os.remove(segment)
+                if os.path.exists(os.path.join(path, "cursor.json")):
+                    os.remove(os.path.join(path, "cursor.json"))
+            except OSError as e:
+                logging.error(f"Error adopting spool {path}: {e}")
+            finally:
+                lock_file.close()
+
+    def _save_cursor(self) -> None:
+        path = os.path.join(self.directory, "cursor.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+        os.replace(path + ".tmp", path)
+
+    def _supervise(self, loop: Callable[[], None]) -> None:
+        while True:
+            try:
+                loop()
+            except Exception as e:
+                logging.error(f"Spool {self.directory} thread failed, restarting: {e}")
+                with self._lock:
+                    self._metrics["restarts"] += 1
+                time.sleep(1.0)
+
+    def _dead_letter(self, line: bytes, reason: str) -> None:
+        record = {"failed": time.time(), "reason": reason}
+        record["line"] = line.decode("utf-8", "replace").rstrip("\n")
+        with open(os.path.join(self.directory, "dead-letter.log"), "ab") as f:
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def _sync_loop(self) -> None:
+        while True:
+            self._dirty.wait()
+            time.sleep(config.SPOOL_FSYNC_SECONDS)
+            self._dirty.clear()
+            with self._lock:
+                os.fsync(self._active.fileno())
+
+    def _next_record(self) -> Optional[Tuple[Dict[str, Any], int]]:
+        seq, offset = self._cursor
+        while True:
+            try:
+                with open(self._segment_path(seq), "rb") as f:
+                    f.seek(offset)
+                    line = f.readline()
+            except FileNotFoundError:
+                line = b""
+            if line.endswith(b"\n"):
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record, dict) or "payload" not in record:
+                        raise ValueError("not a spooled event")
+                    return record, offset + len(line)
+                except ValueError as e:
+                    logging.error(f"Corrupt line in spool {self.directory}: {e}")
+                    self._dead_letter(line, f"corrupt: {e}")
+                    with self._lock:
+                        self._metrics["corrupt"] += 1
+                    offset += len(line)
+                    self._cursor = (seq, offset)
+                    self._save_cursor()
+                    continue
+            with self._lock:
+                finished = seq < self._active_seq
+            if not finished:
+                return None
+            if line:
+                # Torn by a crash before its newline was written
+                self._dead_letter(line, "torn")
+                with self._lock:
+                    self._metrics["corrupt"] += 1
+            # Segment fully delivered: move on and drop it
+            try:
+                os.remove(self._segment_path(seq))
+            except FileNotFoundError:
+                pass
+            seq, offset = seq + 1, 0
+            self._cursor = (seq, offset)
+            self._save_cursor()
+
+    def _deliver_loop(self) -> None:
+        attempt = 0
+        while True:
+            record = self._next_record()
+            if record is None:
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+                continue
+
+            event, next_offset = record
+            try:
+                delivered = bool(self._deliver(event["payload"]))
+            except Exception as e:
+                logging.error(
+                    f"Error delivering spooled event {event.get('id')}: {e}"
+                )
+                delivered = False
+
+            if not delivered:
+                attempt += 1
+                if attempt < self.max_attempts:
+                    with self._lock:
+                        self._metrics["retries"] += 1
+                    time.sleep(random.uniform(0, min(30.0, 0.1 * 2**attempt)))
+                    continue
+                logging.error(
+                    f"Dead-lettering spooled event {event.get('id')} after "
+                    f"{attempt} attempts"
+                )
+                self._dead_letter(
+                    json.dumps(event, ensure_ascii=False).encode("utf-8"),
+                    "undeliverable",
+                )
+
+            with self._lock:
+                self._metrics["delivered" if delivered else "dead_lettered"] += 1
+            attempt = 0
+            self._cursor = (self._cursor[0], next_offset)
+            self._save_cursor()
+
+
+def _lock_directory(directory: str) -> Tuple[str, Any]:
+    # The lock lasts as long as the returned file stays open
+    slot = 0
+    while True:
+        path = directory if not slot else os.path.join(directory, f"slot-{slot}")
+        lock_file = _try_lock(path)
+        if lock_file is not None:
+            return path, lock_file
+        slot += 1
+
+
+def _try_lock(directory: str) -> Optional[Any]:
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, "spool.lock"), "ab")
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
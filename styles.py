@@ -8,12 +8,12 @@ def get_main_style() -> str:
     </style>
     """
 
-def get_sidebar_header_style(font_b64: str) -> str:
+def get_sidebar_header_style(font_src: str) -> str:
     return f"""
     <style>
     @font-face {{
         font-family: "KdamThmorPro";
-        src: url(data:font/ttf;base64,{font_b64}) format("truetype");
+        src: {font_src};
         font-weight: 400;
         font-style: normal;
     }}
@@ -29,12 +29,12 @@ def get_sidebar_header_style(font_b64: str) -> str:
     <div class="header_text">ℹ️ Nota importante</div>
     """
 
-def get_sidebar_content_style(inter_b64: str) -> str:
+def get_sidebar_content_style(inter_src: str) -> str:
     return f"""
     <style>
     @font-face {{
         font-family: "Inter";
-        src: url(data:font/ttf;base64,{inter_b64}) format("truetype");
+        src: {inter_src};
         font-weight: 400;
         font-style: normal;
     }}
@@ -96,12 +96,12 @@ def get_feedback_style() -> str:
     </style>
     """
 
-def get_beta_badge_style(abeeze_b64: str) -> str:
+def get_beta_badge_style(abeeze_src: str) -> str:
     return f"""
     <style>
     @font-face {{
         font-family: "Abeeze";
-        src: url(data:font/ttf;base64,{abeeze_b64}) format("truetype");
+        src: {abeeze_src};
         font-weight: 400;
         font-style: normal;
     }}
@@ -182,7 +182,12 @@ def get_chat_bubble_style() -> str:
     </div>
     """
 
-def get_background_style(bin_str: str) -> str:
+def get_mascot_image(mascot_attrs: str, width: int) -> str:
+    return f"""
+    <img {mascot_attrs} width="{width}" alt="Numy"/>
+    """
+
+def get_background_style(background_image: str) -> str:
     return """
     <style>
     .st-emotion-cache-6px8kg {
@@ -190,13 +195,13 @@ def get_background_style(bin_str: str) -> str:
             rgba(255, 255, 255, 0.90),
             rgba(255, 255, 255, 0.90)
         ),
-        url("data:image/png;base64,%s");;
+        %s;
     background-size: cover;
     background-repeat: no-repeat;
     background-attachment: fixed;
     }
     </style>
-    """ % bin_str
+    """ % background_image
 
 def get_chat_input_style() -> str:
     return """<style>
@@ -213,7 +218,7 @@ def get_chat_input_style() -> str:
     }
     </style>"""
 
-def get_fixed_logo_style(bin_header: str) -> str:
+def get_fixed_logo_style(header_src: str) -> str:
     return f"""
     <style>
     .fixed-logo {{
@@ -235,10 +240,10 @@ def get_fixed_logo_style(bin_header: str) -> str:
     }}
     </style>
     <div class="fixed-logo">
-        <img src="data:image/png;base64,{bin_header}" alt="INEI"/>
+        <img src="{header_src}" alt="INEI"/>
     </div>"""
 
-def get_footer_style(bin_inei: str, bin_footer: str) -> str:
+def get_footer_style(inei_attrs: str, footer_attrs: str) -> str:
     return f"""
     <style>
     .corner-badge{{
@@ -254,8 +259,8 @@ def get_footer_style(bin_inei: str, bin_footer: str) -> str:
     }}
     </style>
     <div class="corner-badge">
-      <img class="corner-badge-inei" src="data:image/png;base64,{bin_inei}" alt="INEI">
+      <img class="corner-badge-inei" {inei_attrs} alt="INEI">
       <span>Power by:</span>
-      <img class="corner-badge-labstat" src="data:image/png;base64,{bin_footer}" alt="LabStat">
+      <img class="corner-badge-labstat" {footer_attrs} alt="LabStat">
     </div>
     """
@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def test_slots_are_granted_in_arrival_order():
+    admission = AdmissionController(max_in_flight=1, max_queue=5, max_wait=5)
+    first = admission.acquire()
+    granted = []
+
+    def wait_turn(n):
+        ticket = admission.acquire()
+        granted.append(n)
+        return ticket
+
+    pool = ThreadPoolExecutor(3)
+    waiters = []
+    for n in range(3):
+        waiters.append(pool.submit(wait_turn, n))
+        while admission.metrics()["queue_depth"] < n + 1:
+            time.sleep(0.01)
+    admission.release(first)
+    for waiter in waiters:
+        admission.release(waiter.result(timeout=2))
+    assert granted == [0, 1, 2]
+    assert admission.metrics()["in_flight"] == 0
+
+
+def test_full_queue_sheds_at_once():
+    admission = AdmissionController(max_in_flight=1, max_queue=0, max_wait=5)
+    ticket = admission.acquire()
+    with pytest.raises(Overloaded):
+        admission.acquire()
+    admission.release(ticket)
+    assert admission.metrics()["shed_queue_full"] == 1
+
+
+def test_wait_is_bounded_and_cancellable():
+    admission = AdmissionController(max_in_flight=1, max_queue=5, max_wait=0.1)
+    ticket = admission.acquire()
+    with pytest.raises(Overloaded):
+        admission.acquire()
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(CancelledError):
+        admission.acquire(cancel)
+    admission.release(ticket)
+    metrics = admission.metrics()
+    assert metrics["shed_timeout"] == 1 and metrics["cancelled"] == 1
+    assert metrics["queue_depth"] == 0 and metrics["in_flight"] == 0
@@ -0,0 +1,58 @@
+import pytest
+
+from cache import AnswerCache, is_cacheable, normalize_query
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "¿Me puedes decir la población de Lima?",
+        "¿Cuál es mi fuente para la inflación de 2023?",
+        "Dame mis indicadores: PBI y desempleo de Arequipa",
+        "¿Cuál era la población antes de 2020?",
+        "¿Cuál es la población de Lima y de Callao?",
+        "También quiero la tasa de desempleo de Piura",
+        "¿Qué es el Compendio Estadístico?",
+        "Población de Yauyos",
+    ],
+)
+def test_standalone_questions_are_cacheable(query):
+    assert is_cacheable(query)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "¿Y en Cusco?",
+        "y para el año 2022",
+        "¿E Ica?",
+        "Pero en 2021, ¿cuánto fue?",
+        "¿Cuál fue el valor del año anterior?",
+        "Repite eso por favor",
+        "¿Y cuánto es en esa región?",
+        "Lo mismo para Puno",
+        "¿Qué dijiste sobre la inflación?",
+        "Explícalo otra vez",
+    ],
+)
+def test_back_references_are_not_cacheable(query):
+    assert not is_cacheable(query)
+
+
+def test_normalize_query_ignores_case_punctuation_and_spacing():
+    assert normalize_query("¿Población  de LIMA?") == "población de lima"
+
+
+def test_answer_cache_expires_and_evicts():
+    cache = AnswerCache(max_bytes=30, ttl_seconds=60)
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+    assert cache.get("a") == "x" * 10
+    cache.put("c", "z" * 15)
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+    expired = AnswerCache(ttl_seconds=0)
+    expired.put("a", "x")
+    assert expired.get("a") is None
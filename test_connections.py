@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import config
+import connections
+from benchmarks import agent_stub
+from connections import OptimizedAWSClient
+
+
+class Session:
+    """Fails if two clients are created at the same time."""
+
+    def __init__(self):
+        self.active = 0
+        self.overlaps = 0
+        self.lock = threading.Lock()
+
+    def client(self, service_name, **kwargs):
+        with self.lock:
+            self.active += 1
+            if self.active > 1:
+                self.overlaps += 1
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        return object()
+
+
+def test_clients_are_created_one_at_a_time(monkeypatch):
+    session = Session()
+    monkeypatch.setattr(connections, "get_session", lambda: session)
+    clients = [OptimizedAWSClient(f"function-{i}", "lambda") for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        created = list(pool.map(lambda client: client.client, clients))
+    assert len(set(map(id, created))) == 8
+    assert session.overlaps == 0
+
+
+@pytest.mark.parametrize(
+    "agent", ["/TSTALIASID", "AGENT12345/", "not an id/TSTALIASID"]
+)
+def test_malformed_bedrock_agent_fails_at_creation(agent):
+    with pytest.raises(ValueError, match="BEDROCK_AGENT"):
+        OptimizedAWSClient(agent, "agent")
+
+
+@pytest.fixture
+def agent_stub_client(monkeypatch):
+    server = agent_stub.serve(port=0, latency_median=0.01, latency_sigma=0.1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv(
+        "AWS_ENDPOINT_URL_BEDROCK_AGENT_RUNTIME",
+        f"http://127.0.0.1:{server.server_port}",
+    )
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(config, "SKIP_IDENTITY_LOOKUP", True)
+    monkeypatch.setattr(connections, "_session", None)
+    yield OptimizedAWSClient("AGENT12345/TSTALIASID", "agent")
+    server.shutdown()
+
+
+def test_invoke_agent_streams_the_answer(agent_stub_client):
+    payload = {"body": {"query": "¿Cuántos hogares hay?", "session_id": "s 1"}}
+    chunks = list(agent_stub_client.invoke_stream(payload))
+    assert len(chunks) > 1
+    assert "".join(chunks) == "Respuesta simulada a: ¿Cuántos hogares hay?"
+    response = agent_stub_client.invoke_sync(payload)
+    assert response["body"]["answer"] == "".join(chunks)
+    assert response["_metadata"]["request_id"].startswith("stub-")
@@ -0,0 +1,78 @@
+import os
+import time
+
+import history
+from history import ChatHistory, StoredConversation
+
+
+def messages(start, stop):
+    return [{"role": "user", "content": str(i)} for i in range(start, stop)]
+
+
+def contents(page):
+    return [int(message["content"]) for message in page]
+
+
+class Table:
+    """Serves exchanges of one session newest first, like query_session."""
+
+    def __init__(self, exchanges):
+        self.items = [
+            {"userMessage": f"q{i}", "response": f"a{i}"}
+            for i in reversed(range(exchanges))
+        ]
+
+    def query_session(self, session_id, limit, start_key):
+        start = start_key["offset"] if start_key else 0
+        end = start + limit
+        next_key = {"offset": end} if end < len(self.items) else None
+        return self.items[start:end], next_key
+
+
+def test_window_overflow_is_archived_in_pages(tmp_path):
+    chat = ChatHistory("s", directory=str(tmp_path), window=4, page_size=3)
+    for message in messages(0, 10):
+        chat.append(message)
+    # 10 messages: two pages archived, the last 4 in memory
+    assert chat.pages == 2
+    assert contents(chat) == [6, 7, 8, 9]
+    assert len(chat) == 10
+    assert contents(chat.load_page(0)) == [0, 1, 2]
+    assert contents(chat.earlier(1)) == [3, 4, 5]
+    assert contents(chat.earlier(5)) == list(range(6))
+    assert chat.has_earlier(1) and not chat.has_earlier(2)
+
+
+def test_clear_deletes_the_archive(tmp_path):
+    chat = ChatHistory("s", directory=str(tmp_path), window=2, page_size=2)
+    for message in messages(0, 6):
+        chat.append(message)
+    chat.clear()
+    assert len(chat) == 0
+    assert not os.path.exists(chat.directory)
+
+
+def test_resumed_session_pages_into_the_stored_conversation(tmp_path):
+    stored = StoredConversation(Table(5), "s", page_size=2)
+    chat = ChatHistory("s", directory=str(tmp_path), window=10, page_size=10)
+    assert chat.restore(stored)
+    assert [m["content"] for m in chat][::2] == ["q3", "q4"]
+    assert chat.has_earlier(0)
+    assert [m["content"] for m in chat.earlier(1)][::2] == ["q1", "q2"]
+    assert [m["content"] for m in chat.earlier(2)][::2] == ["q0", "q1", "q2"]
+    assert not chat.has_earlier(3)
+
+
+def test_prune_deletes_only_old_archives(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "_last_prune", 0.0)
+    old, recent = tmp_path / "old", tmp_path / "recent"
+    old.mkdir()
+    recent.mkdir()
+    long_ago = time.time() - 7200
+    os.utime(old, (long_ago, long_ago))
+    history.prune_archives(str(tmp_path), max_age=3600)
+    assert sorted(os.listdir(tmp_path)) == ["recent"]
+    # At most one pass per CHAT_ARCHIVE_PRUNE_SECONDS
+    os.utime(recent, (long_ago, long_ago))
+    history.prune_archives(str(tmp_path), max_age=3600)
+    assert os.listdir(tmp_path) == ["recent"]
@@ -0,0 +1,28 @@
+from metrics import ConcurrencyMetrics
+
+
+def test_sessions_count_until_they_are_no_longer_active():
+    metrics = ConcurrencyMetrics()
+    connected = {"a", "b", "c"}
+    is_active = connected.__contains__
+    metrics.gauge("active_sessions", lambda: metrics.active_sessions(is_active))
+    for session_id in ["a", "b", "c", "a"]:
+        metrics.track_session(session_id)
+    assert metrics.active_sessions(is_active) == 3
+    connected -= {"a", "b"}
+    assert metrics.flush()["active_sessions"] == 1
+    # A reconnecting session is counted again on its next run
+    connected.add("a")
+    metrics.track_session("a")
+    assert metrics.active_sessions(is_active) == 2
+
+
+def test_flush_reports_averages_and_maxima():
+    metrics = ConcurrencyMetrics()
+    metrics.observe("queue_wait_ms", 10)
+    metrics.observe("queue_wait_ms", 30)
+    aggregates = metrics.flush()
+    assert aggregates["queue_wait_ms"] == 20
+    assert aggregates["queue_wait_ms_max"] == 30
+    assert aggregates["rerun_ms"] == 0
+    assert metrics.flush()["queue_wait_ms"] == 0
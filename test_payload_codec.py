@@ -0,0 +1,65 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+import payload_codec
+from payload_codec import PayloadCodec
+
+ANSWER = {"answer": "| Departamento | Hogares |\n" + "| Lima | 2 900 000 |\n" * 200}
+
+
+def response(body, encoding=None, compress=None):
+    raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    envelope = {"statusCode": 200, "body": raw.decode("utf-8")}
+    if encoding:
+        envelope["body"] = base64.b64encode(compress(raw)).decode("ascii")
+        envelope["content_encoding"] = encoding
+    return json.dumps(envelope).encode("utf-8")
+
+
+def test_request_offers_the_configured_compression():
+    data = PayloadCodec("gzip").encode({"body": {"query": "¿Hogares?"}})
+    body = json.loads(data)["body"]
+    assert body == {"query": "¿Hogares?", "accept_encoding": "gzip"}
+    data = PayloadCodec("gzip").encode({"body": {}}, negotiate=False)
+    assert json.loads(data) == {"body": {}}
+
+
+def test_gzip_round_trip_and_metrics():
+    codec = PayloadCodec("gzip")
+    data = response(ANSWER, "gzip", gzip.compress)
+    result = codec.decode(data)
+    assert result["body"] == ANSWER
+    assert "content_encoding" not in result
+    metrics = codec.metrics()
+    assert metrics["compressed"] == 1
+    assert metrics["compressed_response_bytes"] == len(data)
+    assert metrics["compression_ratio"] > 5
+
+
+def test_uncompressed_and_non_json_bodies():
+    codec = PayloadCodec("none")
+    assert codec.decode(response(ANSWER))["body"] == ANSWER
+    data = json.dumps({"statusCode": 502, "body": "Bad Gateway"}).encode()
+    assert codec.decode(data)["body"] == "Bad Gateway"
+    assert codec.metrics()["compression_ratio"] == 0.0
+
+
+def test_zstd_round_trip():
+    zstandard = pytest.importorskip("zstandard")
+    codec = PayloadCodec("zstd")
+    assert codec.compression == "zstd"
+    data = response(ANSWER, "zstd", zstandard.ZstdCompressor().compress)
+    assert codec.decode(data)["body"] == ANSWER
+
+
+def test_zstd_falls_back_to_gzip_without_zstandard(monkeypatch):
+    monkeypatch.setattr(payload_codec, "_zstd", lambda: None)
+    codec = PayloadCodec("zstd")
+    assert codec.compression == "gzip"
+    data = codec.encode({"body": {"query": "¿Hogares?"}})
+    assert json.loads(data)["body"]["accept_encoding"] == "gzip"
+    with pytest.raises(ValueError, match="zstd"):
+        codec.decode(response(ANSWER, "zstd", lambda raw: raw))
@@ -0,0 +1,109 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import config
+from connections import OptimizedAWSClient
+from resilience import CircuitBreaker, CircuitOpen
+from similarity import NearDuplicateIndex
+
+
+def make_client(invoke_sync):
+    client = OptimizedAWSClient(
+        "function",
+        "lambda",
+        executor=ThreadPoolExecutor(max_workers=1),
+        idempotent=True,
+    )
+    client.invoke_sync = invoke_sync
+    client.breaker = CircuitBreaker(failure_rate=0.5, min_calls=2)
+    return client
+
+
+def test_breaker_opens_after_failures():
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=2, open_seconds=60)
+    breaker.record(True)
+    breaker.record(False)
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    assert breaker.metrics()["rejected"] == 1
+
+
+def test_half_open_probe_closes_the_breaker():
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=1, open_seconds=0.05)
+    breaker.record(False)
+    time.sleep(0.06)
+    breaker.check()
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    breaker.record(True)
+    breaker.check()
+
+
+def test_cancelled_calls_do_not_open_the_breaker():
+    release = threading.Event()
+    client = make_client(lambda payload: release.wait(2) and {"StatusCode": 200})
+    running = client.invoke_hedged({})
+    cancel = threading.Event()
+    cancel.set()
+    for _ in range(5):
+        # Queued behind the running call, so cancelled before being issued
+        client.invoke_hedged({}, cancel).cancel()
+        client.invoke_hedged({}, cancel)
+    release.set()
+    assert running.result(timeout=2) == {"StatusCode": 200}
+    client._executor.shutdown(wait=True)
+    client.breaker.check()
+    assert client.breaker.metrics()["opened"] == 0
+
+
+def test_failed_calls_open_the_breaker():
+    client = make_client(lambda payload: {"statusCode": 503})
+    for _ in range(2):
+        client.invoke_hedged({}).result(timeout=2)
+    with pytest.raises(CircuitOpen):
+        client.breaker.check()
+
+
+@pytest.mark.parametrize("idempotent", [True, False])
+def test_only_idempotent_calls_are_hedged(monkeypatch, idempotent):
+    monkeypatch.setattr(config, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY_SECONDS", 0.05)
+    calls = []
+
+    def invoke_sync(payload):
+        calls.append(payload)
+        time.sleep(0.3)
+        return {"StatusCode": 200}
+
+    client = OptimizedAWSClient(
+        "function",
+        "lambda",
+        executor=ThreadPoolExecutor(max_workers=2),
+        idempotent=idempotent,
+    )
+    client.invoke_sync = invoke_sync
+    for _ in range(config.HEDGE_MIN_SAMPLES):
+        client.latency.record(0.01)
+    assert client.invoke_hedged({}).result(timeout=2) == {"StatusCode": 200}
+    assert len(calls) == (2 if idempotent else 1)
+
+
+def test_stale_lookup_keeps_the_similarity_threshold():
+    index = NearDuplicateIndex(path=None, ttl_seconds=60)
+    index.add(
+        "¿Cuál es la población de Lima?",
+        "Lima tiene 10 millones de habitantes.",
+        created=time.time() - 3600,
+    )
+    assert index.lookup("¿Cuál es la población de Lima?") is None
+    stale = index.lookup("¿cual es la poblacion de lima", include_expired=True)
+    assert stale is not None and stale.query == "¿Cuál es la población de Lima?"
+    for region in ("Callao", "Ica", "Loreto"):
+        question = f"¿Cuál es la población de {region}?"
+        assert index.lookup(question, include_expired=True) is None
+    assert config.STALE_ANSWER_NOTICE.format(
+        answered_at="01/01/2026 10:00", matched_query=stale.query
+    ).count(stale.query) == 1
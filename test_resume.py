@@ -0,0 +1,153 @@
+import json
+import threading
+from datetime import datetime
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import config
+import connections
+import similarity
+from benchmarks import fakes
+import cache
+from shared_cache import MemoryBackend
+
+APP = "app.py"
+
+
+class AgentLambda(fakes.FakeLambda):
+    """
+    Answers like getAgentResponse, which writes the exchanges it answers.
+    """
+
+    def __init__(self, table):
+        super().__init__(0.001, 0.01, 0.0)
+        self.table = table
+
+    def invoke(self, FunctionName, Payload, **kwargs):
+        self.write(Payload)
+        return super().invoke(FunctionName, Payload, **kwargs)
+
+    def invoke_with_response_stream(self, FunctionName, Payload, **kwargs):
+        self.write(Payload)
+        return super().invoke_with_response_stream(FunctionName, Payload, **kwargs)
+
+    def write(self, Payload):
+        if not config.AGENT_WRITES_HISTORY:
+            return
+        body = json.loads(Payload)["body"]
+        self.table.put_item(
+            Item={
+                "sessionId": body["session_id"],
+                "creationDate": datetime.now().isoformat(),
+                "userMessage": body["query"],
+                "response": self._answer(Payload),
+            }
+        )
+
+
+class Table(fakes.FakeDynamoDB):
+    """
+    conversationHistory, keyed by sessionId and creationDate.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rows = {}
+        self.rows_lock = threading.Lock()
+
+    def put_item(self, Item):
+        with self.rows_lock:
+            self.rows[(Item["sessionId"], Item["creationDate"])] = Item
+        return super().put_item(Item)
+
+    def query(self, **kwargs):
+        session_id = kwargs["ExpressionAttributeValues"][":s"]
+        with self.rows_lock:
+            rows = sorted(
+                (row for key, row in self.rows.items() if key[0] == session_id),
+                key=lambda row: row["creationDate"],
+                reverse=not kwargs["ScanIndexForward"],
+            )
+        start = 0
+        if "ExclusiveStartKey" in kwargs:
+            dates = [row["creationDate"] for row in rows]
+            start = dates.index(kwargs["ExclusiveStartKey"]["creationDate"]) + 1
+        page = rows[start : start + kwargs["Limit"]]
+        result = {
+            "Items": [
+                {k: row[k] for k in ("creationDate", "userMessage", "response")}
+                for row in page
+            ]
+        }
+        if start + kwargs["Limit"] < len(rows):
+            result["LastEvaluatedKey"] = {
+                "sessionId": session_id,
+                "creationDate": page[-1]["creationDate"],
+            }
+        return result
+
+
+@pytest.fixture(
+    params=[(True, False), (False, False), (True, True), (False, True)],
+    ids=["agent-writes", "app-writes", "agent-writes-stream", "app-writes-stream"],
+)
+def table(request, monkeypatch, tmp_path):
+    agent_writes, streaming = request.param
+    for name, value in {
+        "SKIP_IDENTITY_LOOKUP": True,
+        "METRICS_PORT": 0,
+        "METRICS_EMF_ENABLED": False,
+        "WRITE_BEHIND_ENABLED": False,
+        "AGENT_WRITES_HISTORY": agent_writes,
+        "STREAMING_RESPONSES": streaming,
+        "CHAT_ARCHIVE_DIR": str(tmp_path / "archive"),
+        "SPOOL_DIR": str(tmp_path / "spool"),
+    }.items():
+        monkeypatch.setattr(config, name, value)
+    monkeypatch.setattr(
+        similarity, "near_duplicates", similarity.NearDuplicateIndex(path=None)
+    )
+    monkeypatch.setattr(
+        cache, "answer_cache", cache.SharedAnswerCache(MemoryBackend())
+    )
+    monkeypatch.setattr(
+        connections.OptimizedAWSClient,
+        "_create_client",
+        connections.OptimizedAWSClient._create_client,
+    )
+    table = Table()
+    fakes.install(AgentLambda(table), table)
+    # The app's clients are cached resources: recreate them with the fakes
+    st.cache_resource.clear()
+    return table
+
+
+def messages(app):
+    return [message.markdown[0].value for message in app.chat_message]
+
+
+def test_resumed_session_shows_every_exchange(table):
+    app = AppTest.from_file(APP, default_timeout=30).run()
+    questions = [
+        "¿Cuál es la población de Ica en 2020?",
+        "¿Cuál es la población de Ica en 2020?",
+        "población de Ica 2020 por favor",
+        "hola",
+    ]
+    for question in questions:
+        app.chat_input[0].set_value(question).run()
+        assert not app.exception
+    shown = messages(app)
+    assert len(shown) == 2 * len(questions)
+
+    session_id = app.session_state.session_id
+    assert len([key for key in table.rows if key[0] == session_id]) == 4
+
+    resumed = AppTest.from_file(APP, default_timeout=30)
+    resumed.query_params[config.CHAT_RESUME_QUERY_PARAM] = session_id
+    resumed.run()
+    assert not resumed.exception
+    assert resumed.session_state.session_id == session_id
+    assert messages(resumed) == shown
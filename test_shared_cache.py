@@ -0,0 +1,146 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+from benchmarks import redis_stub
+from cache import SharedAnswerCache
+from shared_cache import (
+    CacheBackend,
+    MemoryBackend,
+    RedisBackend,
+    RedisError,
+    SQLiteBackend,
+)
+
+
+@pytest.fixture(scope="module")
+def redis_url():
+    server = redis_stub.serve(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(max_bytes=1000)
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "cache.db"), max_bytes=1000)
+    redis_stub._data.clear()
+    return RedisBackend(request.getfixturevalue("redis_url"))
+
+
+def test_cache_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_get_set_delete(backend):
+    assert backend.get("k") is None
+    backend.set("k", "valor ñ")
+    assert backend.get("k") == "valor ñ"
+    backend.delete("k")
+    assert backend.get("k") is None
+
+
+def test_entries_expire(backend):
+    backend.set("k", "v", ttl=0.05)
+    assert backend.get("k") == "v"
+    time.sleep(0.1)
+    assert backend.get("k") is None
+    assert backend.add("k", "w")
+
+
+def test_add_only_when_absent(backend):
+    assert backend.add("k", "first", ttl=10)
+    assert not backend.add("k", "second", ttl=10)
+    assert backend.get("k") == "first"
+
+
+def test_counters(backend):
+    assert backend.counter("c") == 0
+    assert backend.incr("c") == 1
+    assert backend.incr("c", 5) == 6
+    assert backend.counter("c") == 6
+
+
+def test_json_round_trip(backend):
+    backend.set_json("k", {"answer": "sí", "n": [1, 2]})
+    assert backend.get_json("k") == {"answer": "sí", "n": [1, 2]}
+
+
+@pytest.mark.parametrize("backend_class", [MemoryBackend, SQLiteBackend])
+def test_least_recently_used_entries_are_evicted(backend_class, tmp_path):
+    if backend_class is MemoryBackend:
+        backend = MemoryBackend(max_bytes=25)
+    else:
+        backend = SQLiteBackend(str(tmp_path / "cache.db"), max_bytes=25)
+    backend.set("a", "x" * 9)
+    time.sleep(0.01)
+    backend.set("b", "x" * 9)
+    time.sleep(0.01)
+    backend.get("a")
+    backend.set("c", "x" * 9)
+    assert backend.get("a") is not None
+    assert backend.get("b") is None
+    assert backend.get("c") is not None
+
+
+class MalformedHandler(socketserver.StreamRequestHandler):
+    connections = 0
+
+    def handle(self):
+        MalformedHandler.connections += 1
+        while self.rfile.readline():
+            self.wfile.write(b":not-a-number\r\n")
+
+
+def test_malformed_reply_raises_redis_error_and_closes_the_connection():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), MalformedHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        backend = RedisBackend(f"redis://127.0.0.1:{server.server_address[1]}")
+        for _ in range(2):
+            with pytest.raises(RedisError):
+                backend.incr("c")
+        assert backend._pool.empty()
+        assert MalformedHandler.connections == 2
+        cache = SharedAnswerCache(backend, prefix="t:")
+        assert cache.get("question") is None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_error_reply_keeps_the_connection(redis_url):
+    backend = RedisBackend(redis_url)
+    with pytest.raises(RedisError):
+        backend.execute("FLUSHALL")
+    assert backend._pool.qsize() == 1
+    assert backend.execute("PING") == b"PONG"
+
+
+def test_shared_cache_claim_and_wait(redis_url):
+    redis_stub._data.clear()
+    first = SharedAnswerCache(RedisBackend(redis_url), prefix="t:")
+    second = SharedAnswerCache(RedisBackend(redis_url), prefix="t:")
+    assert first.claim("q", ttl=5)
+    assert not second.claim("q", ttl=5)
+    threading.Timer(0.1, first.put, ("q", "respuesta")).start()
+    assert second.wait("q", timeout=2) == "respuesta"
+    first.release("q")
+    assert second.claim("q", ttl=5)
+    assert second.get("q") == "respuesta"
+    assert first.stats()["shared_flights"] == 1
+
+
+def test_shared_cache_wait_ends_when_the_claim_is_released(tmp_path):
+    cache = SharedAnswerCache(SQLiteBackend(str(tmp_path / "cache.db")))
+    assert cache.claim("q", ttl=5)
+    threading.Timer(0.1, cache.release, ("q",)).start()
+    assert cache.wait("q", timeout=2) is None
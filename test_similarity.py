@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from similarity import NearDuplicateIndex, is_near_duplicate, normalize_spanish
+
+
+@pytest.fixture
+def index():
+    index = NearDuplicateIndex(path=None)
+    index.add(
+        "¿Cuántos hogares pobres hay en Lima Metropolitana en 2022?", "pobres"
+    )
+    index.add("desempleo juvenil en Lima 2023", "desempleo")
+    index.add("hogares pobres", "hogares")
+    index.add(
+        "¿Cuál fue la tasa de desempleo de los jóvenes de 18 a 24 años en las "
+        "zonas urbanas de la región Lima en el año 2023?",
+        "largo",
+    )
+    return index
+
+
+def test_normalize_folds_accents_numbers_and_stopwords():
+    assert normalize_spanish("Hola, ¿cuál es la POBLACIÓN de Perú en 1.500?") == {
+        "poblacion",
+        "peru",
+        "1500",
+    }
+    assert normalize_spanish("inflación de 2,5") == {"inflacion", "2.5"}
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "Hola, ¿cuántos hogares pobres hay en Lima metropolitana en 2022?",
+        "hogares pobres lima metropolitana 2022 por favor",
+        "Desempleo juvenil en lima, 2023",
+    ],
+)
+def test_rephrasings_match(index, query):
+    assert index.lookup(query) is not None
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "¿Cuántos hogares no pobres hay en Lima Metropolitana en 2022?",
+        "¿Cuántos hogares sin pobreza hay en Lima Metropolitana en 2022?",
+        "desempleo juvenil de mujeres en Lima 2023",
+        "desempleo juvenil rural Lima 2023",
+        "desempleo en Lima 2023",
+        "hogares pobres extremos",
+        "hogares pobres en Lima Metropolitana en 2021",
+        "desempleo juvenil en Callao 2023",
+    ],
+)
+def test_different_statistics_do_not_match(index, query):
+    assert index.lookup(query) is None
+    assert index.lookup(query, include_expired=True) is None
+
+
+def test_long_questions_tolerate_rewording_but_not_qualifiers(index):
+    reworded = (
+        "¿Cuál fue la tasa de desempleo de los jóvenes de 18 a 24 años en las "
+        "zonas urbanas del departamento de Lima en el año 2023?"
+    )
+    match = index.lookup(reworded, threshold=0.8)
+    assert match is not None and match.answer == "largo"
+    assert index.lookup(reworded) is None
+    long_question = normalize_spanish(reworded)
+    for extra in ["rural", "no", "2024"]:
+        qualified = long_question | {extra}
+        assert not is_near_duplicate(qualified, long_question, 0.5)
+        assert not is_near_duplicate(long_question, qualified, 0.5)
+    negated = (long_question - {"departamento"}) | {"sin"}
+    assert not is_near_duplicate(negated, long_question, 0.5)
+
+
+def test_expired_answers_only_match_when_asked(index):
+    index.ttl_seconds = 60
+    index.add("poblacion de Ica", "ica", created=time.time() - 3600)
+    assert index.lookup("población de Ica") is None
+    assert index.lookup("población de Ica", include_expired=True).answer == "ica"
+
+
+def test_index_persists(tmp_path):
+    path = str(tmp_path / "index.jsonl.gz")
+    index = NearDuplicateIndex(path=path)
+    index.add("población de Ica", "ica")
+    index.save()
+    assert NearDuplicateIndex(path=path).lookup("poblacion de ica").answer == "ica"
@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+import pytest
+
+from admission import AdmissionController
+from connections import OptimizedAWSClient
+from resilience import CircuitBreaker, CircuitOpen
+from single_flight import SingleFlight
+
+
+def make_client(invoke_sync, max_in_flight=1):
+    client = OptimizedAWSClient(
+        "function", "lambda", executor=ThreadPoolExecutor(max_workers=8)
+    )
+    client.invoke_sync = invoke_sync
+    client.admission = AdmissionController(max_in_flight=max_in_flight, max_wait=5)
+    return client
+
+
+def test_join_coalesces_calls():
+    flight = SingleFlight()
+    inner = Future()
+    calls = []
+    first = flight.join("k", lambda: calls.append(1) or inner)
+    second = flight.join("k", lambda: calls.append(2) or Future())
+    assert first is second and calls == [1]
+    inner.set_result("answer")
+    assert second.result(timeout=1) == "answer"
+    assert not flight.in_flight("k")
+
+
+def test_join_over_the_waiter_limit_starts_its_own_call():
+    flight = SingleFlight(max_waiters=1)
+    shared = flight.join("k", Future)
+    own = Future()
+    assert flight.join("k", lambda: own) is own
+    assert flight.metrics()["overflow"] == 1
+    flight.leave("k", shared)
+
+
+def test_start_failure_reaches_callers_already_attached():
+    flight = SingleFlight()
+    entered, proceed = threading.Event(), threading.Event()
+
+    def start():
+        entered.set()
+        proceed.wait(1)
+        raise CancelledError()
+
+    leader = ThreadPoolExecutor(1).submit(flight.join, "k", start)
+    entered.wait(1)
+    follower = flight.join("k", Future)
+    proceed.set()
+    with pytest.raises(CancelledError):
+        leader.result(timeout=1)
+    with pytest.raises(CancelledError):
+        follower.result(timeout=1)
+    assert not flight.in_flight("k")
+
+
+def test_last_leave_cancels_the_call():
+    flight = SingleFlight()
+    inner = Future()
+    shared = flight.join("k", lambda: inner)
+    flight.join("k", Future)
+    flight.leave("k", shared)
+    assert not inner.cancelled()
+    flight.leave("k", shared)
+    assert inner.cancelled()
+
+
+def test_slot_is_held_until_an_abandoned_call_finishes():
+    release = threading.Event()
+    client = make_client(lambda payload: release.wait(2) and {"StatusCode": 200})
+    with pytest.raises(TimeoutError):
+        client.invoke_admitted({}, timeout=0.1)
+    assert client.admission.metrics()["in_flight"] == 1
+    with pytest.raises(CancelledError):
+        client.invoke_coalesced("k", {}, cancel_event=_set_event())
+    assert client.admission.metrics()["in_flight"] == 1
+    release.set()
+    client._executor.shutdown(wait=True)
+    assert client.admission.metrics()["in_flight"] == 0
+
+
+def test_overflow_calls_go_through_breaker_and_admission():
+    release = threading.Event()
+    client = make_client(
+        lambda payload: release.wait(2) and {"StatusCode": 200}, max_in_flight=2
+    )
+    client.single_flight = SingleFlight(max_waiters=1)
+    pool = ThreadPoolExecutor(2)
+    first = pool.submit(client.invoke_coalesced, "k", {}, 2)
+    _wait_until(lambda: client.admission.metrics()["in_flight"] == 1)
+    second = pool.submit(client.invoke_coalesced, "k", {}, 2)
+    _wait_until(lambda: client.admission.metrics()["in_flight"] == 2)
+    client.breaker = CircuitBreaker(min_calls=1)
+    client.breaker.record(False)
+    with pytest.raises(CircuitOpen):
+        client.invoke_coalesced("k", {})
+    release.set()
+    assert first.result(timeout=2) == second.result(timeout=2) == {"StatusCode": 200}
+    assert client.single_flight.metrics()["overflow"] == 2
+
+
+def test_followers_start_over_when_the_leader_gives_up_queued():
+    release = threading.Event()
+    client = make_client(lambda payload: release.wait(2) and {"StatusCode": 200})
+    blocker = ThreadPoolExecutor(1).submit(client.invoke_admitted, {"other": 1}, 2)
+    _wait_until(lambda: client.admission.metrics()["in_flight"] == 1)
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(2)
+    leader = pool.submit(client.invoke_coalesced, "k", {}, 2, cancel)
+    _wait_until(lambda: client.admission.metrics()["queue_depth"] == 1)
+    follower = pool.submit(client.invoke_coalesced, "k", {}, 2)
+    _wait_until(lambda: client.single_flight.metrics()["coalesced"] == 1)
+    cancel.set()
+    with pytest.raises(CancelledError):
+        leader.result(timeout=2)
+    release.set()
+    assert follower.result(timeout=3) == {"StatusCode": 200}
+    assert blocker.result(timeout=2) == {"StatusCode": 200}
+
+
+def _set_event():
+    event = threading.Event()
+    event.set()
+    return event
+
+
+def _wait_until(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+
+from spool import EventSpool
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def dead_letters(directory):
+    path = os.path.join(directory, "dead-letter.log")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_delivers_in_order(tmp_path):
+    delivered = []
+    spool = EventSpool(str(tmp_path), lambda p: delivered.append(p["n"]) or True)
+    for n in range(20):
+        assert spool.append({"n": n}, session_id="s")
+    wait_until(lambda: len(delivered) == 20)
+    assert delivered == list(range(20))
+
+
+def test_corrupt_and_torn_lines_are_dead_lettered(tmp_path):
+    lines = [
+        json.dumps({"id": "1", "payload": {"n": 1}}) + "\n",
+        "{not json\n",
+        json.dumps({"id": "2", "payload": {"n": 2}}) + "\n",
+        '{"id": "3", "pay',
+    ]
+    with open(tmp_path / "segment-000000000000.log", "w") as f:
+        f.writelines(lines)
+    delivered = []
+    spool = EventSpool(str(tmp_path), lambda p: delivered.append(p["n"]) or True)
+    spool.append({"n": 4})
+    wait_until(lambda: len(delivered) == 3)
+    assert delivered == [1, 2, 4]
+    reasons = [d["reason"] for d in dead_letters(tmp_path)]
+    assert reasons[0].startswith("corrupt") and reasons[1:] == ["torn"]
+    assert spool.metrics()["corrupt"] == 2
+
+
+def test_reopening_starts_a_new_segment(tmp_path):
+    with open(tmp_path / "segment-000000000003.log", "w") as f:
+        f.write('{"id": "torn", "payl')
+    delivered = []
+    spool = EventSpool(str(tmp_path), lambda p: delivered.append(p["n"]) or True)
+    spool.append({"n": 1})
+    wait_until(lambda: delivered == [1])
+    # The new event was not glued to the torn tail
+    assert spool._active_seq == 4
+    assert [d["reason"] for d in dead_letters(tmp_path)] == ["torn"]
+
+
+def test_undeliverable_event_does_not_block_later_ones(tmp_path):
+    delivered = []
+
+    def deliver(payload):
+        if payload["n"] == 0:
+            raise RuntimeError("rejected")
+        delivered.append(payload["n"])
+        return True
+
+    spool = EventSpool(str(tmp_path), deliver, max_attempts=2)
+    spool.append({"n": 0})
+    spool.append({"n": 1})
+    wait_until(lambda: delivered == [1])
+    assert spool.metrics()["dead_lettered"] == 1
+    assert json.loads(dead_letters(tmp_path)[0]["line"])["payload"] == {"n": 0}
+
+
+def test_deliverer_thread_is_restarted(tmp_path, monkeypatch):
+    delivered = []
+    spool = EventSpool(str(tmp_path), lambda p: delivered.append(p["n"]) or True)
+    next_record = spool._next_record
+    failed = threading.Event()
+
+    def failing_next_record():
+        if not failed.is_set():
+            failed.set()
+            raise OSError("disk hiccup")
+        return next_record()
+
+    monkeypatch.setattr(spool, "_next_record", failing_next_record)
+    spool.append({"n": 1})
+    wait_until(lambda: delivered == [1])
+    assert spool.metrics()["restarts"] == 1
+
+
+def test_second_writer_gets_its_own_slot(tmp_path):
+    delivered = []
+    first = EventSpool(str(tmp_path), lambda p: delivered.append(p["n"]) or True)
+    second = EventSpool(str(tmp_path), lambda p: delivered.append(p["n"]) or True)
+    assert first.directory == str(tmp_path)
+    assert second.directory == str(tmp_path / "slot-1")
+    for n in range(10):
+        (first if n % 2 else second).append({"n": n})
+    wait_until(lambda: len(delivered) == 10)
+    assert sorted(delivered) == list(range(10))
+
+
+def test_undelivered_events_of_a_free_slot_are_adopted(tmp_path):
+    slot = tmp_path / "slot-1"
+    slot.mkdir()
+    lines = [json.dumps({"id": str(n), "payload": {"n": n}}) + "\n" for n in range(3)]
+    with open(slot / "segment-000000000000.log", "w") as f:
+        f.writelines(lines)
+    with open(slot / "cursor.json", "w") as f:
+        json.dump({"segment": 0, "offset": len(lines[0])}, f)
+    delivered = []
+    spool = EventSpool(str(tmp_path), lambda p: delivered.append(p["n"]) or True)
+    spool.append({"n": 3})
+    wait_until(lambda: len(delivered) == 3)
+    assert delivered == [1, 2, 3]
+    assert spool.metrics()["adopted"] == 2
+    assert sorted(os.listdir(slot)) == ["spool.lock"]
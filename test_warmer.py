@@ -0,0 +1,57 @@
+import time
+from types import SimpleNamespace
+
+import config
+from metrics import StageMetrics
+from warmer import LambdaWarmer
+
+
+class Lambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(time.monotonic())
+
+
+def make_warmer(monkeypatch, interval, idle):
+    monkeypatch.setattr(config, "WARMER_INTERVAL_SECONDS", interval)
+    monkeypatch.setattr(config, "WARMER_IDLE_SECONDS", idle)
+    function = Lambda()
+    warmer = LambdaWarmer(SimpleNamespace(client=function), "function")
+    return warmer, function
+
+
+def test_first_warmup_is_sent_at_the_idle_threshold(monkeypatch):
+    # An interval shorter than the threshold used to delay it to two intervals
+    warmer, function = make_warmer(monkeypatch, interval=0.8, idle=1.0)
+    start = time.monotonic()
+    warmer.start()
+    time.sleep(1.5)
+    warmer.stop()
+    assert len(function.invocations) == 1
+    assert function.invocations[0] - start < 1.3
+
+
+def test_traffic_postpones_the_warmup(monkeypatch):
+    warmer, function = make_warmer(monkeypatch, interval=10, idle=0.4)
+    warmer.start()
+    time.sleep(0.3)
+    warmer.begin()
+    warmer.end(0.1, cold_start=False)
+    time.sleep(0.3)
+    assert function.invocations == []
+    assert warmer.metrics()["warmups_skipped"] == 1
+    time.sleep(0.3)
+    warmer.stop()
+    assert len(function.invocations) == 1
+
+
+def test_metrics_are_exported(monkeypatch):
+    warmer, _ = make_warmer(monkeypatch, interval=10, idle=10)
+    warmer.begin()
+    warmer.end(2.0, cold_start=True)
+    stage_metrics = StageMetrics()
+    stage_metrics.source("warmer", warmer.metrics)
+    assert stage_metrics.read_sources()["warmer_cold_seconds_avg"] == 2.0
+    assert "chat_warmer_cold_invocations 1.0" in stage_metrics.prometheus_text()
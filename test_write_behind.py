@@ -0,0 +1,149 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+
+from write_behind import WriteBehindBuffer
+
+
+class ClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class DynamoDB:
+    def __init__(self, reject=(), unprocessed_once=(), throttle_once=False):
+        self.calls = []
+        self.written = []
+        self.reject = set(reject)
+        self.unprocessed_once = set(unprocessed_once)
+        self.throttle_once = throttle_once
+        self.lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        ((table, requests),) = RequestItems.items()
+        ids = [request["PutRequest"]["Item"]["id"] for request in requests]
+        with self.lock:
+            self.calls.append(ids)
+            if self.throttle_once:
+                self.throttle_once = False
+                raise ClientError("ProvisionedThroughputExceededException")
+            if self.reject & set(ids):
+                raise ClientError("ValidationException")
+            unprocessed = [
+                request
+                for request, i in zip(requests, ids)
+                if i in self.unprocessed_once
+            ]
+            self.written += [i for i in ids if i not in self.unprocessed_once]
+            self.unprocessed_once -= set(ids)
+        return {"UnprocessedItems": {table: unprocessed} if unprocessed else {}}
+
+
+def make_buffer(tmp_path, dynamodb, **kwargs):
+    return WriteBehindBuffer(
+        dynamodb,
+        "conversationHistory",
+        flush_interval=0.05,
+        dead_letter_path=str(tmp_path / "dead-letter.log"),
+        **kwargs,
+    )
+
+
+def dead_letters(tmp_path):
+    path = tmp_path / "dead-letter.log"
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_items_are_written_in_batches_of_at_most_25(tmp_path):
+    dynamodb = DynamoDB()
+    buffer = make_buffer(tmp_path, dynamodb)
+    for i in range(60):
+        buffer.put({"id": i})
+    buffer.close()
+    assert sorted(dynamodb.written) == list(range(60))
+    assert max(len(call) for call in dynamodb.calls) == 25
+    metrics = buffer.metrics()
+    assert metrics["written"] == 60
+    assert metrics["queue_depth"] == 0
+    assert metrics["flushes"] == len(dynamodb.calls)
+
+
+def test_a_rejected_item_does_not_take_its_batch_down(tmp_path):
+    dynamodb = DynamoDB(reject={7})
+    buffer = make_buffer(tmp_path, dynamodb)
+    for i in range(25):
+        buffer.put({"id": i})
+    buffer.close()
+    assert sorted(dynamodb.written) == [i for i in range(25) if i != 7]
+    assert [record["item"] for record in dead_letters(tmp_path)] == [{"id": 7}]
+    metrics = buffer.metrics()
+    assert metrics["dead_lettered"] == 1
+    assert metrics["retries"] == 0
+
+
+def test_only_unprocessed_items_are_retried(tmp_path):
+    dynamodb = DynamoDB(unprocessed_once={3, 4})
+    buffer = make_buffer(tmp_path, dynamodb)
+    for i in range(10):
+        buffer.put({"id": i})
+    buffer.close()
+    assert dynamodb.calls[-1] == [3, 4]
+    assert sorted(dynamodb.written) == list(range(10))
+    assert buffer.metrics()["retries"] == 1
+
+
+def test_throttled_batch_is_retried_whole(tmp_path):
+    dynamodb = DynamoDB(throttle_once=True)
+    buffer = make_buffer(tmp_path, dynamodb)
+    for i in range(5):
+        buffer.put({"id": i})
+    buffer.close()
+    assert dynamodb.calls == [[0, 1, 2, 3, 4]] * 2
+    assert dead_letters(tmp_path) == []
+
+
+def test_items_still_unprocessed_after_the_retries_are_dead_lettered(tmp_path):
+    dynamodb = DynamoDB()
+    dynamodb.batch_write_item = lambda RequestItems: {"UnprocessedItems": RequestItems}
+    buffer = make_buffer(tmp_path, dynamodb, max_retries=1)
+    buffer.put({"id": 1})
+    buffer.close()
+    assert [record["item"] for record in dead_letters(tmp_path)] == [{"id": 1}]
+
+
+def test_queue_is_drained_at_exit(tmp_path):
+    written = tmp_path / "written.json"
+    script = textwrap.dedent(
+        f"""
+        import json, time
+        from write_behind import WriteBehindBuffer
+
+        class DynamoDB:
+            items = []
+
+            def batch_write_item(self, RequestItems):
+                time.sleep(0.05)
+                for requests in RequestItems.values():
+                    self.items += [r["PutRequest"]["Item"]["id"] for r in requests]
+                with open({str(written)!r}, "w") as f:
+                    json.dump(self.items, f)
+                return {{}}
+
+        buffer = WriteBehindBuffer(DynamoDB(), "table", flush_interval=5)
+        for i in range(30):
+            buffer.put({{"id": i}})
+        """
+    )
+    subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+        timeout=30,
+    )
+    assert sorted(json.loads(written.read_text())) == list(range(30))
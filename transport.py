@@ -0,0 +1,353 @@
+import base64
+import gzip
+import hashlib
+import io
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, List
+
+import config
+from payload_codec import decompress
+
+_append_lock = threading.Lock()
+
+# Response fields kept in a recording when the invocation returned them
+_OPTIONAL_FIELDS = (
+    ("ExecutedVersion", "executed_version"),
+    ("FunctionError", "function_error"),
+    ("LogResult", "log_result"),
+)
+
+
+def request_key(function_name: str, payload: Any) -> str:
+    """
+    Identify an invocation independently of the session it was made in.
+
+    Args:
+        function_name (str): Name of the Lambda function.
+        payload (Any): The invocation payload, as bytes, str or dict.
+
+    Returns:
+        str: Hash of the function name and the payload without session_id.
+    """
+    if isinstance(payload, (bytes, str)):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            payload = {"raw": payload if isinstance(payload, str) else payload.hex()}
+    if isinstance(payload, dict) and isinstance(payload.get("body"), dict):
+        payload = {**payload, "body": dict(payload["body"])}
+        payload["body"].pop("session_id", None)
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{function_name}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Gzipped JSON lines file of recorded invocations.
+
+    Every record is appended as its own gzip member, so a recording that is
+    interrupted keeps every invocation written so far.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the Cassette.
+
+        Args:
+            path (str): File the recordings are stored in.
+        """
+        self.path = path
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """
+        Append one recorded invocation.
+
+        Args:
+            record (Dict[str, Any]): The recorded invocation.
+        """
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with _append_lock:
+            with open(self.path, "ab") as f:
+                f.write(gzip.compress(line))
+
+    def load(self) -> List[Dict[str, Any]]:
+        """
+        Read every recorded invocation.
+
+        Returns:
+            List[Dict[str, Any]]: The records in recording order.
+        """
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class RecordingTransport:
+    """
+    Wraps a boto3 Lambda client and records its invocations to a cassette:
+    request, response and measured latency. Streamed responses are recorded
+    chunk by chunk with the time each chunk arrived.
+    """
+
+    def __init__(self, client: Any, cassette: Cassette):
+        """
+        Initialize the RecordingTransport.
+
+        Args:
+            client (Any): The boto3 Lambda client.
+            cassette (Cassette): Where invocations are recorded.
+        """
+        self._client = client
+        self._cassette = cassette
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def invoke(self, **kwargs: Any) -> Dict[str, Any]:
+        record = self._record("invoke", kwargs)
+        start = time.perf_counter()
+        try:
+            response = self._client.invoke(**kwargs)
+        except Exception as e:
+            record.update(latency=time.perf_counter() - start, error=repr(e))
+            self._cassette.append(record)
+            raise
+        body = response["Payload"].read() if "Payload" in response else b""
+        record.update(
+            latency=time.perf_counter() - start,
+            status_code=response.get("StatusCode"),
+            response=body.decode("utf-8"),
+        )
+        for name, field in _OPTIONAL_FIELDS:
+            if response.get(name) is not None:
+                record[field] = response[name]
+        self._cassette.append(record)
+        if "Payload" in response:
+            response["Payload"] = io.BytesIO(body)
+        return response
+
+    def invoke_with_response_stream(self, **kwargs: Any) -> Dict[str, Any]:
+        record = self._record("stream", kwargs)
+        start = time.perf_counter()
+        try:
+            response = self._client.invoke_with_response_stream(**kwargs)
+        except Exception as e:
+            record.update(latency=time.perf_counter() - start, error=repr(e))
+            self._cassette.append(record)
+            raise
+        record["latency"] = time.perf_counter() - start
+        record["events"] = []
+        response["EventStream"] = _RecordingStream(
+            response["EventStream"], record, start, self._cassette
+        )
+        return response
+
+    @staticmethod
+    def _record(kind: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        payload = kwargs.get("Payload", b"")
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8")
+        return {
+            "kind": kind,
+            "function": kwargs["FunctionName"],
+            "invocation_type": kwargs.get("InvocationType", "RequestResponse"),
+            "key": request_key(kwargs["FunctionName"], payload),
+            "request": payload,
+            "recorded_at": time.time(),
+        }
+
+
+class _RecordingStream:
+    def __init__(
+        self, stream: Any, record: Dict[str, Any], start: float, cassette: Cassette
+    ):
+        self._stream = stream
+        self._record = record
+        self._start = start
+        self._cassette = cassette
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        try:
+            for event in self._stream:
+                offset = time.perf_counter() - self._start
+                if "PayloadChunk" in event:
+                    chunk = event["PayloadChunk"]["Payload"]
+                    self._record["events"].append(
+                        {"offset": offset, "chunk": chunk.decode("utf-8", "replace")}
+                    )
+                elif "InvokeComplete" in event:
+                    self._record["events"].append(
+                        {"offset": offset, "complete": event["InvokeComplete"]}
+                    )
+                yield event
+        finally:
+            self._record["duration"] = time.perf_counter() - self._start
+            self._cassette.append(self._record)
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+class ReplayTransport:
+    """
+    Stands in for a boto3 Lambda client by replaying a cassette, offline.
+
+    An invocation is answered with a recording of the same request (ignoring
+    the session ID), rotating through them when there are several, and with
+    the next recording of the function otherwise. Latency is replayed as
+    recorded multiplied by time_scale (1 for the original timing, 0 for
+    instant replies), then by a log-normal factor of sigma fuzz_sigma.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        time_scale: float = config.REPLAY_TIME_SCALE,
+        fuzz_sigma: float = config.REPLAY_FUZZ_SIGMA,
+    ):
+        """
+        Initialize the ReplayTransport and load the cassette.
+
+        Args:
+            cassette (Cassette): The recorded invocations.
+            time_scale (float): Multiplier of the recorded latencies.
+            fuzz_sigma (float): Sigma of the synthetic latency noise; 0 replays
+                latencies exactly.
+
+        Raises:
+            ValueError: If the cassette holds no recordings.
+        """
+        self.time_scale = time_scale
+        self.fuzz_sigma = fuzz_sigma
+        self._lock = threading.Lock()
+        self._recordings: Dict[Any, Deque[Dict[str, Any]]] = defaultdict(deque)
+        records = cassette.load()
+        if not records:
+            raise ValueError(f"Cassette {cassette.path} is empty")
+        for record in records:
+            for index in (
+                (record["kind"], record["key"]),
+                record["key"],
+                (record["kind"], record["function"]),
+                record["function"],
+            ):
+                self._recordings[index].append(record)
+        self._metrics = {"exact": 0, "fallback": 0}
+
+    def invoke(self, **kwargs: Any) -> Dict[str, Any]:
+        record = self._next(kwargs, "invoke")
+        self._sleep(record["latency"])
+        if record.get("error"):
+            raise RuntimeError(f"Replayed error: {record['error']}")
+        response = {
+            "StatusCode": record.get("status_code", 200),
+            "ResponseMetadata": {"RequestId": f"replay-{record['key'][:12]}"},
+        }
+        if record["kind"] == "invoke":
+            body = record.get("response", "")
+        else:
+            # A streamed recording replayed as a synchronous answer
+            answer = "".join(e["chunk"] for e in record["events"] if "chunk" in e)
+            body = json.dumps(
+                {"statusCode": 200, "body": json.dumps({"answer": answer})}
+            )
+        if kwargs.get("InvocationType") != "Event":
+            response["Payload"] = io.BytesIO(body.encode("utf-8"))
+        for name, field in _OPTIONAL_FIELDS:
+            if field in record:
+                response[name] = record[field]
+        return response
+
+    def invoke_with_response_stream(self, **kwargs: Any) -> Dict[str, Any]:
+        record = self._next(kwargs, "stream")
+        self._sleep(record["latency"])
+        if record.get("error"):
+            raise RuntimeError(f"Replayed error: {record['error']}")
+        if "events" in record:
+            events = record["events"]
+        else:
+            # A synchronous recording replayed as a single chunk
+            events = [{"offset": record["latency"], "chunk": self._answer(record)}]
+        return {"EventStream": _ReplayStream(self, events, record["latency"])}
+
+    def get_function_configuration(self, **kwargs: Any) -> Dict[str, Any]:
+        return {}
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Return how many invocations matched a recording of the same request.
+
+        Returns:
+            Dict[str, int]: Exact and fallback replays.
+        """
+        with self._lock:
+            return dict(self._metrics)
+
+    def _next(self, kwargs: Dict[str, Any], kind: str) -> Dict[str, Any]:
+        function_name = kwargs["FunctionName"]
+        key = request_key(function_name, kwargs.get("Payload", b""))
+        # Same request and kind first, then same request, then the function
+        with self._lock:
+            for i, index in enumerate(
+                ((kind, key), key, (kind, function_name), function_name)
+            ):
+                queue = self._recordings.get(index)
+                if queue:
+                    break
+            else:
+                raise RuntimeError(f"No recordings of {function_name}")
+            self._metrics["exact" if i < 2 else "fallback"] += 1
+            record = queue[0]
+            queue.rotate(-1)
+        return record
+
+    def _sleep(self, seconds: float) -> None:
+        seconds *= self.time_scale
+        if self.fuzz_sigma:
+            seconds *= random.lognormvariate(0, self.fuzz_sigma)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    @staticmethod
+    def _answer(record: Dict[str, Any]) -> str:
+        try:
+            response = json.loads(record["response"])
+            body = response["body"]
+            if response.get("content_encoding"):
+                body = decompress(base64.b64decode(body), response["content_encoding"])
+            return json.loads(body)["answer"]
+        except (KeyError, TypeError, ValueError):
+            logging.warning("Recorded response has no answer to stream")
+            return record.get("response", "")
+
+
+class _ReplayStream:
+    def __init__(
+        self, transport: ReplayTransport, events: List[Dict[str, Any]], start: float
+    ):
+        self._transport = transport
+        self._events = events
+        self._start = start
+        self._closed = False
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        previous = self._start
+        for event in self._events:
+            if self._closed:
+                return
+            self._transport._sleep(max(0.0, event["offset"] - previous))
+            previous = event["offset"]
+            if "chunk" in event:
+                yield {"PayloadChunk": {"Payload": event["chunk"].encode("utf-8")}}
+            else:
+                yield {"InvokeComplete": event.get("complete", {})}
+        if not self._events or "chunk" in self._events[-1]:
+            yield {"InvokeComplete": {}}
+
+    def close(self) -> None:
+        self._closed = True
+
@@ -1,15 +1,142 @@
-from base64 import b64encode
+import os
+from typing import Callable, Iterable, Optional
+
+import config
+from cache import asset_cache
+
+FONT_FORMATS = {
+    ".ttf": "truetype",
+    ".otf": "opentype",
+    ".woff": "woff",
+    ".woff2": "woff2",
+}
 
 def get_base64(bin_file: str) -> str:
     """
     Reads a binary file and returns its base64 encoded string.
 
+    The result is served from the process-wide asset cache and is only
+    re-encoded when the file content changes.
+
     Args:
         bin_file (str): Path to the binary file.
 
     Returns:
         str: Base64 encoded string of the file content.
     """
-    with open(bin_file, "rb") as f:
-        data = f.read()
-    return b64encode(data).decode()
\ No newline at end of file
+    return asset_cache.get_base64(bin_file)
+
+def get_manifest_entry(asset_path: str) -> dict:
+    """
+    Look up the static manifest entry of an asset.
+
+    Args:
+        asset_path (str): Path to the asset under config.ASSETS_DIR.
+
+    Returns:
+        dict: The manifest entry, or an empty dict if the asset was not built.
+    """
+    rel_path = os.path.relpath(asset_path, config.ASSETS_DIR).replace(os.sep, "/")
+    return config.ASSET_MANIFEST.get(rel_path, {})
+
+def get_asset_src(asset_path: str) -> str:
+    """
+    Returns the URL of an asset for use in HTML/CSS.
+
+    Built assets are served by Streamlit static serving under their
+    fingerprinted name. Assets missing from the manifest fall back to an
+    inline data URI.
+
+    Args:
+        asset_path (str): Path to the asset under config.ASSETS_DIR.
+
+    Returns:
+        str: A static URL or a data URI.
+    """
+    entry = get_manifest_entry(asset_path)
+    if entry:
+        return f"{config.STATIC_URL}/{entry['file']}"
+    ext = os.path.splitext(asset_path)[1].lower()
+    mime = "image/png" if ext == ".png" else f"font/{ext.lstrip('.')}"
+    return f"data:{mime};base64,{get_base64(asset_path)}"
+
+def get_img_attrs(img_path: str) -> str:
+    """
+    Returns the src and srcset attributes of an <img> tag for an image.
+
+    Args:
+        img_path (str): Path to the image under config.ASSETS_DIR.
+
+    Returns:
+        str: The attributes, including a 2x candidate when one was built.
+    """
+    attrs = f'src="{get_asset_src(img_path)}"'
+    entry = get_manifest_entry(img_path)
+    if "file_2x" in entry:
+        attrs += (
+            f' srcset="{config.STATIC_URL}/{entry["file"]} 1x,'
+            f' {config.STATIC_URL}/{entry["file_2x"]} 2x"'
+        )
+    return attrs
+
+def get_css_image(img_path: str) -> str:
+    """
+    Returns a CSS <image> value for an image.
+
+    Args:
+        img_path (str): Path to the image under config.ASSETS_DIR.
+
+    Returns:
+        str: A url() value, or an image-set() when a 2x version was built.
+    """
+    entry = get_manifest_entry(img_path)
+    if "file_2x" in entry:
+        return (
+            f'image-set(url("{config.STATIC_URL}/{entry["file"]}") 1x,'
+            f' url("{config.STATIC_URL}/{entry["file_2x"]}") 2x)'
+        )
+    return f'url("{get_asset_src(img_path)}")'
+
+def get_font_src(font_path: str) -> str:
+    """
+    Returns the value of an @font-face src descriptor for a font.
+
+    Args:
+        font_path (str): Path to the font under config.ASSETS_DIR.
+
+    Returns:
+        str: The src descriptor, e.g. 'url(...) format("truetype")'.
+    """
+    entry = get_manifest_entry(font_path)
+    ext = os.path.splitext(entry.get("file", font_path))[1].lower()
+    font_format = FONT_FORMATS.get(ext, "truetype")
+    return f'url("{get_asset_src(font_path)}") format("{font_format}")'
+
+def render_block(
+    name: str,
+    render: Callable[..., str],
+    asset_paths: Iterable[str] = (),
+    resolve: Optional[Callable[[str], str]] = None,
+) -> str:
+    """
+    Renders a style/HTML block through the process-wide asset cache.
+
+    Args:
+        name (str): Name identifying the block.
+        render (Callable[..., str]): styles function that builds the block.
+        asset_paths (Iterable[str]): Assets passed to the renderer, in order.
+        resolve (Optional[Callable[[str], str]]): Maps each asset path to the
+            renderer argument. Defaults to an @font-face src descriptor for
+            fonts and a CSS image value otherwise.
+
+    Returns:
+        str: The rendered block.
+    """
+    return asset_cache.render(
+        name, render, asset_paths, resolve=resolve or _resolve_asset
+    )
+
+def _resolve_asset(asset_path: str) -> str:
+    if os.path.splitext(asset_path)[1].lower() in FONT_FORMATS:
+        return get_font_src(asset_path)
+    return get_css_image(asset_path)
\ No newline at end of file
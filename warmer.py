@@ -0,0 +1,162 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import config
+
+
+class LambdaWarmer:
+    """
+    Background keep-warm scheduler for a Lambda function.
+
+    While real traffic keeps instances warm, nothing is sent. The first
+    warm-up goes out as soon as the function has been idle for
+    config.WARMER_IDLE_SECONDS (checks are scheduled for the moment the
+    idle threshold is reached, not on a fixed grid), and then the warmer
+    sends config.WARMER_PAYLOAD every config.WARMER_INTERVAL_SECONDS, with
+    as many concurrent invocations as the recent peak of in-flight calls
+    (between WARMER_MIN_CONCURRENCY and WARMER_MAX_CONCURRENCY). After
+    WARMER_MAX_IDLE_SECONDS without any traffic, for instance at night, the
+    interval doubles on every send until traffic resumes.
+
+    Real invocations are recorded with their latency and whether they hit a
+    cold start, so warm and cold latency can be compared.
+    """
+
+    def __init__(self, client: Any, function_name: str):
+        """
+        Initialize the LambdaWarmer.
+
+        Args:
+            client (Any): OptimizedAWSClient of the function. Its boto3 client
+                is only created when the first warm-up is sent.
+            function_name (str): Name of the Lambda function.
+        """
+        self._client = client
+        self._function_name = function_name
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_traffic = time.monotonic()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._interval = config.WARMER_INTERVAL_SECONDS
+        self._metrics = {
+            "warmups_sent": 0,
+            "warmups_failed": 0,
+            "warmups_skipped": 0,
+            "warm_invocations": 0,
+            "warm_seconds_total": 0.0,
+            "cold_invocations": 0,
+            "cold_seconds_total": 0.0,
+        }
+
+    def start(self) -> None:
+        """
+        Start the scheduler thread.
+        """
+        self._thread = threading.Thread(
+            target=self._run, name=f"warmer-{self._function_name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the scheduler thread.
+        """
+        self._stopped.set()
+
+    def begin(self) -> None:
+        """
+        Record the start of a real invocation.
+        """
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            self._last_traffic = time.monotonic()
+
+    def end(self, seconds: float, cold_start: Optional[bool]) -> None:
+        """
+        Record the end of a real invocation.
+
+        Args:
+            seconds (float): Latency of the invocation.
+            cold_start (Optional[bool]): Whether the invocation paid a cold
+                start, or None if unknown (the call then only counts as
+                traffic).
+        """
+        with self._lock:
+            self._in_flight -= 1
+            self._last_traffic = time.monotonic()
+            self._interval = config.WARMER_INTERVAL_SECONDS
+            if cold_start is not None:
+                kind = "cold" if cold_start else "warm"
+                self._metrics[f"{kind}_invocations"] += 1
+                self._metrics[f"{kind}_seconds_total"] += seconds
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Return warm-up counters and the warm versus cold latency of real
+        invocations.
+
+        Returns:
+            Dict[str, float]: The warmer metrics.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["interval_seconds"] = self._interval
+        for kind in ("warm", "cold"):
+            count = metrics[f"{kind}_invocations"]
+            metrics[f"{kind}_seconds_avg"] = (
+                metrics[f"{kind}_seconds_total"] / count if count else 0.0
+            )
+        return metrics
+
+    def _run(self) -> None:
+        delay = config.WARMER_IDLE_SECONDS
+        while not self._stopped.wait(delay):
+            with self._lock:
+                idle = time.monotonic() - self._last_traffic
+                concurrency = min(
+                    config.WARMER_MAX_CONCURRENCY,
+                    max(config.WARMER_MIN_CONCURRENCY, self._peak_in_flight),
+                )
+                if idle < config.WARMER_IDLE_SECONDS:
+                    # Check again when the idle threshold would be reached
+                    self._metrics["warmups_skipped"] += 1
+                    delay = config.WARMER_IDLE_SECONDS - idle
+                    continue
+                if idle > config.WARMER_MAX_IDLE_SECONDS:
+                    self._interval = min(
+                        self._interval * 2, config.WARMER_MAX_INTERVAL_SECONDS
+                    )
+                delay = self._interval
+                # Let the peak decay so a past burst does not keep many
+                # instances warm forever
+                self._peak_in_flight = max(self._in_flight, self._peak_in_flight // 2)
+            self._send(concurrency)
+
+    def _send(self, concurrency: int) -> None:
+        payload = json.dumps(config.WARMER_PAYLOAD).encode("utf-8")
+
+        def invoke(_: int) -> bool:
+            try:
+                self._client.client.invoke(
+                    FunctionName=self._function_name,
+                    InvocationType="RequestResponse",
+                    Payload=payload,
+                )
+                return True
+            except Exception as e:
+                logging.warning(f"Warm-up of {self._function_name} failed: {e}")
+                return False
+
+        # Concurrent invocations land on distinct instances
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(invoke, range(concurrency)))
+        with self._lock:
+            self._metrics["warmups_sent"] += results.count(True)
+            self._metrics["warmups_failed"] += results.count(False)
@@ -0,0 +1,231 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import config
+from metrics import stage_metrics
+
+# Errors for which DynamoDB rejected the call as a whole, not its items
+_RETRYABLE_ERRORS = frozenset(
+    [
+        "InternalServerError",
+        "ProvisionedThroughputExceededException",
+        "RequestLimitExceeded",
+        "ServiceUnavailable",
+        "ThrottlingException",
+    ]
+)
+
+
+class WriteBehindBuffer:
+    """
+    Background write-behind queue for a DynamoDB table.
+
+    Items are queued without blocking the caller and written by a daemon
+    thread with BatchWriteItem, up to 25 items per call. A batch is flushed
+    when it is full or when its oldest item has waited flush_interval
+    seconds. Only the UnprocessedItems of a call are retried, with
+    exponential backoff, and the queue is drained when the process exits.
+
+    A call that fails outright is retried as is when DynamoDB was throttling
+    or unavailable. Any other failure, such as a ValidationException caused
+    by one malformed item, splits the batch in halves that are written
+    separately, so the bad item ends up alone and only it is given up on.
+    Items given up on are appended to a dead-letter file as JSON lines.
+    """
+
+    MAX_BATCH_SIZE = 25
+
+    def __init__(
+        self,
+        client: Any,
+        table_name: str,
+        flush_interval: float = config.WRITE_BEHIND_FLUSH_SECONDS,
+        max_queue: int = config.WRITE_BEHIND_MAX_QUEUE,
+        max_retries: int = config.WRITE_BEHIND_MAX_RETRIES,
+        dead_letter_path: str = config.WRITE_BEHIND_DEAD_LETTER_PATH,
+    ):
+        """
+        Initialize the WriteBehindBuffer and start its writer thread.
+
+        Args:
+            client (Any): DynamoDB client accepting high-level item types,
+                such as the meta.client of a boto3 Table resource.
+            table_name (str): Name of the DynamoDB table.
+            flush_interval (float): Maximum seconds an item waits in a batch.
+            max_queue (int): Maximum queued items. When full, put() writes
+                synchronously instead of dropping the item.
+            max_retries (int): Retries of unprocessed items before giving up.
+            dead_letter_path (str): File the items given up on are appended
+                to.
+        """
+        self._client = client
+        self._table_name = table_name
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._metrics = {
+            "written": 0,
+            "dead_lettered": 0,
+            "retries": 0,
+            "splits": 0,
+            "overflow_writes": 0,
+            "flushes": 0,
+            "flush_seconds_total": 0.0,
+            "flush_seconds_max": 0.0,
+        }
+        self._thread = threading.Thread(
+            target=self._run, name=f"write-behind-{table_name}", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, item: Dict[str, Any]) -> None:
+        """
+        Queue an item for writing.
+
+        Args:
+            item (Dict[str, Any]): The item to write to the DynamoDB table.
+        """
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._metrics["overflow_writes"] += 1
+            self._write([item])
+
+    def close(self, timeout: float = config.WRITE_BEHIND_DRAIN_SECONDS) -> None:
+        """
+        Stop the writer thread after draining the queue.
+
+        Args:
+            timeout (float): Maximum seconds to wait for the drain.
+        """
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Return queue depth, write and dead-letter counters and flush
+        latency.
+
+        Returns:
+            Dict[str, float]: The buffer metrics.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["queue_depth"] = self._queue.qsize()
+        metrics["flush_seconds_avg"] = (
+            metrics["flush_seconds_total"] / metrics["flushes"]
+            if metrics["flushes"]
+            else 0.0
+        )
+        return metrics
+
+    def _run(self) -> None:
+        while not (self._stopped.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.MAX_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0 and not self._stopped.is_set():
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, items: List[Dict[str, Any]]) -> None:
+        start = time.monotonic()
+        self._write_requests([{"PutRequest": {"Item": item}} for item in items])
+        elapsed = time.monotonic() - start
+        stage_metrics.observe("dynamodb_write", elapsed)
+        with self._lock:
+            self._metrics["flushes"] += 1
+            self._metrics["flush_seconds_total"] += elapsed
+            self._metrics["flush_seconds_max"] = max(
+                self._metrics["flush_seconds_max"], elapsed
+            )
+
+    def _write_requests(self, requests: List[Dict[str, Any]]) -> None:
+        attempt = 0
+        while requests:
+            try:
+                response = self._client.batch_write_item(
+                    RequestItems={self._table_name: requests}
+                )
+                unprocessed = response.get("UnprocessedItems", {}).get(
+                    self._table_name, []
+                )
+            except Exception as e:
+                code = _error_code(e)
+                if code not in _RETRYABLE_ERRORS:
+                    if len(requests) > 1:
+                        middle = len(requests) // 2
+                        with self._lock:
+                            self._metrics["splits"] += 1
+                        self._write_requests(requests[:middle])
+                        self._write_requests(requests[middle:])
+                        return
+                    if code is not None:
+                        # Rejected by DynamoDB: retrying will not help
+                        self._dead_letter(requests, str(e))
+                        return
+                logging.error(f"Error writing batch to DynamoDB: {e}")
+                unprocessed = requests
+            with self._lock:
+                self._metrics["written"] += len(requests) - len(unprocessed)
+            requests = unprocessed
+            if not requests:
+                break
+            if attempt >= self.max_retries:
+                self._dead_letter(requests, f"unprocessed after {attempt} retries")
+                break
+            attempt += 1
+            with self._lock:
+                self._metrics["retries"] += 1
+            time.sleep(random.uniform(0, min(5.0, 0.05 * 2**attempt)))
+
+    def _dead_letter(self, requests: List[Dict[str, Any]], reason: str) -> None:
+        logging.error(
+            f"Dead-lettering {len(requests)} items for {self._table_name}: {reason}"
+        )
+        with self._lock:
+            self._metrics["dead_lettered"] += len(requests)
+        try:
+            directory = os.path.dirname(self.dead_letter_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for request in requests:
+                    record = {
+                        "failed": time.time(),
+                        "table": self._table_name,
+                        "reason": reason,
+                        "item": request["PutRequest"]["Item"],
+                    }
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logging.error(f"Error writing {self.dead_letter_path}: {e}")
+
+
+def _error_code(e: Exception) -> Optional[str]:
+    # Error code of a botocore ClientError, None for any other exception
+    response = getattr(e, "response", None)
+    if not isinstance(response, dict):
+        return None
+    return response.get("Error", {}).get("Code")